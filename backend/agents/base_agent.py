@@ -1,27 +1,35 @@
 from typing import Dict, Any, List, Optional, AsyncIterator
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from utils.env_loader import load_backend_env, get_groq_api_key
+import asyncio
 import os
+import time
 import uuid
-import hashlib
-from datetime import datetime, timedelta
-from functools import lru_cache
+from datetime import datetime
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import chat_trace
 from utils.logger import logger
+from utils.single_flight import llm_flight, prompt_key
 
 load_backend_env()
 
 class BaseAgent:
     """Base class for all specialized agents"""
+
+    # Stateless calls (no conversation_id) of agents that opt in are served from
+    # utils.response_cache; chat turns never are.
+    cache_responses = False
     
     def __init__(self, name: str, role: str, system_prompt: str):
         self.name = name
         self.role = role
         self.system_prompt = system_prompt
         
-        # Initialize LLM - Priority: Groq (free) > OpenAI > Ollama (local dev)
+        # Initialize LLM - Priority: mock (offline testing) > Groq (free) > OpenAI > Ollama (local dev)
+        from utils.mock_llm import create_mock_llm, mock_enabled
+
         groq_api_key = get_groq_api_key()
         openai_api_key = (os.getenv("OPENAI_API_KEY") or "").strip() or None
         use_ollama = os.getenv("USE_OLLAMA", "false").lower() == "true"
@@ -33,7 +41,11 @@ class BaseAgent:
             use_ollama,
         )
         
-        if groq_api_key:
+        if mock_enabled():
+            self.llm = create_mock_llm()
+            self.model_name = self.llm.model
+            logger.info("Using mock LLM: %s", self.model_name)
+        elif groq_api_key:
             from langchain_groq import ChatGroq
 
             # FREE Cloud: Use Groq (recommended for production)
@@ -48,6 +60,7 @@ class BaseAgent:
                 max_retries=3,  # Allow 3 retries for reliability
                 request_timeout=60  # Match timeout
             )
+            self.model_name = model
             logger.info("Using Groq model: %s", model)
         elif openai_api_key:
             # Paid: Use OpenAI if key provided
@@ -57,6 +70,7 @@ class BaseAgent:
                 temperature=0.7,
                 api_key=openai_api_key
             )
+            self.model_name = "gpt-4-turbo-preview"
             logger.info("Using OpenAI")
         elif use_ollama:
             from langchain_ollama import ChatOllama
@@ -68,6 +82,7 @@ class BaseAgent:
                 temperature=0.7,
                 base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
             )
+            self.model_name = model
             logger.info("Using Ollama model: %s", model)
         else:
             # Fallback error
@@ -77,22 +92,6 @@ class BaseAgent:
             )
         
         self.conversation_history: Dict[str, List[Any]] = {}
-        self.response_cache: Dict[str, tuple] = {}  # Cache for responses (hash: (response, timestamp))
-    
-    def _get_cache_key(self, message: str, context: List[Dict[str, Any]] = None) -> str:
-        """Generate cache key for a message"""
-        context_str = str(context) if context else ""
-        cache_input = f"{self.name}:{message}:{context_str}"
-        return hashlib.md5(cache_input.encode()).hexdigest()
-    
-    def _get_cached_response(self, cache_key: str, max_age_minutes: int = 10) -> Optional[str]:
-        """Get cached response if available and not expired"""
-        if cache_key in self.response_cache:
-            response, timestamp = self.response_cache[cache_key]
-            age = datetime.now() - timestamp
-            if age < timedelta(minutes=max_age_minutes):
-                return response
-        return None
     
     def _resolve_llm(self, model: Optional[str] = None):
         if model:
@@ -107,71 +106,66 @@ class BaseAgent:
         context: List[Dict[str, Any]] = None,
         conversation_id: Optional[str] = None,
         model: Optional[str] = None,
+        use_cache: bool = True,
     ) -> Dict[str, Any]:
-        """Process a message and return a response"""
-        
-        # Track if this is a new conversation
-        is_new_conversation = conversation_id is None
+        """Process a message and return a response (``use_cache=False`` always calls the model)"""
         
+        from utils.response_cache import CACHE_ENABLED, response_cache
+
+        use_cache = use_cache and CACHE_ENABLED and self.cache_responses and conversation_id is None
         if conversation_id is None:
             conversation_id = str(uuid.uuid4())
-        
-        # Check cache only for new conversations (not ongoing chats)
-        # Disable cache temporarily to ensure Groq API is being called
-        # cache_key = self._get_cache_key(message, context)
-        # cached_response = self._get_cached_response(cache_key)
-        # if cached_response and is_new_conversation:
-        #     print(f"[CACHE HIT] Returning cached response for: {message[:50]}...")
-        #     return {
-        #         "content": cached_response,
-        #         "conversation_id": conversation_id,
-        #         "agent": self.name,
-        #         "timestamp": datetime.now().isoformat(),
-        #         "cached": True
-        #     }
+
+        if use_cache:
+            cached = await response_cache.get(self.name, message, context, model or self.model_name)
+            if cached is not None:
+                logger.info("Response cache hit for: %s...", message[:50])
+                return {
+                    "content": cached,
+                    "conversation_id": conversation_id,
+                    "agent": self.name,
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "sources": context if context else [],
+                    "cached": True,
+                }
         
         logger.info("Calling LLM for: %s...", message[:50])
         
         from utils.conversation_memory import append_exchange, get_history
 
-        history = get_history(conversation_id)
-        
-        # Build messages
-        messages = [SystemMessage(content=self.system_prompt)]
-        
-        # Add context if available
-        if context:
-            context_text = self._format_context(context)
-            messages.append(SystemMessage(content=f"Relevant context:\n{context_text}"))
-        
-        # Add conversation history (reduced for speed)
-        for msg in history[-5:]:  # Last 5 messages only
-            messages.append(msg)
-        
-        # Add current message
-        messages.append(HumanMessage(content=message))
+        with chat_trace.span(chat_trace.PROMPT_BUILD):
+            history = await get_history(conversation_id)
+            
+            # Build messages
+            messages = [SystemMessage(content=self.system_prompt)]
+            
+            # Add context if available
+            if context:
+                context_text = self._format_context(context)
+                messages.append(SystemMessage(content=f"Relevant context:\n{context_text}"))
+            
+            # Add conversation history (summary + recent turns within the token budget)
+            messages.extend(self._select_history(history, model))
+            
+            # Add current message
+            messages.append(HumanMessage(content=message))
         
         llm = self._resolve_llm(model)
         try:
-            response = await llm.agenerate([messages])
-            ai_message = response.generations[0][0].text
+            # Identical prompts already in flight share one upstream call.
+            with chat_trace.span(chat_trace.GENERATION):
+                ai_message = await llm_flight.do(
+                    self._prompt_key(messages, model), lambda: self._generate(llm, messages)
+                )
             logger.info("LLM response received (%s chars)", len(ai_message))
         except Exception as groq_error:
             logger.error("LLM error: %s: %s", type(groq_error).__name__, groq_error)
             raise
         
-        # Cache disabled temporarily to verify Groq API calls
-        # cache_key = self._get_cache_key(message, context)
-        # self.response_cache[cache_key] = (ai_message, datetime.now())
-        
-        # Clean old cache entries (keep last 100)
-        if len(self.response_cache) > 100:
-            oldest_keys = sorted(self.response_cache.keys(), 
-                               key=lambda k: self.response_cache[k][1])[:50]
-            for old_key in oldest_keys:
-                del self.response_cache[old_key]
+        if use_cache:
+            await response_cache.put(self.name, message, context, model or self.model_name, ai_message)
         
-        append_exchange(conversation_id, message, ai_message)
+        await append_exchange(conversation_id, message, ai_message)
 
         return {
             "content": ai_message,
@@ -194,18 +188,43 @@ class BaseAgent:
         if conversation_id is None:
             conversation_id = str(uuid.uuid4())
 
-        messages = [SystemMessage(content=self.system_prompt)]
-        if context:
-            context_text = self._format_context(context)
-            messages.append(SystemMessage(content=f"Relevant context:\n{context_text}"))
+        with chat_trace.span(chat_trace.PROMPT_BUILD):
+            messages = [SystemMessage(content=self.system_prompt)]
+            if context:
+                context_text = self._format_context(context)
+                messages.append(SystemMessage(content=f"Relevant context:\n{context_text}"))
 
-        history = get_history(conversation_id)
-        for msg in history[-10:]:
-            messages.append(msg)
-        messages.append(HumanMessage(content=message))
+            history = await get_history(conversation_id)
+            messages.extend(self._select_history(history, model))
+            messages.append(HumanMessage(content=message))
 
         llm = self._resolve_llm(model)
-        full_response = ""
+        parts: list[str] = []
+        started = time.perf_counter()
+        stream = llm_flight.stream(self._prompt_key(messages, model), lambda: self._stream_text(llm, messages))
+        try:
+            async for part in stream:
+                if not parts:
+                    chat_trace.record(chat_trace.FIRST_TOKEN, (time.perf_counter() - started) * 1000)
+                parts.append(part)
+                yield part
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away: stop the model stream (the last subscriber leaving
+            # cancels it, see llm_flight) and keep the part of the answer it saw.
+            await stream.aclose()
+            if parts:
+                await append_exchange(conversation_id, message, "".join(parts))
+            raise
+        chat_trace.record(chat_trace.GENERATION, (time.perf_counter() - started) * 1000)
+
+        if parts:
+            await append_exchange(conversation_id, message, "".join(parts))
+
+    async def _generate(self, llm, messages: list) -> str:
+        response = await llm.agenerate([messages])
+        return response.generations[0][0].text
+
+    async def _stream_text(self, llm, messages: list) -> AsyncIterator[str]:
         async for chunk in llm.astream(messages):
             part = chunk.content if hasattr(chunk, "content") and chunk.content else ""
             if isinstance(part, list):
@@ -214,12 +233,19 @@ class BaseAgent:
                     for block in part
                 )
             if part:
-                full_response += part
                 yield part
 
-        if full_response:
-            append_exchange(conversation_id, message, full_response)
+    def _prompt_key(self, messages: list, model: Optional[str] = None) -> str:
+        """Single-flight key: the model and the exact prompt sent to it."""
+        return prompt_key(model or self.model_name, (f"{m.type}\x1f{m.content}" for m in messages))
     
+    def _select_history(self, history: list, model: Optional[str] = None) -> list:
+        """Rolling summary (if any) plus the newest turns within the model's history token budget."""
+        from utils.conversation_memory import to_messages, window
+        from utils.token_budget import history_budget
+
+        return to_messages(window(history, history_budget(model or self.model_name)))
+
     def _format_context(self, context: List[Dict[str, Any]]) -> str:
         """Format context documents for inclusion in prompt"""
         formatted = []
@@ -229,10 +255,10 @@ class BaseAgent:
             formatted.append(f"[Source {i}: {source}]\n{content}")
         return "\n\n".join(formatted)
     
-    def clear_history(self, conversation_id: str):
+    async def clear_history(self, conversation_id: str):
         """Clear conversation history for a given ID"""
         from utils.conversation_memory import clear
 
-        clear(conversation_id)
+        await clear(conversation_id)
         if conversation_id in self.conversation_history:
             del self.conversation_history[conversation_id]
@@ -1,9 +1,12 @@
 from .base_agent import BaseAgent
+from utils.single_flight import coalesce
 from typing import Dict, Any, List
 import re
 
 class CodeAgent(BaseAgent):
     """Specialized agent for code analysis, debugging, and development tasks"""
+
+    cache_responses = True
     
     def __init__(self):
         system_prompt = """You are an expert Code Agent specialized in software development and code analysis.
@@ -31,6 +34,7 @@ Be concise but thorough. Prioritize practical solutions."""
             system_prompt=system_prompt
         )
     
+    @coalesce
     async def analyze_code(self, code: str) -> Dict[str, Any]:
         """Analyze code snippet"""
         
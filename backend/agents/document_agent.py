@@ -1,8 +1,11 @@
 from .base_agent import BaseAgent
+from utils.single_flight import coalesce
 from typing import Dict, Any
 
 class DocumentAgent(BaseAgent):
     """Specialized agent for document processing and analysis"""
+
+    cache_responses = True
     
     def __init__(self):
         system_prompt = """You are an expert Document Agent specialized in document analysis and processing.
@@ -30,7 +33,8 @@ Be thorough but concise. Focus on extracting maximum value from documents."""
             system_prompt=system_prompt
         )
     
-    async def summarize(self, content: str, max_length: int = 200) -> str:
+    @coalesce
+    async def summarize(self, content: str, max_length: int = 200, use_cache: bool = True) -> str:
         """Summarize document content"""
         
         prompt = f"""Summarize the following document in approximately {max_length} words:
@@ -39,7 +43,7 @@ Be thorough but concise. Focus on extracting maximum value from documents."""
 
 Provide a clear, concise summary that captures the main points and key information."""
 
-        response = await self.process(prompt)
+        response = await self.process(prompt, use_cache=use_cache)
         return response["content"]
     
     async def extract_key_points(self, content: str) -> Dict[str, Any]:
@@ -3,6 +3,8 @@ from .base_agent import BaseAgent
 # General Agent
 class GeneralAgent(BaseAgent):
     """General-purpose conversational agent"""
+
+    cache_responses = True
     
     def __init__(self):
         system_prompt = """You are a helpful, knowledgeable AI assistant for the Universal AI Workspace.
@@ -5,7 +5,7 @@ import uuid
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,9 +13,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from auth.dependencies import get_current_active_user
 from db.database import Conversation, Message, User, get_db
 from utils import conversation_memory
+from utils.chat_service import (
+    decode_message_cursor,
+    encode_message_cursor,
+    load_message_tail,
+    load_messages_for_memory,
+)
+from utils.conversation_summary import reset_summary
+from utils.message_writer import message_writer
+from utils.search_index import KIND_CONVERSATION, KIND_MESSAGE, entry, index_queue
+from utils.suggestion_index import suggestion_index
 
 router = APIRouter(prefix="/api/conversations", tags=["conversations"])
 
+MESSAGE_PAGE_SIZE = 50
+
 
 class ConversationOut(BaseModel):
     id: str
@@ -29,6 +41,7 @@ class MessageOut(BaseModel):
     id: str
     role: str
     content: str
+    truncated: bool = False
     created_at: datetime
 
 
@@ -38,6 +51,8 @@ async def list_conversations(
     db: AsyncSession = Depends(get_db),
 ):
     uid = str(current_user.id)
+    # Pending messages bump updated_at, which orders this list.
+    await message_writer.sync()
     result = await db.execute(
         select(Conversation)
         .where(Conversation.user_id == uid)
@@ -78,41 +93,63 @@ async def create_conversation(
         )
     )
     await db.commit()
+    index_queue.upsert(entry(KIND_CONVERSATION, conv_id, user_id=uid, title="New chat", ts=now))
     return {"id": conv_id, "title": "New chat"}
 
 
 @router.get("/{conversation_id}/messages")
 async def get_conversation_messages(
     conversation_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    before: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
+    """Messages oldest first. With ``limit`` (or ``before``) returns only the newest page
+    and a ``next_cursor`` for the page before it; without, the whole thread."""
     uid = str(current_user.id)
     conv_result = await db.execute(
-        select(Conversation).where(
+        select(Conversation.id).where(
             Conversation.id == conversation_id,
             Conversation.user_id == uid,
         )
     )
-    if not conv_result.scalar_one_or_none():
+    if conv_result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
-    )
-    messages = result.scalars().all()
+    await message_writer.sync(conversation_id)
+    columns = (Message.id, Message.role, Message.content, Message.truncated, Message.created_at)
+    next_cursor = None
+    if limit is None and before is None:
+        result = await db.execute(
+            select(*columns)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+        )
+        messages = result.all()
+    else:
+        try:
+            keyset = decode_message_cursor(before) if before else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page_size = limit or MESSAGE_PAGE_SIZE
+        # One extra row tells whether an older page exists.
+        messages = await load_message_tail(db, conversation_id, columns, limit=page_size + 1, before=keyset)
+        if len(messages) > page_size:
+            messages = messages[1:]
+            next_cursor = encode_message_cursor(messages[0].created_at, messages[0].id)
     return {
         "messages": [
             {
                 "id": m.id,
                 "role": m.role,
                 "content": m.content,
+                "truncated": bool(m.truncated),
                 "created_at": m.created_at.isoformat() if m.created_at else None,
             }
             for m in messages
-        ]
+        ],
+        "next_cursor": next_cursor,
     }
 
 
@@ -137,9 +174,14 @@ async def rename_conversation(
     conv = result.scalar_one_or_none()
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    old_title = conv.title
     conv.title = title[:120]
     conv.updated_at = datetime.utcnow()
     await db.commit()
+    suggestion_index.replace(uid, old_title, conv.title)
+    index_queue.upsert(
+        entry(KIND_CONVERSATION, conversation_id, user_id=uid, title=conv.title, ts=conv.updated_at)
+    )
     return {"id": conversation_id, "title": conv.title}
 
 
@@ -158,9 +200,11 @@ async def truncate_from_message(
             Conversation.user_id == uid,
         )
     )
-    if not conv_result.scalar_one_or_none():
+    conv = conv_result.scalar_one_or_none()
+    if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
+    await message_writer.sync(conversation_id)
     msg_result = await db.execute(
         select(Message).where(
             Message.id == message_id,
@@ -170,6 +214,7 @@ async def truncate_from_message(
     target = msg_result.scalar_one_or_none()
     if not target:
         raise HTTPException(status_code=404, detail="Message not found")
+    await reset_summary(db, conv, target.created_at)
 
     all_result = await db.execute(
         select(Message)
@@ -187,13 +232,13 @@ async def truncate_from_message(
     for m in to_delete:
         await db.delete(m)
     await db.commit()
-
-    from utils.chat_service import load_messages_for_memory
+    for m in to_delete:
+        index_queue.delete(KIND_MESSAGE, m.id)
 
     pairs = await load_messages_for_memory(db, conversation_id)
-    conversation_memory.hydrate(conversation_id, pairs)
+    await conversation_memory.hydrate(conversation_id, pairs)
 
-    return {"deleted": len(to_delete), "remaining": len(pairs)}
+    return {"deleted": len(to_delete), "remaining": len(all_msgs) - len(to_delete)}
 
 
 @router.delete("/{conversation_id}")
@@ -213,6 +258,8 @@ async def delete_conversation(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
+    # Otherwise a later flush would re-insert this thread's pending messages.
+    await message_writer.sync(conversation_id)
     msg_result = await db.execute(
         select(Message).where(Message.conversation_id == conversation_id)
     )
@@ -220,5 +267,8 @@ async def delete_conversation(
         await db.delete(msg)
     await db.delete(conv)
     await db.commit()
-    conversation_memory.clear(conversation_id)
+    index_queue.delete(KIND_CONVERSATION, conversation_id)
+    index_queue.delete_children(conversation_id)
+    suggestion_index.remove(uid, conv.title)
+    await conversation_memory.clear(conversation_id)
     return {"status": "deleted"}
@@ -0,0 +1,87 @@
+"""Runtime metrics for background subsystems."""
+from fastapi import APIRouter, Depends
+
+from auth.dependencies import get_current_active_user
+from db.database import User
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("/search-index")
+async def search_index_metrics(current_user: User = Depends(get_current_active_user)):
+    """Write-behind queue depth and index lag (seconds since the oldest unflushed update)."""
+    from utils.search_index import index_queue
+
+    return index_queue.stats()
+
+
+@router.get("/suggestions")
+async def suggestion_index_metrics(current_user: User = Depends(get_current_active_user)):
+    """Loaded users and term counts in the autocomplete prefix index."""
+    from utils.suggestion_index import suggestion_index
+
+    return suggestion_index.stats()
+
+
+@router.get("/vector-index")
+async def vector_index_metrics(current_user: User = Depends(get_current_active_user)):
+    """Embedding backlog, throughput and loaded per-user vector matrices."""
+    from utils.vector_index import vector_index
+
+    return vector_index.stats()
+
+
+@router.get("/message-writer")
+async def message_writer_metrics(current_user: User = Depends(get_current_active_user)):
+    """Unsaved chat messages (queue depth and lag) and batch flush latency."""
+    from utils.message_writer import message_writer
+
+    return message_writer.stats()
+
+
+@router.get("/chat-prep")
+async def chat_prep_metrics(current_user: User = Depends(get_current_active_user)):
+    """Recent p50/p95/max milliseconds per chat turn preparation step (and in total)."""
+    from utils.chat_service import turn_prep_timings
+
+    return turn_prep_timings.stats()
+
+
+@router.get("/conversation-memory")
+async def conversation_memory_metrics(current_user: User = Depends(get_current_active_user)):
+    """Memory backend in use, hit rate, and (in-process) entries, bytes and evictions."""
+    from utils import conversation_memory
+
+    return await conversation_memory.stats()
+
+
+@router.get("/response-cache")
+async def response_cache_metrics(current_user: User = Depends(get_current_active_user)):
+    """Cached agent responses: entries, bytes, exact/semantic hits, misses and evictions."""
+    from utils.response_cache import response_cache
+
+    return response_cache.stats()
+
+
+@router.get("/single-flight")
+async def single_flight_metrics(current_user: User = Depends(get_current_active_user)):
+    """In-flight LLM calls and streams, and how many requests joined one instead of starting their own."""
+    from utils.single_flight import llm_flight
+
+    return llm_flight.stats()
+
+
+@router.get("/chat-latency")
+async def chat_latency_metrics(current_user: User = Depends(get_current_active_user)):
+    """Per-phase chat turn latency histograms (ms; tokens/s for throughput) by endpoint, agent and model."""
+    from utils.chat_trace import chat_latency
+
+    return chat_latency.stats()
+
+
+@router.get("/chat-cancellations")
+async def chat_cancellations_metrics(current_user: User = Depends(get_current_active_user)):
+    """Streamed turns abandoned by the client and the estimated output tokens not generated."""
+    from utils.chat_trace import stream_cancellations
+
+    return stream_cancellations.stats()
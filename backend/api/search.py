@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import time
@@ -6,6 +6,8 @@ import time
 from auth.dependencies import get_current_active_user
 from db.database import User, get_db
 from sqlalchemy.ext.asyncio import AsyncSession
+from utils.suggestion_index import suggestion_index
+from utils.trending import trending_searches
 from utils.workspace_search import search_workspace
 
 router = APIRouter(prefix="/api/search", tags=["search"])
@@ -15,6 +17,7 @@ class SearchQuery(BaseModel):
     query: str
     filters: Optional[Dict[str, Any]] = None
     limit: int = 20
+    cursor: Optional[str] = None
 
 
 class SearchResult(BaseModel):
@@ -34,6 +37,7 @@ class SearchResponse(BaseModel):
     query: str
     processing_time: float
     suggestions: List[str]
+    next_cursor: Optional[str] = None
 
 
 @router.post("/semantic", response_model=SearchResponse)
@@ -42,22 +46,30 @@ async def semantic_search(
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Search your real chats, documents, and tasks (keyword match)."""
+    """Search your real chats, documents, and tasks (keyword + semantic match)."""
     start = time.time()
     type_filter = None
     if search.filters and search.filters.get("types"):
         type_filter = search.filters["types"]
 
-    raw = await search_workspace(
-        db,
-        str(current_user.id),
-        search.query,
-        type_filter=type_filter,
-        limit=search.limit,
-    )
+    try:
+        raw, next_cursor = await search_workspace(
+            db,
+            str(current_user.id),
+            search.query,
+            type_filter=type_filter,
+            limit=min(max(search.limit, 1), 100),
+            cursor=search.cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     results = [SearchResult(**r) for r in raw]
     elapsed = time.time() - start
+    if not search.cursor:
+        trending_searches.record(str(current_user.id), search.query)
+    if results:
+        suggestion_index.record_query(str(current_user.id), search.query)
 
     suggestions = []
     if not results and len(search.query) >= 2:
@@ -71,6 +83,7 @@ async def semantic_search(
         query=search.query,
         processing_time=round(elapsed, 3),
         suggestions=suggestions,
+        next_cursor=next_cursor,
     )
 
 
@@ -78,32 +91,10 @@ async def semantic_search(
 async def get_search_suggestions(
     prefix: str = Query(..., min_length=1),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db),
 ):
     """Autocomplete from your real workspace content."""
-    from sqlalchemy import select
-    from db.database import Conversation
-
-    uid = str(current_user.id)
     prefix_lower = prefix.lower()
-    suggestions: list[str] = []
-
-    result = await db.execute(
-        select(Conversation.title)
-        .where(Conversation.user_id == uid)
-        .order_by(Conversation.updated_at.desc())
-        .limit(20)
-    )
-    for (title,) in result.all():
-        if title and prefix_lower in title.lower():
-            suggestions.append(title)
-
-    from utils.document_store import list_documents
-
-    for doc in list_documents(user_id=uid)[:15]:
-        name = doc.get("filename") or ""
-        if prefix_lower in name.lower():
-            suggestions.append(name)
+    suggestions = await suggestion_index.suggest(str(current_user.id), prefix, limit=8)
 
     defaults = ["my resume", "tasks due", "recent chats", "uploaded documents"]
     for d in defaults:
@@ -137,10 +128,12 @@ async def get_available_filters(current_user: User = Depends(get_current_active_
 
 
 @router.get("/trending")
-async def get_trending_searches(current_user: User = Depends(get_current_active_user)):
+async def get_trending_searches(
+    limit: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Most searched queries across the workspace and for you, with trend direction."""
     return {
-        "trending": [
-            {"query": "resume", "count": 0, "trend": "stable"},
-            {"query": "tasks", "count": 0, "trend": "stable"},
-        ]
+        "trending": trending_searches.top(limit),
+        "yours": trending_searches.top(limit, user_id=str(current_user.id)),
     }
@@ -9,6 +9,8 @@ import uuid
 
 from auth.dependencies import get_current_active_user
 from db.database import get_db, User, Task as TaskModel
+from utils.search_index import KIND_TASK, entry, index_queue
+from utils.suggestion_index import suggestion_index
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -42,6 +44,19 @@ class TaskResponse(BaseModel):
         from_attributes = True
 
 
+def _index_task(task: TaskModel) -> None:
+    index_queue.upsert(
+        entry(
+            KIND_TASK,
+            task.id,
+            user_id=task.user_id,
+            title=task.title,
+            body=task.description,
+            ts=task.updated_at or task.created_at,
+        )
+    )
+
+
 @router.post("", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
 async def create_task(
     task_data: TaskCreate,
@@ -63,6 +78,8 @@ async def create_task(
     db.add(task)
     await db.commit()
     await db.refresh(task)
+    _index_task(task)
+    suggestion_index.add(task.user_id, task.title)
     
     return TaskResponse.model_validate(task)
 
@@ -102,6 +119,7 @@ async def update_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    old_title = task.title
     if task_data.title is not None:
         task.title = task_data.title
     if task_data.description is not None:
@@ -113,6 +131,8 @@ async def update_task(
     
     await db.commit()
     await db.refresh(task)
+    _index_task(task)
+    suggestion_index.replace(task.user_id, old_title, task.title)
     
     return TaskResponse.model_validate(task)
 
@@ -138,5 +158,7 @@ async def delete_task(
     
     await db.delete(task)
     await db.commit()
+    index_queue.delete(KIND_TASK, task_id)
+    suggestion_index.remove(task.user_id, task.title)
     
     return {"message": "Task deleted successfully"}
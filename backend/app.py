@@ -2,14 +2,15 @@ from utils.env_loader import load_backend_env
 
 load_backend_env()
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, Depends, BackgroundTasks, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import StreamingResponse, Response, ORJSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Dict, Any
 import os
 import asyncio
+import threading
+from contextlib import aclosing
 from datetime import datetime
 from functools import lru_cache
 
@@ -18,9 +19,13 @@ from agents.router import AgentRouter
 from agents.code_agent import CodeAgent
 from db.database import get_db, init_db, User, describe_database_target, DATABASE_URL
 from sqlalchemy.ext.asyncio import AsyncSession
+from utils.chat_trace import AUTH, TurnTrace, turn_trace
 from utils.logger import logger
+from utils.search_index import index_document, index_queue
+from utils.sse import DONE_FRAME, EventStreamResponse, SSEWriter, StreamingGZipMiddleware, sse_frame
+from utils.suggestion_index import suggestion_index
 from auth.routes import router as auth_router
-from auth.dependencies import get_current_active_user
+from auth.dependencies import get_current_active_user, get_websocket_user
 from api.tasks import router as tasks_router
 from api.analytics import router as analytics_router
 from api.settings import router as settings_router
@@ -40,6 +45,7 @@ from api.smart_scheduling import router as smart_scheduling_router
 from api.knowledge_base import router as knowledge_base_router
 from api.ai_assistant import router as ai_assistant_router
 from api.conversations import router as conversations_router
+from api.metrics import router as metrics_router
 
 app = FastAPI(
     title="Synapse AI Workspace API",
@@ -51,6 +57,9 @@ app = FastAPI(
 # Startup event to initialize database
 @app.on_event("startup")
 async def startup_event():
+    from utils.trending import trending_searches
+
+    trending_searches.start()
     try:
         from utils.env_loader import get_groq_api_key
         logger.info("Starting Synapse AI Backend...")
@@ -58,6 +67,14 @@ async def startup_event():
         logger.info("Initializing database (%s)...", describe_database_target(DATABASE_URL))
         await init_db()
         logger.info("Database initialized successfully")
+        from utils.message_writer import message_writer
+        from utils.search_index import ensure_search_index, index_queue
+        from utils.vector_index import vector_index
+
+        await ensure_search_index()
+        message_writer.start()
+        index_queue.start()
+        vector_index.start()
         logger.info("Backend is ready to accept requests")
     except Exception as e:
         logger.error("Startup error: %s", e)
@@ -98,6 +115,19 @@ async def startup_event():
         logger.error("Backend will still run but auth and data features may not work")
         # Don't crash the app, let it start anyway
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    from utils.message_writer import message_writer
+    from utils.search_index import index_queue
+    from utils.trending import trending_searches
+    from utils.vector_index import vector_index
+
+    # Messages first: their flush queues search index updates.
+    await message_writer.stop()
+    await index_queue.stop()
+    await vector_index.stop()
+    await trending_searches.stop()
+
 # Include authentication routes
 app.include_router(auth_router)
 app.include_router(tasks_router)
@@ -119,6 +149,7 @@ app.include_router(smart_scheduling_router)
 app.include_router(knowledge_base_router)
 app.include_router(ai_assistant_router)
 app.include_router(conversations_router)
+app.include_router(metrics_router)
 
 # CORS Configuration
 # Allow localhost for development and production domains
@@ -142,8 +173,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add GZip compression for faster responses
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Add GZip compression for faster responses (not for event streams, which gzip would buffer)
+app.add_middleware(
+    StreamingGZipMiddleware,
+    minimum_size=1000,
+    exclude_paths=("/api/chat/stream", "/api/documents/upload/bulk"),
+)
 
 # Add performance monitoring middleware (only in production, optional)
 if os.getenv("ENABLE_PERFORMANCE_MONITORING", "false").lower() == "true":
@@ -157,26 +192,53 @@ if os.getenv("ENABLE_PERFORMANCE_MONITORING", "false").lower() == "true":
 # Initialize components
 # Use lazy loading for RAG pipeline to avoid startup timeout
 rag_pipeline = None
+_rag_pipeline_lock = threading.Lock()
+_rag_pipeline_build: Optional[asyncio.Future] = None
 agent_router = AgentRouter()
 
 def get_rag_pipeline():
     """Lazy-load RAG pipeline to avoid startup timeout and heavy import at boot"""
     global rag_pipeline
-    if rag_pipeline is None:
-        try:
-            from rag.pipeline import RAGPipeline
-
-            logger.info("Initializing RAG pipeline (this may take a moment on first use)...")
-            rag_pipeline = RAGPipeline()
-            logger.info("RAG pipeline initialized successfully")
-        except ImportError as e:
-            logger.error(f"RAG dependencies missing: {e}")
-            raise HTTPException(
-                status_code=503,
-                detail="Document AI is unavailable. Install backend requirements: pip install -r requirements.txt",
-            )
+    if rag_pipeline is not None:
+        return rag_pipeline
+    # Callers on other threads wait for the one build instead of starting their own.
+    with _rag_pipeline_lock:
+        if rag_pipeline is None:
+            try:
+                from rag.pipeline import RAGPipeline
+
+                logger.info("Initializing RAG pipeline (this may take a moment on first use)...")
+                rag_pipeline = RAGPipeline()
+                logger.info("RAG pipeline initialized successfully")
+            except ImportError as e:
+                logger.error(f"RAG dependencies missing: {e}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Document AI is unavailable. Install backend requirements: pip install -r requirements.txt",
+                )
     return rag_pipeline
 
+
+async def get_rag_pipeline_async():
+    """``get_rag_pipeline`` off the event loop, one build shared by all waiting requests.
+
+    Shielded: a request that gives up (step timeout) stops waiting but leaves the
+    build running for the next turn instead of starting another thread.
+    """
+    global _rag_pipeline_build
+    if rag_pipeline is not None:
+        return rag_pipeline
+    if _rag_pipeline_build is None:
+        _rag_pipeline_build = asyncio.ensure_future(asyncio.to_thread(get_rag_pipeline))
+
+        def forget_failed(build: asyncio.Future) -> None:
+            global _rag_pipeline_build
+            if build.cancelled() or build.exception() is not None:
+                _rag_pipeline_build = None
+
+        _rag_pipeline_build.add_done_callback(forget_failed)
+    return await asyncio.shield(_rag_pipeline_build)
+
 # Models
 class ChatMessage(BaseModel):
     message: str
@@ -207,27 +269,6 @@ class CodeAnalysisRequest(BaseModel):
     file_path: Optional[str] = None
     analysis_type: str = "full"
 
-# WebSocket Connection Manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
-
 # Root endpoint
 @app.get("/")
 async def root():
@@ -259,6 +300,7 @@ async def health_check():
 async def config_check():
     """Check which AI provider is configured - useful for debugging"""
     from utils.env_loader import get_groq_api_key
+    from utils.mock_llm import mock_enabled
     groq_key = get_groq_api_key()
     openai_key = os.getenv("OPENAI_API_KEY")
     use_ollama_env = os.getenv("USE_OLLAMA", "false")
@@ -279,7 +321,8 @@ async def config_check():
         "openai_configured": bool(openai_key),
         "use_ollama_env_var": use_ollama_env,
         "ollama_enabled": use_ollama,
-        "active_provider": "groq" if groq_key else ("openai" if openai_key else ("ollama" if use_ollama else "NONE - ERROR!")),
+        "mock_llm_enabled": mock_enabled(),
+        "active_provider": "mock" if mock_enabled() else "groq" if groq_key else ("openai" if openai_key else ("ollama" if use_ollama else "NONE - ERROR!")),
         "groq_model": os.getenv("GROQ_MODEL", "llama-3.1-8b-instant"),
         "database_url_set": bool(os.getenv("DATABASE_URL")),
         "frontend_url": os.getenv("FRONTEND_URL", "not set"),
@@ -296,7 +339,15 @@ async def list_chat_models(current_user: User = Depends(get_current_active_user)
     """Available LLM models for the chat model picker."""
     from utils.env_loader import get_groq_api_key
     from utils.llm_factory import GROQ_MODELS, get_default_model
+    from utils.mock_llm import create_mock_llm, mock_enabled
 
+    if mock_enabled():
+        # Any model id works; the Groq list keeps the picker usable in offline tests.
+        return {
+            "provider": "mock",
+            "default": create_mock_llm().model,
+            "models": GROQ_MODELS,
+        }
     if get_groq_api_key():
         return {
             "provider": "groq",
@@ -310,62 +361,104 @@ async def list_chat_models(current_user: User = Depends(get_current_active_user)
     }
 
 
+# Per-step limits for turn preparation; optional steps fall back instead of failing the turn.
+_PREP_TIMEOUTS = {"documents": 20.0, "conversation": 5.0, "history": 5.0, "rag": 3.0}
+
+
 async def _prepare_chat_turn(
     request: ChatMessage,
     current_user: User,
     db: AsyncSession,
 ) -> tuple[str, Any, str, list, str]:
-    """Returns agent_type, agent, chat_message, relevant_docs, conversation_id."""
+    """Returns agent_type, agent, chat_message, relevant_docs, conversation_id.
+
+    Runs as a dependency graph: document extraction, the conversation lookup
+    (followed by history hydration) and RAG search run concurrently; routing waits
+    for the documents, and so does the conversation step when documents are attached. Step timings are logged and summarized at /api/metrics/chat-prep.
+    """
     from utils import conversation_memory
     from utils.chat_service import (
         build_document_context,
         ensure_conversation,
         load_messages_for_memory,
         resolve_agent_and_context,
+        turn_prep_timings,
     )
+    from utils import chat_trace
+    from utils.step_graph import Step, run_steps
 
-    doc_context, extract_errors = (
-        build_document_context(request.document_ids or [], str(current_user.id))
-        if request.document_ids
-        else ([], [])
-    )
+    uid = str(current_user.id)
 
-    if request.document_ids and not doc_context:
-        detail = (
-            "; ".join(extract_errors)
-            if extract_errors
-            else "Could not read attached document(s). Try PDF, DOCX, TXT, or MD."
+    async def documents(_results):
+        if not request.document_ids:
+            return []
+        doc_context, extract_errors = await asyncio.to_thread(
+            build_document_context, request.document_ids, uid
+        )
+        if not doc_context:
+            detail = (
+                "; ".join(extract_errors)
+                if extract_errors
+                else "Could not read attached document(s). Try PDF, DOCX, TXT, or MD."
+            )
+            if "not installed" in detail.lower():
+                detail += " Run from project root: npm run install-backend"
+            raise HTTPException(status_code=400, detail=detail)
+        return doc_context
+
+    async def conversation(_results):
+        return await ensure_conversation(
+            db,
+            user_id=uid,
+            conversation_id=request.conversation_id,
+            first_message=request.message,
         )
-        if "not installed" in detail.lower():
-            detail += " Run from project root: npm run install-backend"
-        raise HTTPException(status_code=400, detail=detail)
-
-    conv_id = await ensure_conversation(
-        db,
-        user_id=str(current_user.id),
-        conversation_id=request.conversation_id,
-        first_message=request.message,
-    )
 
-    if request.conversation_id and not conversation_memory.get_history(conv_id):
-        pairs = await load_messages_for_memory(db, conv_id)
-        if pairs:
-            conversation_memory.hydrate(conv_id, pairs)
+    async def history(results):
+        conv_id = results["conversation"]
+        if not await conversation_memory.is_cached(conv_id):
+            # New threads start empty; existing ones (or ones evicted from memory) reload from the DB.
+            pairs = await load_messages_for_memory(db, conv_id) if request.conversation_id else []
+            await conversation_memory.hydrate(conv_id, pairs)
 
-    agent_type, chat_message, relevant_docs = resolve_agent_and_context(
-        request.message, doc_context, agent_router, get_rag_pipeline
-    )
+    async def route(results):
+        return resolve_agent_and_context(
+            request.message, results["documents"], agent_router, get_rag_pipeline
+        )
 
-    if not doc_context:
-        try:
-            pipeline = get_rag_pipeline()
-            rag_docs = await pipeline.search(request.message, k=2)
-            relevant_docs = list(relevant_docs) + list(rag_docs)
-        except Exception as rag_error:
-            logger.warning(f"RAG search failed: {str(rag_error)}")
+    async def rag(_results):
+        # First use builds the pipeline (slow, blocking) off the event loop, once.
+        pipeline = await get_rag_pipeline_async()
+        return list(await pipeline.search(request.message, k=2))
+
+    steps = [
+        Step("documents", documents, timeout=_PREP_TIMEOUTS["documents"]),
+        # A new conversation is committed (and indexed) on creation, so with attachments it waits
+        # for extraction: a 400 from unreadable documents must not leave an empty thread behind.
+        Step(
+            "conversation",
+            conversation,
+            after=("documents",) if request.document_ids else (),
+            timeout=_PREP_TIMEOUTS["conversation"],
+        ),
+        # Without hydration the turn still runs; the next one retries it.
+        Step("history", history, after=("conversation",), timeout=_PREP_TIMEOUTS["history"], fallback=None),
+        Step("route", route, after=("documents",)),
+    ]
+    if not request.document_ids:
+        # Attached documents replace RAG context, so search only when there are none.
+        steps.append(Step("rag", rag, timeout=_PREP_TIMEOUTS["rag"], fallback=[]))
+
+    results, timings = await run_steps(steps)
+    turn_prep_timings.record(timings)
+    chat_trace.record_prep(timings)
+
+    conv_id = results["conversation"]
+    agent_type, chat_message, relevant_docs = results["route"]
+    relevant_docs = list(relevant_docs) + results.get("rag", [])
 
     agent = agent_router.get_agent(agent_type)
-    logger.info(f"Routed to {agent_type} for conversation {conv_id}")
+    logger.info(f"Routed to {agent_type} for conversation {conv_id} (prep ms: {timings})")
     return agent_type, agent, chat_message, relevant_docs, conv_id
 
 
@@ -373,20 +466,22 @@ async def _prepare_chat_turn(
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(
     request: ChatMessage,
+    trace: TurnTrace = Depends(turn_trace("chat")),
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
-    import time
-    from utils.chat_service import save_message
+    from utils.conversation_summary import schedule_summary
+    from utils.message_writer import message_writer
 
-    start_time = time.time()
+    trace.mark(AUTH)
     try:
         logger.info(f"User {current_user.email} - chat: {request.message[:50]}...")
         agent_type, agent, chat_message, relevant_docs, conv_id = await _prepare_chat_turn(
             request, current_user, db
         )
 
-        await save_message(db, conversation_id=conv_id, role="user", content=request.message)
+        uid = str(current_user.id)
+        await message_writer.add(conversation_id=conv_id, user_id=uid, role="user", content=request.message)
 
         response = await agent.process(
             message=chat_message,
@@ -395,12 +490,13 @@ async def chat(
             model=request.model,
         )
 
-        await save_message(
-            db, conversation_id=conv_id, role="assistant", content=response["content"]
+        await message_writer.add(
+            conversation_id=conv_id, user_id=uid, role="assistant", content=response["content"]
         )
+        schedule_summary(conv_id)
 
-        elapsed_time = time.time() - start_time
-        logger.info(f"Chat response in {elapsed_time:.2f}s")
+        spans = trace.finish(agent_type, request.model or agent.model_name, response["content"])
+        logger.info(f"Chat response in {spans['total'] / 1000:.2f}s (spans ms: {spans})")
 
         return ChatResponse(
             response=response["content"],
@@ -418,56 +514,100 @@ async def chat(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _stream_chat_turn(
+    request: ChatMessage,
+    current_user: User,
+    db: AsyncSession,
+    trace: TurnTrace,
+    writer: SSEWriter,
+):
+    """Frames of one streamed turn (shared by SSE and /ws/chat): a start frame, then content.
+
+    Saves both messages and records the turn's latency spans; the caller sends the
+    final done/error frame. If the client goes away mid-answer (the generator is
+    closed or cancelled), the model stream is cancelled with it and the partial
+    answer is saved with ``truncated`` set.
+    """
+    from utils.chat_trace import stream_cancellations
+    from utils.conversation_summary import schedule_summary
+    from utils.message_writer import message_writer
+    from utils.token_budget import count_tokens
+
+    agent_type, agent, chat_message, relevant_docs, conv_id = await _prepare_chat_turn(
+        request, current_user, db
+    )
+    yield writer.start_frame({"conversation_id": conv_id, "agent_used": agent_type})
+
+    uid = str(current_user.id)
+    await message_writer.add(conversation_id=conv_id, user_id=uid, role="user", content=request.message)
+
+    content = writer.content_frames(
+        agent.stream_process(
+            chat_message,
+            context=relevant_docs if relevant_docs else [],
+            conversation_id=conv_id,
+            model=request.model,
+        )
+    )
+    try:
+        # aclosing: when this generator is closed at a yield, close the model stream too.
+        async with aclosing(content) as frames:
+            async for frame in frames:
+                yield frame
+    except (asyncio.CancelledError, GeneratorExit):
+        partial = writer.text
+        stream_cancellations.record(count_tokens(partial), cancelled=True)
+        logger.info(f"Client left conversation {conv_id} mid-answer; stream cancelled after {len(partial)} chars")
+        if partial:
+            # Shielded: the save must finish even though this request is being cancelled.
+            await asyncio.shield(
+                message_writer.add(
+                    conversation_id=conv_id, user_id=uid, role="assistant", content=partial, truncated=True
+                )
+            )
+            schedule_summary(conv_id)
+        raise
+
+    full_response = writer.text
+    stream_cancellations.record(count_tokens(full_response), cancelled=False)
+    if full_response:
+        await message_writer.add(
+            conversation_id=conv_id, user_id=uid, role="assistant", content=full_response
+        )
+        schedule_summary(conv_id)
+    trace.finish(agent_type, request.model or agent.model_name, full_response)
+
+
 # Stream Chat Endpoint (ChatGPT-style token streaming)
 @app.post("/api/chat/stream")
 async def chat_stream(
     request: ChatMessage,
+    trace: TurnTrace = Depends(turn_trace("chat_stream")),
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
-    import json
-    from utils.chat_service import save_message
+    trace.mark(AUTH)
 
     async def generate():
         try:
-            agent_type, agent, chat_message, relevant_docs, conv_id = await _prepare_chat_turn(
-                request, current_user, db
-            )
-            yield f"data: {json.dumps({'conversation_id': conv_id, 'agent_used': agent_type})}\n\n"
-
-            await save_message(db, conversation_id=conv_id, role="user", content=request.message)
-
-            full_response = ""
-            async for chunk in agent.stream_process(
-                chat_message,
-                context=relevant_docs if relevant_docs else [],
-                conversation_id=conv_id,
-                model=request.model,
-            ):
-                full_response += chunk
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
-
-            if full_response:
-                await save_message(
-                    db, conversation_id=conv_id, role="assistant", content=full_response
-                )
-            yield "data: [DONE]\n\n"
+            async with aclosing(_stream_chat_turn(request, current_user, db, trace, SSEWriter())) as frames:
+                async for frame in frames:
+                    yield frame
+            yield DONE_FRAME
         except HTTPException as e:
-            yield f"data: {json.dumps({'error': e.detail})}\n\n"
+            yield sse_frame({"error": e.detail})
         except Exception as e:
             logger.error(f"Stream error: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield sse_frame({"error": str(e)})
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
-    )
+    return EventStreamResponse(generate())
 
 # Document Upload (works without full RAG stack)
 @app.post("/api/documents/upload")
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    analyze: bool = False,
     current_user: User = Depends(get_current_active_user),
 ):
     from utils.document_store import save_upload
@@ -484,6 +624,8 @@ async def upload_document(
             filename=filename,
             content=content,
         )
+        suggestion_index.add(current_user.id, record["filename"])
+        background_tasks.add_task(index_document, record)
 
         rag_indexed = False
         try:
@@ -493,12 +635,18 @@ async def upload_document(
         except Exception as rag_error:
             logger.warning(f"RAG indexing skipped: {rag_error}")
 
+        if analyze:
+            from utils.document_analysis import run_analysis_job
+
+            background_tasks.add_task(run_analysis_job, record)
+
         return {
             "status": "success",
             "document_id": record["id"],
             "filename": record["filename"],
             "size": record["size"],
             "rag_indexed": rag_indexed,
+            "analysis_queued": analyze,
         }
     except HTTPException:
         raise
@@ -507,6 +655,62 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/documents/upload/bulk")
+async def upload_documents_bulk(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    analyze: bool = False,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Upload several files and/or zip archives; streams per-file progress as SSE."""
+    from utils.bulk_upload import index_uploads, store_uploads
+
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+
+    logger.info(f"Bulk upload of {len(files)} file(s) for user {current_user.email}")
+    uploads = [(f.file, f.filename or "upload.bin") for f in files]
+    records: list[dict[str, Any]] = []
+
+    def schedule(record: dict[str, Any]) -> None:
+        # Tasks added while streaming still run: the response keeps this BackgroundTasks object.
+        suggestion_index.add(current_user.id, record["filename"])
+        background_tasks.add_task(index_document, record)
+        if analyze:
+            from utils.document_analysis import run_analysis_job
+
+            background_tasks.add_task(run_analysis_job, record)
+
+    async def progress():
+        failed = 0
+        try:
+            async for event in store_uploads(uploads, user_id=current_user.id, records=records):
+                failed += event["status"] == "failed"
+                yield sse_frame(event)
+        finally:
+            # Also when the client goes away mid-upload: whatever was stored is committed, so index it.
+            for record in records:
+                schedule(record)
+        indexed = 0
+        async for event in index_uploads(records, get_rag_pipeline):
+            indexed += event["status"] == "indexed"
+            yield sse_frame(event)
+        summary = {
+            "status": "complete",
+            "stored": len(records),
+            "failed": failed,
+            "rag_indexed": indexed,
+            "document_ids": [r["id"] for r in records],
+        }
+        yield sse_frame(summary)
+
+    return StreamingResponse(
+        progress(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/documents")
 async def list_documents(current_user: User = Depends(get_current_active_user)):
     from utils.document_store import list_documents as store_list
@@ -522,43 +726,33 @@ async def list_documents(current_user: User = Depends(get_current_active_user)):
 @app.post("/api/documents/{document_id}/analyze")
 async def analyze_document(
     document_id: str,
+    refresh: bool = False,
     current_user: User = Depends(get_current_active_user),
 ):
-    """Summarize and extract insights from an uploaded document."""
-    from utils.document_store import get_document, extract_text
-    from agents.document_agent import DocumentAgent
+    """Summarize and extract insights from an uploaded document.
+
+    Results are memoized per document content and model; pass ``refresh=true``
+    to force regeneration.
+    """
+    from utils.document_store import get_document
+    from utils.document_analysis import UnreadableDocumentError, analyze_record
 
     record = get_document(document_id, user_id=current_user.id)
     if not record:
         raise HTTPException(status_code=404, detail="Document not found")
 
     try:
-        text = extract_text(record["file_path"], record["filename"])
-    except ValueError as e:
+        analysis, cached = await analyze_record(record, refresh=refresh)
+    except UnreadableDocumentError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    if len(text.strip()) < 20:
-        raise HTTPException(
-            status_code=400,
-            detail="Could not extract enough text from this file. Try a text-based PDF or DOCX.",
-        )
-
-    agent = DocumentAgent()
-    summary = await agent.summarize(text, max_length=400)
-    response = await agent.process(
-        message=(
-            "List 5 key takeaways and 3 suggested follow-up questions the user should ask "
-            "to learn more from this document."
-        ),
-        context=[{"content": text[:12000], "metadata": {"source": record["filename"]}}],
-    )
-
     return {
         "document_id": document_id,
         "filename": record["filename"],
-        "summary": summary,
-        "insights": response["content"],
-        "word_count": len(text.split()),
+        "summary": analysis["summary"],
+        "insights": analysis["insights"],
+        "word_count": analysis["word_count"],
+        "cached": cached,
     }
 
 
@@ -567,12 +761,15 @@ async def delete_document(
     document_id: str,
     current_user: User = Depends(get_current_active_user),
 ):
-    from utils.document_store import delete_document as store_delete
+    from utils.document_store import delete_document as store_delete, get_document
 
     try:
+        record = get_document(document_id, user_id=current_user.id)
         deleted = store_delete(document_id, user_id=current_user.id)
         if not deleted:
             raise HTTPException(status_code=404, detail="Document not found")
+        suggestion_index.remove(current_user.id, record["filename"])
+        index_queue.delete_children(document_id)
         try:
             pipeline = get_rag_pipeline()
             await pipeline.delete_document(document_id)
@@ -604,24 +801,32 @@ async def analyze_code(request: CodeAnalysisRequest):
         logger.error(f"Error analyzing code: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# WebSocket for real-time chat
+# WebSocket for real-time chat (framed protocol: see utils/ws_chat.py)
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
-    await manager.connect(websocket)
-    try:
-        while True:
-            data = await websocket.receive_text()
-            
-            # Process message
-            agent_type, _ = agent_router.route(data)
-            agent = agent_router.get_agent(agent_type)
-            
-            response = await agent.process(message=data, context=[])
-            
-            await manager.send_message(response["content"], websocket)
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
+    from db.database import async_session_maker
+    from utils.chat_trace import start_trace
+    from utils.ws_chat import ChatSocket, WSChatWriter
+
+    current_user = await get_websocket_user(websocket)
+    if current_user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    async def handle_turn(request_id: str, frame: dict):
+        try:
+            request = ChatMessage.model_validate(frame)
+        except ValidationError as e:
+            raise ValueError(f"Invalid chat request: {e.errors()[0]['msg']}") from e
+        trace = start_trace("ws_chat")
+        async with async_session_maker() as db:
+            frames = _stream_chat_turn(request, current_user, db, trace, WSChatWriter(request_id))
+            async with aclosing(frames):
+                async for out in frames:
+                    yield out
+
+    await ChatSocket(websocket, handle_turn).run()
 
 # Analytics Endpoint
 @app.get("/api/analytics")
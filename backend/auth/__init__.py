@@ -7,7 +7,8 @@ from .auth_utils import (
 from .dependencies import (
     get_current_user,
     get_current_active_user,
-    get_optional_user
+    get_optional_user,
+    get_websocket_user
 )
 
 __all__ = [
@@ -17,5 +18,6 @@ __all__ = [
     "decode_access_token",
     "get_current_user",
     "get_current_active_user",
-    "get_optional_user"
+    "get_optional_user",
+    "get_websocket_user"
 ]
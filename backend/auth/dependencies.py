@@ -1,14 +1,14 @@
 """
 FastAPI dependencies for authentication
 """
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, WebSocket, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import Optional
 
 from .auth_utils import decode_access_token
-from db.database import get_db, User
+from db.database import async_session_maker, get_db, User
 
 security = HTTPBearer()
 
@@ -66,3 +66,22 @@ async def get_optional_user(
         return await get_current_user(credentials, db)
     except HTTPException:
         return None
+
+
+async def get_websocket_user(websocket: WebSocket) -> Optional[User]:
+    """Active user for a WebSocket handshake (``?token=`` or a bearer Authorization header), None otherwise"""
+    token = websocket.query_params.get("token")
+    if not token:
+        scheme, _, value = websocket.headers.get("authorization", "").partition(" ")
+        token = value if scheme.lower() == "bearer" else None
+    payload = decode_access_token(token) if token else None
+    user_id = payload.get("sub") if payload else None
+    if user_id is None:
+        return None
+
+    async with async_session_maker() as db:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+    if user is None or not user.is_active:
+        return None
+    return user
@@ -0,0 +1 @@
+"""Backend benchmarks. Run from backend/, e.g. ``python -m benchmarks.search_bench --help``."""
@@ -0,0 +1,387 @@
+"""Chat pipeline load test against the mock LLM, fully offline.
+
+Runs the app in-process with ``USE_MOCK_LLM=true`` (see ``utils/mock_llm.py``)
+on a fresh database, registers users and has them hold multi-turn
+conversations concurrently through ``/api/chat/stream`` (or ``/api/chat``).
+Requests go straight to the ASGI app, so timings cover the whole request
+pipeline (auth, database, RAG, prompt building, streaming, persistence) but
+not an HTTP server or network. Reports client-side time to first token and
+turn latency percentiles, throughput, injected error and 429 counts, and the
+server's per-phase latency histograms (/api/metrics/chat-latency).
+
+    cd backend
+    python -m benchmarks.chat_bench
+    python -m benchmarks.chat_bench --users 100 --turns 10 --ttft-ms 500 --tokens-per-second 80
+    python -m benchmarks.chat_bench --endpoint chat --error-rate 0.02 --rate-limit-rate 0.05 --json chat.json
+
+With the same seed and arguments the prompts, replies and injected failures are
+the same from run to run, so runs can be compared before and after a change.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import orjson
+
+from benchmarks.common import BENCH_DIR, lognormal_length, percentiles, print_table, rss_mb, use_database, vocabulary, zipf_sampler
+
+DEFAULT_SQLITE_PATH = BENCH_DIR / ".data" / "chat_bench.db"
+BENCH_PASSWORD = "bench-password"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="PostgreSQL (or other) URL of an empty database; default is a fresh SQLite file")
+    parser.add_argument("--sqlite-path", type=Path, default=DEFAULT_SQLITE_PATH)
+    parser.add_argument("--endpoint", choices=["stream", "chat"], default="stream")
+    parser.add_argument("--users", type=int, default=20, help="concurrent users, one conversation each")
+    parser.add_argument("--turns", type=int, default=5, help="turns per conversation")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a user's turns")
+    parser.add_argument("--message-words", type=int, default=15, help="median words per user message")
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="mock time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="mock output rate")
+    parser.add_argument("--response-tokens", type=int, default=200, help="mock tokens per reply")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of mock calls failing mid-reply")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="share of mock calls rejected with 429")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    return parser.parse_args()
+
+
+def configure_mock(args: argparse.Namespace) -> None:
+    os.environ["USE_MOCK_LLM"] = "true"
+    os.environ["MOCK_LLM_TTFT_MS"] = str(args.ttft_ms)
+    os.environ["MOCK_LLM_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["MOCK_LLM_RESPONSE_TOKENS"] = str(args.response_tokens)
+    os.environ["MOCK_LLM_ERROR_RATE"] = str(args.error_rate)
+    os.environ["MOCK_LLM_RATE_LIMIT_RATE"] = str(args.rate_limit_rate)
+    os.environ["MOCK_LLM_SEED"] = str(args.seed)
+
+
+# -- in-process ASGI client ------------------------------------------------------------
+
+
+class Response:
+    def __init__(self) -> None:
+        self.status = 0
+        self.chunks: list[tuple[float, bytes]] = []
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(chunk for _, chunk in self.chunks)
+
+    def json(self) -> Any:
+        return orjson.loads(self.body)
+
+
+class ASGIClient:
+    """Minimal HTTP/1.1 ASGI driver that timestamps every body chunk as the app sends it."""
+
+    def __init__(self, app: Callable[..., Awaitable[None]]):
+        self.app = app
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        payload: Any = None,
+        token: str | None = None,
+        on_chunk: Callable[[bytes], None] | None = None,
+    ) -> Response:
+        body = orjson.dumps(payload) if payload is not None else b""
+        headers = [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if token:
+            headers.append((b"authorization", f"Bearer {token}".encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        response = Response()
+        finished = asyncio.Event()
+        sent_request = False
+
+        async def receive() -> dict[str, Any]:
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # The client stays connected until the whole response has arrived.
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                response.status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if chunk:
+                    response.chunks.append((time.perf_counter(), chunk))
+                    if on_chunk:
+                        on_chunk(chunk)
+                if not message.get("more_body", False):
+                    finished.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return response
+
+
+class Lifespan:
+    """Run the app's startup and shutdown handlers through the ASGI lifespan protocol."""
+
+    def __init__(self, app: Callable[..., Awaitable[None]]):
+        self.app = app
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._outbox: asyncio.Queue = asyncio.Queue()
+
+    async def _expect(self, event: str) -> None:
+        message = await self._outbox.get()
+        if message["type"] != f"{event}.complete":
+            raise RuntimeError(f"{event} failed: {message.get('message', message)}")
+
+    async def __aenter__(self) -> "Lifespan":
+        self._task = asyncio.create_task(
+            self.app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, self._inbox.get, self._outbox.put)
+        )
+        await self._inbox.put({"type": "lifespan.startup"})
+        await self._expect("lifespan.startup")
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self._inbox.put({"type": "lifespan.shutdown"})
+        await self._expect("lifespan.shutdown")
+        await self._task
+
+
+# -- workload --------------------------------------------------------------------------
+
+
+def is_rate_limited(error: str) -> bool:
+    error = error.lower()
+    return "429" in error or "rate limit" in error or "rate_limit" in error
+
+
+def parse_sse(body: bytes) -> list[Any]:
+    events = []
+    for frame in body.split(b"\n\n"):
+        if frame.startswith(b"data: "):
+            data = frame[len(b"data: "):]
+            events.append("[DONE]" if data == b"[DONE]" else orjson.loads(data))
+    return events
+
+
+async def register_users(client: ASGIClient, count: int) -> list[str]:
+    tokens = []
+    for i in range(count):
+        response = await client.request(
+            "POST",
+            "/api/auth/register",
+            {"email": f"bench-user-{i}@example.com", "password": BENCH_PASSWORD, "name": f"Bench User {i}"},
+        )
+        if response.status != 201:
+            raise SystemExit(f"Registering bench users failed ({response.status}): {response.body[:300]!r}")
+        tokens.append(response.json()["token"]["access_token"])
+    return tokens
+
+
+async def stream_turn(client: ASGIClient, token: str, message: str, conversation_id: str | None) -> dict[str, Any]:
+    started = time.perf_counter()
+    first_content: list[float] = []
+
+    def on_chunk(chunk: bytes) -> None:
+        if not first_content and b'"content"' in chunk:
+            first_content.append(time.perf_counter())
+
+    response = await client.request(
+        "POST",
+        "/api/chat/stream",
+        {"message": message, "conversation_id": conversation_id},
+        token,
+        on_chunk,
+    )
+    total_ms = (time.perf_counter() - started) * 1000
+    events = parse_sse(response.body)
+    start = next((e for e in events if isinstance(e, dict) and "conversation_id" in e), {})
+    errors = [e["error"] for e in events if isinstance(e, dict) and "error" in e]
+    return {
+        "status": response.status,
+        "conversation_id": start.get("conversation_id", conversation_id),
+        "ttft_ms": (first_content[0] - started) * 1000 if first_content else None,
+        "total_ms": total_ms,
+        "content": "".join(e["content"] for e in events if isinstance(e, dict) and "content" in e),
+        "error": str(errors[0]) if errors else (None if response.status == 200 else response.body[:300].decode()),
+    }
+
+
+async def chat_turn(client: ASGIClient, token: str, message: str, conversation_id: str | None) -> dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.request("POST", "/api/chat", {"message": message, "conversation_id": conversation_id}, token)
+    total_ms = (time.perf_counter() - started) * 1000
+    data = response.json() if response.body else {}
+    ok = response.status == 200
+    return {
+        "status": response.status,
+        "conversation_id": data.get("conversation_id", conversation_id) if ok else conversation_id,
+        "ttft_ms": None,
+        "total_ms": total_ms,
+        "content": data.get("response", "") if ok else "",
+        "error": None if ok else str(data.get("detail", response.body[:300].decode())),
+    }
+
+
+async def run_user(
+    client: ASGIClient,
+    token: str,
+    messages: list[str],
+    turn: Callable[..., Awaitable[dict[str, Any]]],
+    think_s: float,
+) -> list[dict[str, Any]]:
+    results, conversation_id = [], None
+    for i, message in enumerate(messages):
+        if i and think_s:
+            await asyncio.sleep(think_s)
+        result = await turn(client, token, message, conversation_id)
+        conversation_id = result["conversation_id"]
+        results.append(result)
+    return results
+
+
+def summarize(results: list[dict[str, Any]], wall_s: float) -> dict[str, Any]:
+    from utils.token_budget import count_tokens
+
+    ok = [r for r in results if r["error"] is None]
+    failed = [r for r in results if r["error"] is not None]
+    rate_limited = [r for r in failed if is_rate_limited(r["error"])]
+    output_tokens = sum(count_tokens(r["content"]) for r in results)
+    return {
+        "turns": len(results),
+        "ok": len(ok),
+        "errors": len(failed) - len(rate_limited),
+        "rate_limited": len(rate_limited),
+        "wall_s": round(wall_s, 2),
+        "turns_per_s": round(len(results) / wall_s, 2) if wall_s else None,
+        "output_tokens_per_s": round(output_tokens / wall_s, 1) if wall_s else None,
+        "ttft_ms": percentiles([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+        "total_ms": percentiles([r["total_ms"] for r in ok]),
+        "sample_errors": sorted({r["error"] for r in failed})[:5],
+    }
+
+
+def phase_rows(series: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    rows = []
+    for entry in series:
+        for phase, snapshot in entry["phases"].items():
+            rows.append(
+                {
+                    "endpoint": entry["endpoint"],
+                    "agent": entry["agent"],
+                    "phase": phase,
+                    "n": snapshot["count"],
+                    "p50": snapshot["p50"],
+                    "p95": snapshot["p95"],
+                    "p99": snapshot["p99"],
+                    "max": snapshot["max"],
+                }
+            )
+    return rows
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    from app import app
+
+    rng = random.Random(args.seed)
+    sample = zipf_sampler(vocabulary(args.vocabulary, rng), rng)
+    conversations = [
+        [" ".join(sample(lognormal_length(rng, args.message_words))) for _ in range(args.turns)]
+        for _ in range(args.users)
+    ]
+    client = ASGIClient(app)
+    turn = stream_turn if args.endpoint == "stream" else chat_turn
+
+    async with Lifespan(app):
+        tokens = await register_users(client, args.users)
+        print(f"Running {args.users} users x {args.turns} turns against /api/{'chat/stream' if args.endpoint == 'stream' else 'chat'}...")
+        started = time.perf_counter()
+        per_user = await asyncio.gather(
+            *(run_user(client, token, messages, turn, args.think_ms / 1000) for token, messages in zip(tokens, conversations))
+        )
+        wall_s = time.perf_counter() - started
+        latency = (await client.request("GET", "/api/metrics/chat-latency", token=tokens[0])).json()
+        cancellations = (await client.request("GET", "/api/metrics/chat-cancellations", token=tokens[0])).json()
+        flights = (await client.request("GET", "/api/metrics/single-flight", token=tokens[0])).json()
+
+    summary = summarize([r for results in per_user for r in results], wall_s)
+    print_table(
+        "Client view",
+        [
+            {
+                **{k: v for k, v in summary.items() if not isinstance(v, (dict, list))},
+                "ttft_p50": summary["ttft_ms"].get("p50"),
+                "ttft_p95": summary["ttft_ms"].get("p95"),
+                "turn_p50": summary["total_ms"].get("p50"),
+                "turn_p95": summary["total_ms"].get("p95"),
+                "turn_p99": summary["total_ms"].get("p99"),
+            }
+        ],
+    )
+    for error in summary["sample_errors"]:
+        print(f"  error: {error}")
+    print_table("Server phases (ms; tokens/s for tokens_per_second)", phase_rows(latency))
+
+    return {
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k != "database_url"},
+        "client": summary,
+        "server_latency": latency,
+        "stream_cancellations": cancellations,
+        "single_flight": flights,
+        "rss_mb": rss_mb(),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    configure_mock(args)
+    sqlite_path = None if args.database_url else args.sqlite_path.resolve()
+    if sqlite_path:
+        sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+        sqlite_path.unlink(missing_ok=True)
+    url = use_database(args.database_url, sqlite_path)
+    # Keep the run offline and away from the real uploads and trending files.
+    scratch = Path(tempfile.mkdtemp(prefix="chat-bench-"))
+    os.environ.setdefault("SEARCH_EMBEDDINGS", "off")
+    os.environ.setdefault("TRENDING_SNAPSHOT_PATH", str(scratch / "trending.json"))
+    import utils.document_store as document_store
+
+    document_store.UPLOADS_DIR = scratch / "uploads"
+    document_store.INDEX_FILE = document_store.UPLOADS_DIR / "_index.json"
+    print(f"Benchmark database: {url.split('@')[-1]}")
+
+    report = asyncio.run(run(args))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
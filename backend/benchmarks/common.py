@@ -0,0 +1,123 @@
+"""Helpers shared by the benchmark scripts: database selection, timing and memory reports."""
+from __future__ import annotations
+
+import math
+import os
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+# A few hundred everyday words; the rest of the vocabulary is synthetic long-tail terms.
+COMMON_WORDS = """
+the a to and of in is for that you it on with this be are have can i my we not
+your do will at as or if what how about from but so just like get all one more
+out up would use need make know time work project meeting report budget plan
+email team client code review design data model search index query user file
+document task deadline schedule call notes draft update issue bug fix deploy
+release test api database server error log performance memory cache latency
+resume interview job offer salary manager week month today tomorrow monday
+friday summary analysis chart sales marketing product customer feedback idea
+research paper article chapter book write read list question answer help
+explain example python javascript function class error message chat history
+budgetary quarterly invoice payment account password login security backup
+travel flight hotel trip booking dinner lunch recipe workout health doctor
+appointment birthday gift family weekend holiday vacation photo video music
+""".split()
+
+_SYLLABLES = "ka lo mi ren tas vor pel qui zan bro dex fin gor hal jun kel mar nox".split()
+
+
+def use_database(url: str | None, sqlite_path: Path) -> str:
+    """Point DATABASE_URL at the benchmark database; must run before ``db.database`` is imported."""
+    if "db.database" in sys.modules:
+        raise RuntimeError("use_database() must be called before db.database is imported")
+    os.environ["DATABASE_URL"] = url or f"sqlite+aiosqlite:///{sqlite_path}"
+    return os.environ["DATABASE_URL"]
+
+
+def vocabulary(size: int, rng: random.Random) -> list[str]:
+    words = list(dict.fromkeys(COMMON_WORDS))
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words[:size]
+
+
+def zipf_sampler(words: Sequence[str], rng: random.Random, exponent: float = 1.1) -> Callable[[int], list[str]]:
+    """Return ``sample(k)`` drawing k words with Zipfian frequencies (rank 1 most common)."""
+    cumulative, total = [], 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1.0 / rank**exponent
+        cumulative.append(total)
+    return lambda k: rng.choices(words, cum_weights=cumulative, k=k)
+
+
+def lognormal_length(rng: random.Random, median: float, sigma: float = 0.8, upper: int = 400) -> int:
+    return max(1, min(upper, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+def percentiles(samples_ms: Sequence[float]) -> dict[str, float]:
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def pick(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(pick(0.50), 3),
+        "p90": round(pick(0.90), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def print_table(title: str, rows: list[dict[str, Any]]) -> None:
+    print(f"\n{title}")
+    if not rows:
+        print("  (no rows)")
+        return
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    widths = {c: max(len(c), *(len(str(row.get(c, ""))) for row in rows)) for c in columns}
+    print("  " + "  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  " + "  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def rss_mb() -> float | None:
+    try:
+        import psutil
+
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+class MemoryProbe:
+    """Python heap peak (tracemalloc) and process RSS around a block of work."""
+
+    def __enter__(self) -> "MemoryProbe":
+        self.rss_before = rss_mb()
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.result = {
+            "heap_retained_mb": round(current / (1024 * 1024), 2),
+            "heap_peak_mb": round(peak / (1024 * 1024), 2),
+            "rss_mb": rss_mb(),
+            "rss_before_mb": self.rss_before,
+        }
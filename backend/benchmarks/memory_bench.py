@@ -0,0 +1,169 @@
+"""Conversation memory footprint and prompt-building cost.
+
+Builds the same synthetic threads (log-normal message lengths, Zipf vocabulary)
+as LangChain message objects, the previous in-memory representation, and as
+``Turn`` records, and reports traced heap bytes per conversation for each. It
+then times reading a thread and building the prompt history from it: copying
+the message list and windowing it before, windowing the shared tuple and
+materializing only the selected turns now.
+
+    cd backend
+    python -m benchmarks.memory_bench
+    python -m benchmarks.memory_bench --conversations 5000 --messages 20 --json memory.json
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.common import lognormal_length, percentiles, print_table, vocabulary, zipf_sampler
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=20, help="messages per conversation (memory keeps 20)")
+    parser.add_argument("--message-words", type=int, default=30, help="median words per message")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--reads", type=int, default=5000, help="history reads timed per representation")
+    parser.add_argument("--budget", type=int, default=2000, help="history token budget for the window")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    return parser.parse_args()
+
+
+def make_threads(args: argparse.Namespace) -> list[list[tuple[str, str]]]:
+    rng = random.Random(args.seed)
+    sample = zipf_sampler(vocabulary(args.vocabulary, rng), rng)
+    threads = []
+    for _ in range(args.conversations):
+        thread = []
+        for i in range(args.messages):
+            role = "user" if i % 2 == 0 else "assistant"
+            median = args.message_words if role == "user" else args.message_words * 3
+            thread.append((role, " ".join(sample(lognormal_length(rng, median)))))
+        threads.append(thread)
+    return threads
+
+
+def as_langchain(thread: list[tuple[str, str]]) -> list:
+    from langchain_core.messages import AIMessage, HumanMessage
+    from utils.token_budget import count_tokens
+
+    message_types = {"user": HumanMessage, "assistant": AIMessage}
+    return [
+        message_types[role](content=content, response_metadata={"token_count": count_tokens(content)})
+        for role, content in thread
+    ]
+
+
+def as_turns(thread: list[tuple[str, str]]) -> tuple:
+    from utils.conversation_memory import Turn
+
+    return tuple(Turn(role, content) for role, content in thread)
+
+
+def traced_bytes(build: Callable[[], Any]) -> tuple[Any, int]:
+    """Heap bytes retained by what ``build`` returns, excluding the shared message texts."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return built, retained
+
+
+def langchain_window(history: list, budget: int) -> list:
+    """The windowing the previous representation needed: per-message metadata lookups."""
+    from utils.token_budget import MESSAGE_OVERHEAD_TOKENS
+
+    start = len(history)
+    while start > 0:
+        cost = history[start - 1].response_metadata["token_count"] + MESSAGE_OVERHEAD_TOKENS
+        if cost > budget:
+            break
+        budget -= cost
+        start -= 1
+    return history[start:]
+
+
+def time_reads(read: Callable[[int], Any], count: int, conversations: int, rng: random.Random) -> dict[str, float]:
+    samples = []
+    for _ in range(count):
+        index = rng.randrange(conversations)
+        started = time.perf_counter()
+        read(index)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    from utils.conversation_memory import to_messages, window
+
+    threads = make_threads(args)
+    text_bytes = sum(len(content.encode("utf-8")) for thread in threads for _, content in thread)
+    print(f"{args.conversations} conversations x {args.messages} messages, {text_bytes / 1e6:.1f} MB of text")
+
+    # The texts already exist in ``threads``; both measurements share them, so
+    # the numbers are the per-message overhead each representation adds.
+    langchain_threads, langchain_bytes = traced_bytes(lambda: [as_langchain(t) for t in threads])
+    turn_threads, turn_bytes = traced_bytes(lambda: [as_turns(t) for t in threads])
+
+    per_conversation = [
+        {
+            "representation": "langchain messages",
+            "bytes_per_conversation": round(langchain_bytes / args.conversations),
+            "bytes_per_message": round(langchain_bytes / (args.conversations * args.messages)),
+            "total_mb": round(langchain_bytes / (1024 * 1024), 1),
+        },
+        {
+            "representation": "Turn records",
+            "bytes_per_conversation": round(turn_bytes / args.conversations),
+            "bytes_per_message": round(turn_bytes / (args.conversations * args.messages)),
+            "total_mb": round(turn_bytes / (1024 * 1024), 1),
+        },
+    ]
+    print_table("Memory overhead beyond message text (traced heap)", per_conversation)
+    saved = langchain_bytes - turn_bytes
+    print(f"\nSaved {saved / args.conversations:.0f} bytes per conversation ({saved / max(langchain_bytes, 1):.0%})")
+
+    def read_langchain(index: int) -> list:
+        # get_history used to copy the cached list; the prompt used the window directly.
+        return langchain_window(list(langchain_threads[index]), args.budget)
+
+    def read_turns(index: int) -> list:
+        return to_messages(window(turn_threads[index], args.budget))
+
+    reads = [
+        {"representation": "langchain messages", **time_reads(read_langchain, args.reads, args.conversations, random.Random(args.seed))},
+        {"representation": "Turn records", **time_reads(read_turns, args.reads, args.conversations, random.Random(args.seed))},
+    ]
+    print_table("History read + prompt window (ms)", reads)
+
+    return {
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "text_bytes": text_bytes,
+        "memory": per_conversation,
+        "bytes_saved_per_conversation": round(saved / args.conversations),
+        "reads_ms": reads,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    report = run(args)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, String, DateTime, Integer, Text, Boolean, text
+from sqlalchemy import Column, String, DateTime, Integer, Text, Boolean, Index, text
 from sqlalchemy.engine import make_url
 import os
 from datetime import datetime
@@ -24,7 +24,9 @@ def _to_async_postgres_url(url: str) -> str:
 
 
 def _postgres_connect_args(url: str) -> dict:
-    # Render and most hosted Postgres providers require TLS.
+    # Render and most hosted Postgres providers require TLS; DATABASE_SSL=disable for a local server.
+    if os.getenv("DATABASE_SSL", "require").strip().lower() == "disable":
+        return {"command_timeout": 10}
     return {"command_timeout": 10, "ssl": "require"}
 
 
@@ -91,16 +93,25 @@ class Conversation(Base):
     user_id = Column(String, nullable=False)
     title = Column(String)
     agent_type = Column(String)
+    # Rolling summary of every message created at or before summary_until.
+    summary = Column(Text, nullable=True)
+    summary_until = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Message(Base):
     __tablename__ = "messages"
+    # Thread tails (newest first) and keyset paging read this index backwards.
+    __table_args__ = (Index("ix_messages_conversation_created", "conversation_id", "created_at"),)
     
     id = Column(String, primary_key=True)
     conversation_id = Column(String, nullable=False)
     role = Column(String, nullable=False)  # user or assistant
     content = Column(Text, nullable=False)
+    # Estimated prompt tokens (utils.token_budget.count_tokens); NULL for rows saved before it existed.
+    token_count = Column(Integer, nullable=True)
+    # Assistant answer cut short (client went away mid-stream); NULL for rows saved before it existed.
+    truncated = Column(Boolean, default=False, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Document(Base):
@@ -147,6 +158,8 @@ CREATE TABLE IF NOT EXISTS conversations (
     user_id VARCHAR NOT NULL,
     title VARCHAR,
     agent_type VARCHAR,
+    summary TEXT,
+    summary_until TIMESTAMP,
     created_at TIMESTAMP,
     updated_at TIMESTAMP
 );
@@ -155,8 +168,11 @@ CREATE TABLE IF NOT EXISTS messages (
     conversation_id VARCHAR NOT NULL,
     role VARCHAR NOT NULL,
     content TEXT NOT NULL,
+    token_count INTEGER,
+    truncated BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS ix_messages_conversation_created ON messages (conversation_id, created_at);
 CREATE TABLE IF NOT EXISTS documents (
     id VARCHAR PRIMARY KEY,
     user_id VARCHAR NOT NULL,
@@ -216,6 +232,9 @@ async def init_db():
         )
 
     await _migrate_users_schema()
+    await _add_missing_columns("conversations", {"summary": "TEXT", "summary_until": "TIMESTAMP"})
+    await _add_missing_columns("messages", {"token_count": "INTEGER", "truncated": "BOOLEAN"})
+    await _ensure_indexes()
 
 
 async def _migrate_users_schema():
@@ -252,6 +271,42 @@ async def _migrate_users_schema():
 
         await conn.run_sync(sync_migrate)
 
+
+async def _add_missing_columns(table: str, columns: dict[str, str]):
+    """Add nullable columns (name -> SQL type) to an existing table that predates them."""
+    is_sqlite = "sqlite" in DATABASE_URL
+
+    async with engine.begin() as conn:
+        def sync_migrate(sync_conn):
+            from sqlalchemy import inspect
+
+            insp = inspect(sync_conn)
+            if table not in insp.get_table_names():
+                return
+            cols = {c["name"] for c in insp.get_columns(table)}
+            for name, sql_type in columns.items():
+                if name in cols:
+                    continue
+                if is_sqlite:
+                    sync_conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+                else:
+                    sync_conn.execute(
+                        text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {sql_type}")
+                    )
+
+        await conn.run_sync(sync_migrate)
+
+
+async def _ensure_indexes():
+    """Create indexes added after the first release (create_all skips existing tables)."""
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_messages_conversation_created "
+                "ON messages (conversation_id, created_at)"
+            )
+        )
+
 # Get database session
 async def get_db():
     async with async_session_maker() as session:
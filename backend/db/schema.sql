@@ -19,6 +19,8 @@ CREATE TABLE IF NOT EXISTS conversations (
     user_id VARCHAR NOT NULL,
     title VARCHAR,
     agent_type VARCHAR,
+    summary TEXT,
+    summary_until TIMESTAMP,
     created_at TIMESTAMP,
     updated_at TIMESTAMP
 );
@@ -28,9 +30,13 @@ CREATE TABLE IF NOT EXISTS messages (
     conversation_id VARCHAR NOT NULL,
     role VARCHAR NOT NULL,
     content TEXT NOT NULL,
+    token_count INTEGER,
+    truncated BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS ix_messages_conversation_created ON messages (conversation_id, created_at);
+
 CREATE TABLE IF NOT EXISTS documents (
     id VARCHAR PRIMARY KEY,
     user_id VARCHAR NOT NULL,
@@ -53,3 +59,9 @@ CREATE TABLE IF NOT EXISTS tasks (
     created_at TIMESTAMP,
     updated_at TIMESTAMP
 );
+
+-- Columns added after the first release (no-ops when already present).
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_until TIMESTAMP;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS token_count INTEGER;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS truncated BOOLEAN DEFAULT FALSE;
@@ -0,0 +1,184 @@
+"""Bulk document upload: many files and/or zip archives in one request.
+
+Files are copied to storage in chunks (never read fully into memory), committed
+to the document index in one batch, then RAG-indexed with bounded parallelism.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import zipfile
+from typing import Any, AsyncIterator, BinaryIO, Callable
+
+from utils.document_store import build_record, commit_records, new_upload_path
+from utils.logger import logger
+
+CHUNK_SIZE = 1024 * 1024
+MAX_BULK_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "200"))
+MAX_FILE_BYTES = int(os.getenv("BULK_UPLOAD_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_ARCHIVE_BYTES = int(os.getenv("BULK_UPLOAD_MAX_ARCHIVE_BYTES", str(500 * 1024 * 1024)))
+INDEX_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", "4"))
+
+
+def _is_archive(filename: str) -> bool:
+    return filename.lower().endswith(".zip")
+
+
+def _copy_to_storage(src: BinaryIO, *, user_id: str, filename: str) -> dict[str, Any]:
+    """Stream src into the user's upload dir; returns an uncommitted record."""
+    doc_id, safe_name, file_path = new_upload_path(user_id=user_id, filename=filename)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(file_path, "wb") as out:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > MAX_FILE_BYTES:
+                    raise ValueError(f"File is larger than {MAX_FILE_BYTES // (1024 * 1024)} MB")
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise ValueError("Empty file")
+    except Exception:
+        file_path.unlink(missing_ok=True)
+        raise
+
+    return build_record(
+        doc_id=doc_id,
+        user_id=user_id,
+        filename=safe_name,
+        file_path=file_path,
+        size=size,
+        content_hash=digest.hexdigest(),
+    )
+
+
+def _archive_members(archive: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    members = []
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name.rstrip("/"))
+        if info.is_dir() or name.startswith("__MACOSX/") or not base or base.startswith("."):
+            continue
+        members.append(info)
+    return members
+
+
+def _store_one(
+    src: BinaryIO, filename: str, user_id: str, budget: int
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """Store a plain file or the members of a zip archive, at most ``budget`` of them.
+
+    Returns (records, events).
+    """
+    records: list[dict[str, Any]] = []
+    events: list[dict[str, Any]] = []
+
+    def stored(record: dict[str, Any], label: str) -> None:
+        records.append(record)
+        events.append(
+            {
+                "file": label,
+                "status": "stored",
+                "document_id": record["id"],
+                "size": record["size"],
+            }
+        )
+
+    def failed(label: str, error: Exception) -> None:
+        events.append({"file": label, "status": "failed", "error": str(error)})
+
+    if not _is_archive(filename):
+        try:
+            stored(_copy_to_storage(src, user_id=user_id, filename=filename), filename)
+        except Exception as e:
+            failed(filename, e)
+        return records, events
+
+    try:
+        archive = zipfile.ZipFile(src)
+    except zipfile.BadZipFile as e:
+        failed(filename, e)
+        return records, events
+
+    with archive:
+        members = _archive_members(archive)
+        declared = sum(m.file_size for m in members)
+        if len(members) > MAX_BULK_FILES or declared > MAX_ARCHIVE_BYTES:
+            failed(filename, ValueError("Archive has too many files or is too large to extract"))
+            return records, events
+        for member in members:
+            label = f"{filename}/{member.filename}"
+            if len(records) >= budget:
+                failed(label, ValueError("Too many files in one upload"))
+                continue
+            try:
+                with archive.open(member) as member_src:
+                    stored(
+                        _copy_to_storage(member_src, user_id=user_id, filename=member.filename),
+                        label,
+                    )
+            except Exception as e:
+                failed(label, e)
+
+    return records, events
+
+
+async def store_uploads(
+    uploads: list[tuple[BinaryIO, str]],
+    *,
+    user_id: str,
+    records: list[dict[str, Any]],
+) -> AsyncIterator[dict[str, Any]]:
+    """Store (file object, filename) pairs, yielding each upload's events as it is stored.
+
+    Stored records are appended to ``records`` and committed in one index write
+    once every upload is stored (or the caller stops early), at most
+    ``MAX_BULK_FILES`` of them across all plain files and archive members.
+    """
+    uid = str(user_id)
+    try:
+        for src, filename in uploads:
+            budget = MAX_BULK_FILES - len(records)
+            if budget <= 0:
+                yield {"file": filename, "status": "failed", "error": "Too many files in one upload"}
+                continue
+            file_records, file_events = await asyncio.to_thread(_store_one, src, filename, uid, budget)
+            records.extend(file_records)
+            for event in file_events:
+                yield event
+    finally:
+        commit_records(records)
+
+
+async def index_uploads(
+    records: list[dict[str, Any]],
+    get_rag_pipeline: Callable[[], Any],
+) -> AsyncIterator[dict[str, Any]]:
+    """RAG-index stored records with bounded parallelism, yielding one event per file."""
+    if not records:
+        return
+    try:
+        pipeline = get_rag_pipeline()
+    except Exception as e:
+        logger.warning(f"RAG indexing skipped: {e}")
+        for record in records:
+            yield {"file": record["filename"], "document_id": record["id"], "status": "index_skipped"}
+        return
+
+    semaphore = asyncio.Semaphore(max(INDEX_CONCURRENCY, 1))
+
+    async def index_one(record: dict[str, Any]) -> dict[str, Any]:
+        event = {"file": record["filename"], "document_id": record["id"]}
+        async with semaphore:
+            try:
+                await pipeline.add_document(record["file_path"], record["filename"])
+                event["status"] = "indexed"
+            except Exception as e:
+                logger.warning(f"RAG indexing failed for {record['filename']}: {e}")
+                event.update({"status": "index_skipped", "error": str(e)})
+        return event
+
+    for next_done in asyncio.as_completed([index_one(r) for r in records]):
+        yield await next_done
@@ -1,14 +1,23 @@
 """Shared chat preparation and database persistence."""
 from __future__ import annotations
 
+import base64
+import json
 import uuid
 from datetime import datetime
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import and_, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.database import Conversation, Message
+from utils.message_writer import message_writer
+from utils.search_index import KIND_CONVERSATION, entry, index_queue
+from utils.step_graph import StepTimings
+from utils.suggestion_index import suggestion_index
+
+# Recent per-step durations of chat turn preparation (see app._prepare_chat_turn).
+turn_prep_timings = StepTimings()
 
 
 def build_document_context(document_ids: list[str], user_id: str) -> tuple[list[dict[str, Any]], list[str]]:
@@ -58,53 +67,94 @@ async def ensure_conversation(
 
     conv_id = str(uuid.uuid4())
     title = (first_message.strip()[:60] or "New chat").replace("\n", " ")
+    now = datetime.utcnow()
     db.add(
         Conversation(
             id=conv_id,
             user_id=uid,
             title=title,
             agent_type="general",
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
+            created_at=now,
+            updated_at=now,
         )
     )
     await db.commit()
+    index_queue.upsert(entry(KIND_CONVERSATION, conv_id, user_id=uid, title=title, ts=now))
+    suggestion_index.add(uid, title)
     return conv_id
 
 
-async def save_message(
+def encode_message_cursor(created_at: datetime, message_id: str) -> str:
+    payload = [created_at.isoformat(), message_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_message_cursor(cursor: str) -> tuple[datetime, str]:
+    """Keyset position (created_at, id). Raises ValueError for a malformed cursor."""
+    try:
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), str(message_id)
+    except Exception as e:
+        raise ValueError("Invalid message cursor") from e
+
+
+async def load_message_tail(
     db: AsyncSession,
-    *,
     conversation_id: str,
-    role: str,
-    content: str,
-) -> str:
-    msg_id = str(uuid.uuid4())
-    db.add(
-        Message(
-            id=msg_id,
-            conversation_id=conversation_id,
-            role=role,
-            content=content,
-            created_at=datetime.utcnow(),
+    columns: Sequence[Any],
+    *,
+    limit: int,
+    before: tuple[datetime, str] | None = None,
+    after: datetime | None = None,
+) -> list[Any]:
+    """The newest ``limit`` messages (oldest first) older than the ``before`` keyset
+    and newer than ``after``; reads the (conversation_id, created_at) index backwards."""
+    query = select(*columns).where(Message.conversation_id == conversation_id)
+    if after is not None:
+        query = query.where(Message.created_at > after)
+    if before is not None:
+        created_at, message_id = before
+        query = query.where(
+            or_(
+                Message.created_at < created_at,
+                and_(Message.created_at == created_at, Message.id < message_id),
+            )
         )
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+    rows = (await db.execute(query)).all()
+    rows.reverse()
+    return rows
+
+
+async def load_messages_for_memory(db: AsyncSession, conversation_id: str) -> list[tuple]:
+    """(role, content, token_count) rows for conversation memory: only the thread's tail.
+
+    With rolling summaries on, a ``("summary", text)`` pair comes first and only
+    messages newer than the summary follow. ``token_count`` is None for rows saved
+    before counts were stored.
+    """
+    from utils.conversation_memory import MAX_MESSAGES
+    from utils.conversation_summary import SUMMARY_ENABLED
+
+    await message_writer.sync(conversation_id)
+    pairs: list[tuple] = []
+    after = None
+    if SUMMARY_ENABLED:
+        result = await db.execute(
+            select(Conversation.summary, Conversation.summary_until).where(Conversation.id == conversation_id)
+        )
+        row = result.first()
+        if row is not None and row.summary and row.summary_until is not None:
+            pairs.append(("summary", row.summary))
+            after = row.summary_until
+    rows = await load_message_tail(
+        db,
+        conversation_id,
+        (Message.role, Message.content, Message.token_count),
+        limit=MAX_MESSAGES,
+        after=after,
     )
-    result = await db.execute(select(Conversation).where(Conversation.id == conversation_id))
-    conv = result.scalar_one_or_none()
-    if conv:
-        conv.updated_at = datetime.utcnow()
-    await db.commit()
-    return msg_id
-
-
-async def load_messages_for_memory(db: AsyncSession, conversation_id: str) -> list[tuple[str, str]]:
-    result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
-    )
-    rows = result.scalars().all()
-    return [(m.role, m.content) for m in rows]
+    return pairs + [tuple(row) for row in rows]
 
 
 def resolve_agent_and_context(
@@ -0,0 +1,227 @@
+"""Per-phase latency of chat turns.
+
+Each turn of ``/api/chat`` and ``/api/chat/stream`` gets a ``TurnTrace`` (the
+``turn_trace`` dependency, declared before the auth dependency). Phases add
+their milliseconds to it: the endpoint marks ``auth``, turn preparation maps
+its step timings onto ``db``, ``document_extraction`` and ``rag_search``, and
+the agent records ``prompt_build``, ``llm_first_token`` (streaming only) and
+``llm_generation`` through the context variable. ``finish`` adds ``total`` and
+``tokens_per_second`` and observes everything in fixed-bucket histograms
+labeled by endpoint, agent and model, served at /api/metrics/chat-latency.
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator
+
+AUTH = "auth"
+DB = "db"
+DOCUMENT_EXTRACTION = "document_extraction"
+RAG_SEARCH = "rag_search"
+PROMPT_BUILD = "prompt_build"
+FIRST_TOKEN = "llm_first_token"
+GENERATION = "llm_generation"
+TOKENS_PER_SECOND = "tokens_per_second"
+TOTAL = "total"
+
+# Turn preparation steps (see app._prepare_chat_turn) and the phase they count toward.
+PREP_PHASES = {
+    "conversation": DB,
+    "history": DB,
+    "documents": DOCUMENT_EXTRACTION,
+    "rag": RAG_SEARCH,
+}
+
+LATENCY_BOUNDS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 60000, 120000)
+RATE_BOUNDS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 1000)
+# Models come from the request; past this many label sets new ones share an "other" series.
+MAX_SERIES = 200
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate, interpolating linearly inside the bucket holding the q-th observation."""
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else None,
+            "p50": round(self.quantile(0.5), 2),
+            "p95": round(self.quantile(0.95), 2),
+            "p99": round(self.quantile(0.99), 2),
+            "max": round(self.max, 2),
+            "buckets": buckets,
+        }
+
+
+class ChatLatency:
+    def __init__(self, max_series: int = MAX_SERIES):
+        self.max_series = max_series
+        self._series: dict[tuple[str, str, str], dict[str, Histogram]] = {}
+
+    def record(self, endpoint: str, agent: str, model: str | None, spans: dict[str, float]) -> None:
+        labels = (endpoint, agent, model or "default")
+        series = self._series.get(labels)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                labels = (endpoint, agent, "other")
+            series = self._series.setdefault(labels, {})
+        for phase, value in spans.items():
+            histogram = series.get(phase)
+            if histogram is None:
+                bounds = RATE_BOUNDS if phase == TOKENS_PER_SECOND else LATENCY_BOUNDS_MS
+                histogram = series[phase] = Histogram(bounds)
+            histogram.observe(value)
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "endpoint": endpoint,
+                "agent": agent,
+                "model": model,
+                "phases": {phase: histogram.snapshot() for phase, histogram in series.items()},
+            }
+            for (endpoint, agent, model), series in sorted(self._series.items())
+        ]
+
+
+chat_latency = ChatLatency()
+
+
+class StreamCancellations:
+    """Streamed turns the client abandoned, and the output tokens cancelling them saved.
+
+    The upstream stream stops when the client goes away, so a cancelled turn
+    saves the output it would still have produced, estimated as the median
+    output of recently completed turns minus what had been streamed.
+    """
+
+    def __init__(self, window: int = 500):
+        self._completed_tokens: deque[int] = deque(maxlen=window)
+        self.completed = 0
+        self.cancelled = 0
+        self.partial_tokens = 0
+        self.estimated_tokens_saved = 0
+
+    def record(self, output_tokens: int, cancelled: bool) -> None:
+        if not cancelled:
+            self.completed += 1
+            self._completed_tokens.append(output_tokens)
+            return
+        self.cancelled += 1
+        self.partial_tokens += output_tokens
+        if self._completed_tokens:
+            typical = sorted(self._completed_tokens)[len(self._completed_tokens) // 2]
+            self.estimated_tokens_saved += max(typical - output_tokens, 0)
+
+    def stats(self) -> dict[str, Any]:
+        turns = self.completed + self.cancelled
+        return {
+            "completed_turns": self.completed,
+            "cancelled_turns": self.cancelled,
+            "cancel_rate": round(self.cancelled / turns, 3) if turns else None,
+            "partial_tokens_streamed": self.partial_tokens,
+            "estimated_tokens_saved": self.estimated_tokens_saved,
+        }
+
+
+stream_cancellations = StreamCancellations()
+
+
+class TurnTrace:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans: dict[str, float] = {}
+
+    def add(self, phase: str, ms: float) -> None:
+        self.spans[phase] = round(self.spans.get(phase, 0.0) + ms, 2)
+
+    def mark(self, phase: str) -> None:
+        """Record the time from the start of the turn until now as ``phase``."""
+        self.add(phase, (time.perf_counter() - self.started) * 1000)
+
+    def finish(self, agent: str, model: str | None, output: str | None = None) -> dict[str, float]:
+        from utils.token_budget import count_tokens
+
+        self.mark(TOTAL)
+        # Output rate after the first token when streaming, over the whole call otherwise.
+        generation_ms = self.spans.get(GENERATION, 0.0) - self.spans.get(FIRST_TOKEN, 0.0)
+        if output and generation_ms > 0:
+            self.spans[TOKENS_PER_SECOND] = round(count_tokens(output) / (generation_ms / 1000), 2)
+        chat_latency.record(self.endpoint, agent, model, self.spans)
+        return self.spans
+
+
+_current: ContextVar[TurnTrace | None] = ContextVar("chat_turn_trace", default=None)
+
+
+def start_trace(endpoint: str) -> TurnTrace:
+    """Start a turn's trace and make it current (for this task) for the agent."""
+    trace = TurnTrace(endpoint)
+    _current.set(trace)
+    return trace
+
+
+def turn_trace(endpoint: str) -> Callable[[], Awaitable[TurnTrace]]:
+    """Dependency starting the turn's trace."""
+
+    async def start() -> TurnTrace:
+        return start_trace(endpoint)
+
+    return start
+
+
+def record(phase: str, ms: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.add(phase, ms)
+
+
+def record_prep(timings: dict[str, float]) -> None:
+    """Count turn preparation step timings toward their phases."""
+    for step, phase in PREP_PHASES.items():
+        if step in timings:
+            record(phase, timings[step])
+
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, (time.perf_counter() - started) * 1000)
@@ -1,36 +1,471 @@
-"""Shared in-memory conversation history (all agent types use the same thread)."""
+"""Shared conversation history (all agent types use the same thread).
+
+History is kept by a pluggable ``MemoryBackend``:
+
+- ``InProcessMemoryBackend`` (default): a bounded LRU with a global byte budget
+  and a per-entry TTL, private to each worker process.
+- ``RedisMemoryBackend`` (``CONVERSATION_MEMORY_BACKEND=redis``): one shared
+  copy for every worker, so a thread is hydrated once and edits such as
+  truncation are seen everywhere.
+
+Threads are stored as compact ``Turn`` records (role, content, token_count),
+not LangChain message objects; ``to_messages`` materializes only the turns that
+``window`` picks for a prompt. A thread whose older turns were condensed (see
+``utils.conversation_summary``) starts with one ``summary`` turn, which is kept
+when the thread is trimmed. Evicted or expired threads simply read as missing and are
+re-hydrated from the database by the chat path (see ``is_cached``/``hydrate``).
+"""
 from __future__ import annotations
 
-from langchain_core.messages import AIMessage, HumanMessage
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Sequence
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils.logger import logger
+from utils.token_budget import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+MAX_MESSAGES = 20
+MAX_BYTES = int(os.getenv("CONVERSATION_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("CONVERSATION_MEMORY_TTL_SECONDS", "3600"))
+BACKEND = os.getenv("CONVERSATION_MEMORY_BACKEND", "memory").strip().lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+USER, ASSISTANT, SUMMARY = "user", "assistant", "summary"
+_SUMMARY_PREFIX_TOKENS = count_tokens(SUMMARY_PREFIX)
+
+
+class Turn:
+    """One history entry: ``role`` is user, assistant or summary (the DB roles)."""
+
+    __slots__ = ("role", "content", "token_count")
+
+    def __init__(self, role: str, content: str, token_count: int | None = None):
+        self.role = role
+        self.content = content
+        self.token_count = count_tokens(content) if token_count is None else token_count
+
+    def __repr__(self) -> str:
+        return f"Turn({self.role!r}, {self.content[:40]!r}, {self.token_count})"
+
+
+# Record, its slot in the thread's tuple and the small int, beyond the text itself.
+_TURN_OVERHEAD = sys.getsizeof(Turn(USER, "", 0)) + 8 + 28
+
+
+def summary_turn(summary: str) -> Turn:
+    return Turn(SUMMARY, summary, count_tokens(summary) + _SUMMARY_PREFIX_TOKENS)
+
+
+def to_messages(turns: Sequence[Turn]) -> list:
+    """LangChain messages for the given turns (done only when a prompt is built)."""
+    messages = []
+    for turn in turns:
+        if turn.role == USER:
+            messages.append(HumanMessage(content=turn.content))
+        elif turn.role == ASSISTANT:
+            messages.append(AIMessage(content=turn.content))
+        elif turn.role == SUMMARY:
+            messages.append(SystemMessage(content=SUMMARY_PREFIX + turn.content))
+    return messages
+
+
+def window(history: Sequence[Turn], budget: int) -> list[Turn]:
+    """The summary turn (if any) plus the newest turns that fit in ``budget`` tokens."""
+    summary, turns = _split_summary(history)
+    selected = [summary] if summary is not None else []
+    budget -= sum(t.token_count + MESSAGE_OVERHEAD_TOKENS for t in selected)
+    start = len(turns)
+    while start > 0:
+        cost = turns[start - 1].token_count + MESSAGE_OVERHEAD_TOKENS
+        if cost > budget:
+            break
+        budget -= cost
+        start -= 1
+    return selected + list(turns[start:])
+
+
+def _split_summary(turns: Sequence[Turn]) -> tuple[Turn | None, Sequence[Turn]]:
+    if turns and turns[0].role == SUMMARY:
+        return turns[0], turns[1:]
+    return None, turns
+
+
+def _turn_bytes(turn: Turn) -> int:
+    return _TURN_OVERHEAD + sys.getsizeof(turn.content)
+
+
+class _Entry:
+    __slots__ = ("turns", "nbytes", "expires_at")
+
+    def __init__(self, turns: tuple[Turn, ...], ttl: float):
+        self.turns = turns
+        self.nbytes = sum(_turn_bytes(t) for t in turns)
+        self.expires_at = time.monotonic() + ttl
+
+
+class ConversationMemoryStore:
+    """LRU of conversation histories bounded by total bytes, with per-entry TTL."""
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_BYTES,
+        ttl_seconds: float = TTL_SECONDS,
+        max_messages: int = MAX_MESSAGES,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, conversation_id: str) -> _Entry | None:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(conversation_id)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(conversation_id)
+        return entry
+
+    def _drop(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _put(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        self._drop(conversation_id)
+        summary, rest = _split_summary(turns)
+        kept = tuple(rest[-self.max_messages :])
+        entry = _Entry((summary, *kept) if summary else kept, self.ttl_seconds)
+        self._entries[conversation_id] = entry
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def get(self, conversation_id: str) -> tuple[Turn, ...] | None:
+        """The cached history, or None if the thread is not (or no longer) in memory.
+
+        The tuple is shared, not copied: turns are never mutated in place.
+        """
+        entry = self._lookup(conversation_id)
+        return entry.turns if entry is not None else None
+
+    def contains(self, conversation_id: str) -> bool:
+        """Whether the thread is in memory; counted as a hit or miss for the chat path."""
+        found = self._lookup(conversation_id) is not None
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def set(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        self._put(conversation_id, turns)
+
+    def extend(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        """Append to a cached thread. Uncached threads are left alone: appending to a
+        partial history would hide older turns, and the next turn re-hydrates from the DB."""
+        entry = self._lookup(conversation_id)
+        if entry is not None:
+            self._put(conversation_id, entry.turns + tuple(turns))
+
+    def clear(self, conversation_id: str) -> None:
+        self._drop(conversation_id)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class MemoryBackend(ABC):
+    """Where conversation histories (sequences of ``Turn``) are kept."""
+
+    name = "abstract"
+
+    @abstractmethod
+    async def get(self, conversation_id: str) -> Sequence[Turn] | None:
+        """The history, or None if the thread is not cached."""
+
+    async def get_many(self, conversation_ids: list[str]) -> dict[str, Sequence[Turn] | None]:
+        return {cid: await self.get(cid) for cid in conversation_ids}
+
+    @abstractmethod
+    async def contains(self, conversation_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def set(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        ...
+
+    @abstractmethod
+    async def extend(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        """Append to a cached thread; uncached threads are left alone."""
+
+    @abstractmethod
+    async def delete(self, conversation_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> dict[str, Any]:
+        ...
+
+
+class InProcessMemoryBackend(MemoryBackend):
+    name = "memory"
+
+    def __init__(self, store: ConversationMemoryStore | None = None):
+        self.store = store or ConversationMemoryStore()
+
+    async def get(self, conversation_id: str) -> Sequence[Turn] | None:
+        return self.store.get(conversation_id)
+
+    async def contains(self, conversation_id: str) -> bool:
+        return self.store.contains(conversation_id)
+
+    async def set(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        self.store.set(conversation_id, turns)
+
+    async def extend(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        self.store.extend(conversation_id, turns)
+
+    async def delete(self, conversation_id: str) -> None:
+        self.store.clear(conversation_id)
+
+    async def stats(self) -> dict[str, Any]:
+        return {"backend": self.name, **self.store.stats()}
+
+
+# Redis layout: one list per thread. Element 0 is a header, so a new (empty)
+# thread still exists as a key; each message is one element: a one-letter role
+# code, the token count, a \x1f separator and the raw text. A rolling summary,
+# if any, is a separate string key next to the list.
+_HEADER = "\x00v2"
+_ROLE_CODES = {USER: "u", ASSISTANT: "a"}
+_CODE_ROLES = {"u": USER, "a": ASSISTANT}
+_SEP = "\x1f"
+
+
+def _encode(turn: Turn) -> str:
+    return f"{_ROLE_CODES.get(turn.role, 'u')}{turn.token_count}{_SEP}{turn.content}"
+
+
+def _decode(raw: bytes | str) -> Turn | None:
+    value = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+    role = _CODE_ROLES.get(value[:1])
+    if role is None:
+        return None
+    count, sep, content = value[1:].partition(_SEP)
+    if not (sep and count.isdigit()):
+        return None
+    return Turn(role, content, int(count))
+
+
+class RedisMemoryBackend(MemoryBackend):
+    """Histories shared by all workers, stored as compact Redis lists.
+
+    Appends are RPUSHX + LTRIM in one transaction, so concurrent workers never
+    read-modify-write a thread; reads fetch and refresh the TTL in one round trip.
+    Redis errors degrade to cache misses (the chat path re-hydrates from the DB).
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        client: Any = None,
+        *,
+        url: str = REDIS_URL,
+        ttl_seconds: float = TTL_SECONDS,
+        max_messages: int = MAX_MESSAGES,
+        prefix: str = "convmem:",
+    ):
+        if client is None:
+            import redis.asyncio as redis
+
+            client = redis.from_url(url)
+        self.client = client
+        self.ttl = max(int(ttl_seconds), 1)
+        self.max_messages = max_messages
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self.prefix}{conversation_id}"
+
+    def _summary_key(self, conversation_id: str) -> str:
+        return f"{self.prefix}{conversation_id}:summary"
+
+    def _failed(self, action: str, error: Exception) -> None:
+        self.errors += 1
+        logger.warning(f"Redis conversation memory {action} failed: {error}")
+
+    def _decode_history(self, raw: list, summary: bytes | str | None) -> list[Turn] | None:
+        if not raw:
+            return None
+        history = [t for t in (_decode(item) for item in raw[1:]) if t is not None]
+        if summary:
+            text = summary.decode("utf-8") if isinstance(summary, bytes) else summary
+            history.insert(0, summary_turn(text))
+        return history
+
+    async def get(self, conversation_id: str) -> Sequence[Turn] | None:
+        return (await self.get_many([conversation_id]))[conversation_id]
+
+    async def get_many(self, conversation_ids: list[str]) -> dict[str, Sequence[Turn] | None]:
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for cid in conversation_ids:
+                    pipe.lrange(self._key(cid), 0, -1)
+                    pipe.get(self._summary_key(cid))
+                    pipe.expire(self._key(cid), self.ttl)
+                    pipe.expire(self._summary_key(cid), self.ttl)
+                replies = await pipe.execute()
+        except Exception as e:
+            self._failed("read", e)
+            return {cid: None for cid in conversation_ids}
+        return {
+            cid: self._decode_history(replies[4 * i], replies[4 * i + 1])
+            for i, cid in enumerate(conversation_ids)
+        }
+
+    async def contains(self, conversation_id: str) -> bool:
+        try:
+            found = bool(await self.client.expire(self._key(conversation_id), self.ttl))
+        except Exception as e:
+            self._failed("lookup", e)
+            found = False
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    async def set(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        key, summary_key = self._key(conversation_id), self._summary_key(conversation_id)
+        summary, rest = _split_summary(turns)
+        encoded = [_encode(t) for t in rest[-self.max_messages :]]
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(key, summary_key)
+                pipe.rpush(key, _HEADER, *encoded)
+                pipe.expire(key, self.ttl)
+                if summary is not None:
+                    pipe.set(summary_key, summary.content, ex=self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            self._failed("write", e)
+
+    async def extend(self, conversation_id: str, turns: Sequence[Turn]) -> None:
+        key = self._key(conversation_id)
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.rpushx(key, *[_encode(t) for t in turns])
+                # Keep the header plus the newest max_messages: trim to one extra
+                # element and overwrite the first with the header again.
+                pipe.ltrim(key, -(self.max_messages + 1), -1)
+                pipe.lset(key, 0, _HEADER)
+                pipe.expire(key, self.ttl)
+                pipe.expire(self._summary_key(conversation_id), self.ttl)
+                # LSET fails on a missing key; that just means the thread is not cached.
+                await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            self._failed("append", e)
+
+    async def delete(self, conversation_id: str) -> None:
+        try:
+            await self.client.delete(self._key(conversation_id), self._summary_key(conversation_id))
+        except Exception as e:
+            self._failed("delete", e)
+
+    async def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "errors": self.errors,
+        }
+
+
+def _create_backend() -> MemoryBackend:
+    if BACKEND == "redis":
+        return RedisMemoryBackend()
+    return InProcessMemoryBackend()
+
+
+_backend: MemoryBackend = _create_backend()
+
+
+def set_backend(backend: MemoryBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> MemoryBackend:
+    return _backend
+
+
+async def get_history(conversation_id: str) -> Sequence[Turn]:
+    return await _backend.get(conversation_id) or ()
+
+
+async def is_cached(conversation_id: str) -> bool:
+    return await _backend.contains(conversation_id)
 
-_MAX_MESSAGES = 20
-_store: dict[str, list] = {}
 
+async def append_exchange(conversation_id: str, human: str, ai: str) -> None:
+    await _backend.extend(conversation_id, (Turn(USER, human), Turn(ASSISTANT, ai)))
 
-def get_history(conversation_id: str) -> list:
-    return list(_store.get(conversation_id, []))
 
+async def clear(conversation_id: str) -> None:
+    await _backend.delete(conversation_id)
 
-def append_exchange(conversation_id: str, human: str, ai: str) -> None:
-    if conversation_id not in _store:
-        _store[conversation_id] = []
-    _store[conversation_id].append(HumanMessage(content=human))
-    _store[conversation_id].append(AIMessage(content=ai))
-    if len(_store[conversation_id]) > _MAX_MESSAGES:
-        _store[conversation_id] = _store[conversation_id][-_MAX_MESSAGES:]
 
+async def hydrate(conversation_id: str, messages: list[tuple]) -> None:
+    """Load DB messages into memory for a conversation (an empty list marks a new thread).
 
-def clear(conversation_id: str) -> None:
-    _store.pop(conversation_id, None)
+    Rows are ``(role, content)`` or ``(role, content, token_count)``; a missing or
+    None count is computed here. A leading ``("summary", text)`` row becomes the
+    thread's summary message.
+    """
+    history = []
+    if messages and messages[0][0] == SUMMARY:
+        history.append(summary_turn(messages[0][1]))
+        messages = messages[1:]
+    for role, content, *rest in messages[-MAX_MESSAGES:]:
+        if role in (USER, ASSISTANT):
+            history.append(Turn(role, content, rest[0] if rest else None))
+    await _backend.set(conversation_id, history)
 
 
-def hydrate(conversation_id: str, messages: list[tuple[str, str]]) -> None:
-    """Load DB messages into memory for a conversation."""
-    _store[conversation_id] = []
-    for role, content in messages:
-        if role == "user":
-            _store[conversation_id].append(HumanMessage(content=content))
-        elif role == "assistant":
-            _store[conversation_id].append(AIMessage(content=content))
-    if len(_store[conversation_id]) > _MAX_MESSAGES:
-        _store[conversation_id] = _store[conversation_id][-_MAX_MESSAGES:]
+async def stats() -> dict[str, Any]:
+    return await _backend.stats()
@@ -0,0 +1,114 @@
+"""Rolling summaries of long conversations.
+
+After each exchange the chat path calls ``schedule_summary``. Once a thread has
+``SUMMARY_TRIGGER_MESSAGES`` messages newer than its summary, a background task
+asks a cheap model to fold all but the newest ``SUMMARY_KEEP_RECENT`` of them
+into the running summary, stores it on the conversation (``summary`` and
+``summary_until``) and drops the cached thread, which the next turn reloads as
+summary + recent turns.
+Prompts therefore stay roughly the same size however long a thread grows.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import Conversation, Message, async_session_maker
+from utils.logger import logger
+
+SUMMARY_ENABLED = os.getenv("CONVERSATION_SUMMARY", "on").strip().lower() not in ("off", "false", "0")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "16"))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+# Messages folded in per model call; a long legacy thread is caught up over several calls.
+_MAX_MESSAGES_PER_PASS = 40
+_MAX_CHARS_PER_MESSAGE = 2000
+
+SUMMARIZER_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the new messages into the existing summary. Keep facts, decisions, names, numbers, "
+    "open questions and the user's preferences; drop pleasantries. Write at most 250 words "
+    "of plain prose and reply with the summary only."
+)
+
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def schedule_summary(conversation_id: str) -> None:
+    """Start a background summary pass for the conversation unless one is running."""
+    if not SUMMARY_ENABLED or conversation_id in _inflight:
+        return
+    task = asyncio.create_task(_summarize(conversation_id))
+    _inflight[conversation_id] = task
+    task.add_done_callback(lambda _t: _inflight.pop(conversation_id, None))
+
+
+def _transcript(rows: list) -> str:
+    lines = []
+    for role, content in rows:
+        speaker = "User" if role == "user" else "Assistant"
+        lines.append(f"{speaker}: {content[:_MAX_CHARS_PER_MESSAGE]}")
+    return "\n\n".join(lines)
+
+
+async def _summarize(conversation_id: str) -> None:
+    from utils import conversation_memory
+    from utils.llm_factory import create_llm
+
+    # Reads committed messages only: the newest turns may still be in the message
+    # writer's queue, and they are the ones kept verbatim anyway.
+    try:
+        async with async_session_maker() as db:
+            conv = await db.get(Conversation, conversation_id)
+            if conv is None:
+                return
+            updated = False
+            while True:
+                query = (
+                    select(Message.role, Message.content, Message.created_at)
+                    .where(Message.conversation_id == conversation_id)
+                    .order_by(Message.created_at.asc())
+                )
+                if conv.summary_until is not None:
+                    query = query.where(Message.created_at > conv.summary_until)
+                rows = (await db.execute(query.limit(_MAX_MESSAGES_PER_PASS + SUMMARY_KEEP_RECENT + 1))).all()
+                if len(rows) < SUMMARY_TRIGGER_MESSAGES:
+                    break
+                older = rows[: min(len(rows) - SUMMARY_KEEP_RECENT, _MAX_MESSAGES_PER_PASS)]
+
+                prompt = (
+                    f"Existing summary:\n{conv.summary or '(none yet)'}\n\n"
+                    f"New messages:\n{_transcript([(r.role, r.content) for r in older])}"
+                )
+                response = await create_llm(SUMMARY_MODEL).ainvoke(
+                    [SystemMessage(content=SUMMARIZER_PROMPT), HumanMessage(content=prompt)]
+                )
+                summary = (response.content or "").strip()
+                if not summary:
+                    break
+                conv.summary = summary
+                conv.summary_until = older[-1].created_at
+                await db.commit()
+                updated = True
+
+            if updated:
+                # Drop the cached thread rather than rewriting it: a turn may be in flight, and
+                # the next one re-hydrates as summary + recent turns from committed rows.
+                await conversation_memory.clear(conversation_id)
+                logger.info(f"Updated rolling summary for conversation {conversation_id}")
+    except Exception as e:
+        # The thread keeps working without a summary; the next exchange retries.
+        logger.warning(f"Conversation summary failed for {conversation_id}: {e}")
+
+
+async def reset_summary(db: AsyncSession, conv: Conversation, cutoff: datetime) -> None:
+    """Drop the summary if it covers messages at or after ``cutoff`` (e.g. after truncation)."""
+    if conv.summary_until is not None and cutoff <= conv.summary_until:
+        conv.summary = None
+        conv.summary_until = None
+        await db.commit()
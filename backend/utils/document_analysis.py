@@ -0,0 +1,150 @@
+"""Memoized document analysis (summary, insights, word count).
+
+Results are persisted per (content hash, model, prompt version) next to the
+upload index, so re-analyzing an unchanged document is a file read instead of
+two LLM calls.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from utils.document_store import UPLOADS_DIR, extract_text
+from utils.logger import logger
+
+# Bump when the summary/insight prompts change so stale results are regenerated.
+ANALYSIS_PROMPT_VERSION = "1"
+ANALYSIS_DIR = UPLOADS_DIR / "_analysis"
+
+INSIGHTS_PROMPT = (
+    "List 5 key takeaways and 3 suggested follow-up questions the user should ask "
+    "to learn more from this document."
+)
+
+_inflight: dict[str, asyncio.Task] = {}
+
+
+class UnreadableDocumentError(ValueError):
+    """The document has no text the agents can analyze."""
+
+
+def file_content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _content_hash(record: dict[str, Any]) -> str:
+    return record.get("content_hash") or file_content_hash(record["file_path"])
+
+
+@functools.lru_cache(maxsize=1)
+def _analysis_agent():
+    from agents.document_agent import DocumentAgent
+
+    return DocumentAgent()
+
+
+def _analysis_model() -> str:
+    """The model the analysis agent actually runs (whichever provider is configured)."""
+    return _analysis_agent().model_name
+
+
+def analysis_key(content_hash: str, model: str) -> str:
+    raw = f"{content_hash}:{model}:{ANALYSIS_PROMPT_VERSION}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return ANALYSIS_DIR / f"{key}.json"
+
+
+def load_cached_analysis(key: str) -> dict[str, Any] | None:
+    path = _cache_path(key)
+    if not path.is_file():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError):
+        return None
+
+
+def _save_analysis(key: str, result: dict[str, Any]) -> None:
+    ANALYSIS_DIR.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(key)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(result), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def _generate_analysis(
+    record: dict[str, Any], content_hash: str, model: str, refresh: bool = False
+) -> dict[str, Any]:
+    try:
+        text = await asyncio.to_thread(extract_text, record["file_path"], record["filename"])
+    except ValueError as e:
+        raise UnreadableDocumentError(str(e)) from e
+    if len(text.strip()) < 20:
+        raise UnreadableDocumentError(
+            "Could not extract enough text from this file. Try a text-based PDF or DOCX."
+        )
+
+    # A refresh must reach the model, not the response cache.
+    agent = _analysis_agent()
+    summary = await agent.summarize(text, max_length=400, use_cache=not refresh)
+    response = await agent.process(
+        message=INSIGHTS_PROMPT,
+        context=[{"content": text[:12000], "metadata": {"source": record["filename"]}}],
+        use_cache=not refresh,
+    )
+    result = {
+        "summary": summary,
+        "insights": response["content"],
+        "word_count": len(text.split()),
+        "content_hash": content_hash,
+        "model": model,
+        "prompt_version": ANALYSIS_PROMPT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    _save_analysis(analysis_key(content_hash, model), result)
+    return result
+
+
+async def analyze_record(record: dict[str, Any], *, refresh: bool = False) -> tuple[dict[str, Any], bool]:
+    """Return (analysis, cached). Raises UnreadableDocumentError when the file has no usable text."""
+    content_hash = await asyncio.to_thread(_content_hash, record)
+    model = _analysis_model()
+    key = analysis_key(content_hash, model)
+
+    if not refresh:
+        cached = load_cached_analysis(key)
+        if cached:
+            return cached, True
+
+    # Share an analysis already running for the same content (e.g. the upload job).
+    # Shielded so a disconnected client does not throw away a half-finished result.
+    # Refreshes only share with other refreshes, which bypass the response cache.
+    flight = f"{key}:refresh" if refresh else key
+    task = _inflight.get(flight)
+    if task is None:
+        task = asyncio.ensure_future(_generate_analysis(record, content_hash, model, refresh))
+        _inflight[flight] = task
+        task.add_done_callback(lambda _t, k=flight: _inflight.pop(k, None))
+    return await asyncio.shield(task), False
+
+
+async def run_analysis_job(record: dict[str, Any]) -> None:
+    """Background job: analyze a freshly uploaded document so the first view is instant."""
+    try:
+        await analyze_record(record)
+        logger.info("Eager analysis ready for %s", record.get("filename"))
+    except Exception as e:
+        logger.warning("Eager analysis skipped for %s: %s", record.get("filename"), e)
@@ -1,6 +1,7 @@
 """Simple document metadata store (no RAG required for upload/list/delete)."""
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import uuid
@@ -28,35 +29,67 @@ def _save_index(index: dict[str, dict[str, Any]]) -> None:
     INDEX_FILE.write_text(json.dumps(index, indent=2), encoding="utf-8")
 
 
-def save_upload(
-    *,
-    user_id: str,
-    filename: str,
-    content: bytes,
-) -> dict[str, Any]:
-    user_id = str(user_id)
+def new_upload_path(*, user_id: str, filename: str) -> tuple[str, str, Path]:
+    """Reserve (doc_id, safe_name, file_path) for a file about to be written."""
     doc_id = str(uuid.uuid4())
     safe_name = os.path.basename(filename) or "upload.bin"
-    user_dir = UPLOADS_DIR / user_id
+    user_dir = UPLOADS_DIR / str(user_id)
     user_dir.mkdir(parents=True, exist_ok=True)
-    stored_name = f"{doc_id}_{safe_name}"
-    file_path = user_dir / stored_name
-    file_path.write_bytes(content)
+    return doc_id, safe_name, user_dir / f"{doc_id}_{safe_name}"
 
-    record = {
+
+def build_record(
+    *,
+    doc_id: str,
+    user_id: str,
+    filename: str,
+    file_path: Path,
+    size: int,
+    content_hash: str,
+) -> dict[str, Any]:
+    return {
         "id": doc_id,
-        "filename": safe_name,
-        "name": safe_name,
+        "filename": filename,
+        "name": filename,
         "file_path": str(file_path),
-        "size": len(content),
-        "file_type": _guess_type(safe_name),
-        "user_id": user_id,
+        "size": size,
+        "content_hash": content_hash,
+        "file_type": _guess_type(filename),
+        "user_id": str(user_id),
         "status": "ready",
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
+
+
+def commit_records(records: list[dict[str, Any]]) -> None:
+    """Add several document records with a single index rewrite."""
+    if not records:
+        return
     index = _load_index()
-    index[doc_id] = record
+    for record in records:
+        index[record["id"]] = record
     _save_index(index)
+
+
+def save_upload(
+    *,
+    user_id: str,
+    filename: str,
+    content: bytes,
+) -> dict[str, Any]:
+    user_id = str(user_id)
+    doc_id, safe_name, file_path = new_upload_path(user_id=user_id, filename=filename)
+    file_path.write_bytes(content)
+
+    record = build_record(
+        doc_id=doc_id,
+        user_id=user_id,
+        filename=safe_name,
+        file_path=file_path,
+        size=len(content),
+        content_hash=hashlib.sha256(content).hexdigest(),
+    )
+    commit_records([record])
     return record
 
 
@@ -78,15 +111,35 @@ def get_document(document_id: str, user_id: str | None = None) -> dict[str, Any]
     return record
 
 
-def extract_text(file_path: str, filename: str) -> str:
-    """Extract plain text from uploaded file for AI analysis."""
+PAGE_CHARS = 3000
+
+
+def _split_pages(text: str, page_chars: int = PAGE_CHARS) -> list[tuple[int, str]]:
+    """Break text without real pages into ~page_chars sections on paragraph boundaries."""
+    pages: list[tuple[int, str]] = []
+    current: list[str] = []
+    size = 0
+    for para in text.split("\n"):
+        if size + len(para) > page_chars and current:
+            pages.append((len(pages) + 1, "\n".join(current)))
+            current, size = [], 0
+        current.append(para)
+        size += len(para) + 1
+    if any(p.strip() for p in current):
+        pages.append((len(pages) + 1, "\n".join(current)))
+    return pages
+
+
+def extract_pages(file_path: str, filename: str, max_pages: int = 30) -> list[tuple[int, str]]:
+    """Extract (page number, text) pairs; PDFs use real pages, other formats ~3000-char sections."""
     path = Path(file_path)
     if not path.is_file():
         raise FileNotFoundError(f"File not found: {file_path}")
 
     ext = os.path.splitext(filename)[1].lower()
     if ext in {".txt", ".md", ".markdown"}:
-        return path.read_text(encoding="utf-8", errors="ignore")[:50000]
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        return _split_pages(text[: max_pages * PAGE_CHARS])[:max_pages]
 
     if ext == ".pdf":
         try:
@@ -98,14 +151,13 @@ def extract_text(file_path: str, filename: str) -> str:
 
         try:
             reader = PdfReader(str(path))
-            parts = []
-            for page in reader.pages[:30]:
+            pages = []
+            for number, page in enumerate(reader.pages[:max_pages], 1):
                 text = page.extract_text()
-                if text:
-                    parts.append(text)
-            content = "\n".join(parts).strip()
-            if content:
-                return content[:50000]
+                if text and text.strip():
+                    pages.append((number, text.strip()))
+            if pages:
+                return pages
             raise ValueError(
                 "This PDF has little or no selectable text (it may be a scanned image). "
                 "Export a text-based PDF from Word/Google Docs and try again."
@@ -120,13 +172,20 @@ def extract_text(file_path: str, filename: str) -> str:
             from docx import Document as DocxDocument
 
             doc = DocxDocument(str(path))
-            return "\n".join(p.text for p in doc.paragraphs if p.text)[:50000]
+            text = "\n".join(p.text for p in doc.paragraphs if p.text)
+            return _split_pages(text)[:max_pages]
         except Exception as e:
             raise ValueError(f"Could not read DOCX: {e}") from e
 
     raise ValueError(f"Unsupported file type for analysis: {ext or 'unknown'}")
 
 
+def extract_text(file_path: str, filename: str) -> str:
+    """Extract plain text from uploaded file for AI analysis."""
+    pages = extract_pages(file_path, filename)
+    return "\n".join(text for _, text in pages)[:50000]
+
+
 def delete_document(document_id: str, user_id: str | None = None) -> bool:
     index = _load_index()
     record = index.get(document_id)
@@ -22,6 +22,10 @@ def get_default_model() -> str:
 
 def create_llm(model: Optional[str] = None):
     """Return a LangChain chat model for the given model id."""
+    from utils.mock_llm import create_mock_llm, mock_enabled
+
+    if mock_enabled():
+        return create_mock_llm(model)
     groq_api_key = get_groq_api_key()
     openai_api_key = (os.getenv("OPENAI_API_KEY") or "").strip() or None
     use_ollama = os.getenv("USE_OLLAMA", "false").lower() == "true"
@@ -0,0 +1,279 @@
+"""Write-behind persistence for chat messages.
+
+The chat path hands each message to ``message_writer.add`` and carries on; a
+background worker inserts the pending messages of every conversation and bumps
+their ``updated_at`` in one transaction per batch, flushing when ``batch_size``
+messages are waiting or every ``flush_interval`` seconds. A turn therefore costs
+no database round trip of its own, and concurrent turns share a commit.
+
+Reads that must see a conversation's latest messages call ``sync`` first, which
+flushes only if that conversation has messages pending. ``stop`` (app shutdown)
+drains the queue, retrying failed batches; only a hard crash can lose the last
+``flush_interval`` of messages. ``MESSAGE_FLUSH_INTERVAL_MS=0`` writes through
+instead (every ``add`` commits before returning).
+
+A batch that fails is retried row by row, so one message the database rejects
+(e.g. text with a NUL byte on PostgreSQL) cannot hold back everyone else's: the
+other rows are written, and a row that fails on its own ``MAX_ROW_ATTEMPTS``
+times is logged and dropped. Connection-level errors (the database is down)
+keep every row for the next flush.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.exc import OperationalError
+
+from db.database import Conversation, Message
+from utils.logger import logger
+from utils.search_index import KIND_MESSAGE, entry, index_queue
+from utils.token_budget import count_tokens
+
+FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "200")) / 1000
+BATCH_SIZE = int(os.getenv("MESSAGE_FLUSH_BATCH", "100"))
+# Past this backlog (e.g. the database is down) ``add`` flushes inline instead of queueing more.
+MAX_PENDING = 5000
+# Flushes a message may fail on its own (its batch written row by row) before it is dropped.
+MAX_ROW_ATTEMPTS = 3
+_SHUTDOWN_ATTEMPTS = 3
+
+_messages = Message.__table__
+_conversations = Conversation.__table__
+
+
+def _is_transient(error: Exception) -> bool:
+    """The database (not the row) failed: retry everything later instead of blaming a row."""
+    return isinstance(error, (OperationalError, OSError, asyncio.TimeoutError)) or getattr(
+        error, "connection_invalidated", False
+    )
+
+
+class MessageWriteQueue:
+    """Batches message inserts and conversation timestamp updates off the request path."""
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._rows: list[dict[str, Any]] = []
+        # conversation_id -> (user_id, newest message time) for the pending rows.
+        self._touched: dict[str, tuple[str, datetime]] = {}
+        self._flushing: set[str] = set()
+        self._oldest_enqueued: float | None = None
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_tasks: set[asyncio.Task] = set()
+        self._stopping = False
+        # message id -> flushes in which the row failed on its own.
+        self._row_failures: dict[str, int] = {}
+        self.flushed_messages = 0
+        self.flushed_batches = 0
+        self.failed_batches = 0
+        self.dropped_messages = 0
+        self.inline_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self.last_flush_at: float | None = None
+
+    async def add(
+        self, *, conversation_id: str, user_id: str, role: str, content: str, truncated: bool = False
+    ) -> str:
+        """Queue a message for the conversation and return its id."""
+        if len(self._rows) >= self.max_pending:
+            self.inline_flushes += 1
+            await self.flush()
+        msg_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        if not self._rows:
+            self._oldest_enqueued = time.monotonic()
+        self._rows.append(
+            {
+                "id": msg_id,
+                "conversation_id": conversation_id,
+                "role": role,
+                "content": content,
+                "token_count": count_tokens(content),
+                "truncated": truncated,
+                "created_at": now,
+            }
+        )
+        self._touched[conversation_id] = (str(user_id), now)
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+        return msg_id
+
+    def has_pending(self, conversation_id: str | None = None) -> bool:
+        if conversation_id is None:
+            return bool(self._rows or self._flushing)
+        return conversation_id in self._touched or conversation_id in self._flushing
+
+    async def sync(self, conversation_id: str | None = None) -> None:
+        """Make queued messages of the conversation (or of all, if None) visible to reads."""
+        if self.has_pending(conversation_id):
+            await self.flush()
+
+    def start(self) -> None:
+        if self.flush_interval > 0 and (self._worker is None or self._worker.done()):
+            self._stopping = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            # Let the worker finish the flush it may be in, then exit; no cancelling mid-write.
+            self._stopping = True
+            self._wakeup.set()
+            await self._worker
+            self._worker = None
+        for attempt in range(_SHUTDOWN_ATTEMPTS):
+            await self.flush()
+            if not self._rows:
+                return
+            await asyncio.sleep(0.5 * (attempt + 1))
+        logger.error(f"Message writer stopped with {len(self._rows)} unsaved messages")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._stopping:
+                await self.flush()
+
+    async def _write(self, rows: list[dict[str, Any]], touched: dict[str, tuple[str, datetime]]) -> None:
+        from db.database import engine
+
+        async with engine.begin() as conn:
+            await conn.execute(insert(_messages), rows)
+            await conn.execute(
+                update(_conversations)
+                .where(_conversations.c.id == bindparam("conv_id"))
+                .values(updated_at=bindparam("ts")),
+                [{"conv_id": cid, "ts": ts} for cid, (_, ts) in touched.items()],
+            )
+
+    async def _write_singly(
+        self, rows: list[dict[str, Any]], touched: dict[str, tuple[str, datetime]]
+    ) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """Write a failed batch one row per transaction; returns (written, to retry)."""
+        written, retry = [], []
+        for i, row in enumerate(rows):
+            conv_id = row["conversation_id"]
+            try:
+                await self._write([row], {conv_id: (touched[conv_id][0], row["created_at"])})
+            except Exception as e:
+                if _is_transient(e):
+                    retry.extend(rows[i:])
+                    break
+                attempts = self._row_failures.get(row["id"], 0) + 1
+                if attempts < MAX_ROW_ATTEMPTS:
+                    self._row_failures[row["id"]] = attempts
+                    retry.append(row)
+                    continue
+                self._row_failures.pop(row["id"], None)
+                self.dropped_messages += 1
+                logger.error(
+                    f"Dropping message {row['id']} of conversation {conv_id} after {attempts} failed writes: {e}"
+                )
+            else:
+                self._row_failures.pop(row["id"], None)
+                written.append(row)
+        return written, retry
+
+    async def flush(self) -> None:
+        """Write every queued message.
+
+        The write runs in its own task: a cancelled caller (a request whose
+        client went away while it waited on ``sync``) stops waiting, but the
+        batch it took off the queue is still written or put back.
+        """
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+        await asyncio.shield(task)
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            if not self._rows:
+                return
+            rows, touched, oldest = self._rows, self._touched, self._oldest_enqueued
+            self._rows, self._touched, self._oldest_enqueued = [], {}, None
+            self._flushing = set(touched)
+            start = time.perf_counter()
+            try:
+                await self._write(rows, touched)
+            except Exception as e:
+                logger.error(f"Message flush failed ({len(rows)} messages): {e}")
+                self.failed_batches += 1
+                rows, retry = await self._write_singly(rows, touched)
+                if retry:
+                    # Keep them (ahead of newer messages) for the next attempt.
+                    self._rows = retry + self._rows
+                    self._touched = {
+                        **{row["conversation_id"]: touched[row["conversation_id"]] for row in retry},
+                        **self._touched,
+                    }
+                    self._oldest_enqueued = oldest
+            finally:
+                self._flushing = set()
+            if not rows:
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            self.last_flush_at = time.time()
+            self.flushed_messages += len(rows)
+            self.flushed_batches += 1
+            for row in rows:
+                index_queue.upsert(
+                    entry(
+                        KIND_MESSAGE,
+                        row["id"],
+                        user_id=touched[row["conversation_id"]][0],
+                        parent_id=row["conversation_id"],
+                        body=row["content"],
+                        ts=row["created_at"],
+                    )
+                )
+
+    def stats(self) -> dict[str, Any]:
+        lag = time.monotonic() - self._oldest_enqueued if self._oldest_enqueued else 0.0
+        batches = self.flushed_batches
+        return {
+            "pending_messages": len(self._rows),
+            "pending_conversations": len(self._touched),
+            "lag_seconds": round(lag, 3),
+            "flushed_messages": self.flushed_messages,
+            "flushed_batches": batches,
+            "messages_per_batch": round(self.flushed_messages / batches, 2) if batches else None,
+            "failed_batches": self.failed_batches,
+            "retrying_messages": len(self._row_failures),
+            "dropped_messages": self.dropped_messages,
+            "inline_flushes": self.inline_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / batches, 2) if batches else None,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "last_flush_at": self.last_flush_at,
+            "flush_interval_ms": round(self.flush_interval * 1000),
+            "running": self._worker is not None and not self._worker.done(),
+        }
+
+
+message_writer = MessageWriteQueue()
@@ -0,0 +1,179 @@
+"""Deterministic local chat model for offline load and regression testing.
+
+``USE_MOCK_LLM=true`` makes ``create_llm`` and the agents use ``MockChatModel``
+instead of a provider, so the whole chat pipeline (auth, database, RAG, prompt
+building, streaming, persistence) can be benchmarked without a network or API
+keys. Replies are pseudo-random words seeded from the prompt, so the same
+prompt always gets the same reply. Timing and failures are configurable:
+
+    MOCK_LLM_TTFT_MS             delay before the first token (default 300)
+    MOCK_LLM_TOKENS_PER_SECOND   output rate after the first token (default 50)
+    MOCK_LLM_RESPONSE_TOKENS     tokens per reply (default 200)
+    MOCK_LLM_ERROR_RATE          share of calls failing halfway through the reply (default 0)
+    MOCK_LLM_RATE_LIMIT_RATE     share of calls rejected with a 429 before any token (default 0)
+    MOCK_LLM_SEED                seed for replies and failure injection (default 0)
+    MOCK_LLM_MODEL               model name reported when a request does not pick one
+
+Which calls fail is drawn from one generator per seed, shared by every mock
+model instance (the agents' and per-request ones), so a run with the same
+request order injects the same failures.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+MOCK_MODEL = "mock-llm"
+
+_WORDS = """
+the a to and of in is for that it on with this be are can we not your will at as
+or if how about from but so more out up use make know time work project plan team
+data model search index query user file document task update issue fix deploy test
+api database server error cache latency summary analysis result example function
+request response stream token context answer question step first next then also
+""".split()
+
+_failure_draws: dict[int, random.Random] = {}
+
+
+def mock_enabled() -> bool:
+    return os.getenv("USE_MOCK_LLM", "false").lower() == "true"
+
+
+class MockLLMError(RuntimeError):
+    """Injected failure partway through a reply."""
+
+
+class MockRateLimitError(RuntimeError):
+    """Injected provider rate limit, raised before the first token."""
+
+    status_code = 429
+
+
+class MockChatModel(BaseChatModel):
+    model: str = MOCK_MODEL
+    ttft_ms: float = 300.0
+    tokens_per_second: float = 50.0
+    response_tokens: int = 200
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {
+            "model": self.model,
+            "ttft_ms": self.ttft_ms,
+            "tokens_per_second": self.tokens_per_second,
+            "response_tokens": self.response_tokens,
+        }
+
+    def _reply_tokens(self, messages: List[BaseMessage]) -> list[str]:
+        digest = hashlib.sha256(f"{self.seed}\x1e{self.model}".encode())
+        for message in messages:
+            digest.update(f"{message.type}\x1f{message.content}\x1e".encode())
+        rng = random.Random(digest.digest())
+        return [(" " if i else "") + rng.choice(_WORDS) for i in range(self.response_tokens)]
+
+    def _plan(self, messages: List[BaseMessage]) -> tuple[list[str], int | None]:
+        """Reply tokens and the index to fail at (None: no failure); raises injected 429s."""
+        draw = _failure_draws.setdefault(self.seed, random.Random(self.seed)).random()
+        if draw < self.rate_limit_rate:
+            raise MockRateLimitError("Rate limit exceeded (mock 429)")
+        tokens = self._reply_tokens(messages)
+        fail_at = len(tokens) // 2 if draw < self.rate_limit_rate + self.error_rate else None
+        return tokens, fail_at
+
+    def _token_offset(self, i: int) -> float:
+        """Seconds from the start of the call until token ``i`` is due."""
+        rate = self.tokens_per_second
+        return self.ttft_ms / 1000 + (i / rate if rate > 0 else 0.0)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._result(list(self._stream(messages, stop, run_manager, **kwargs)))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._result([chunk async for chunk in self._astream(messages, stop, run_manager, **kwargs)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        started = time.perf_counter()
+        tokens, fail_at = self._plan(messages)
+        for i, token in enumerate(tokens):
+            delay = started + self._token_offset(i) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if i == fail_at:
+                raise MockLLMError(f"Injected mock LLM failure after {i} tokens")
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        tokens, fail_at = self._plan(messages)
+        for i, token in enumerate(tokens):
+            # Sleep to each token's deadline rather than per-token intervals, so timer overhead does not add up.
+            delay = started + self._token_offset(i) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if i == fail_at:
+                raise MockLLMError(f"Injected mock LLM failure after {i} tokens")
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    @staticmethod
+    def _result(chunks: list[ChatGenerationChunk]) -> ChatResult:
+        text = "".join(chunk.text for chunk in chunks)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def create_mock_llm(model: Optional[str] = None) -> MockChatModel:
+    """Mock chat model configured from the ``MOCK_LLM_*`` environment variables."""
+    return MockChatModel(
+        model=model or os.getenv("MOCK_LLM_MODEL", MOCK_MODEL),
+        ttft_ms=float(os.getenv("MOCK_LLM_TTFT_MS", "300")),
+        tokens_per_second=float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "50")),
+        response_tokens=int(os.getenv("MOCK_LLM_RESPONSE_TOKENS", "200")),
+        error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+        rate_limit_rate=float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0")),
+        seed=int(os.getenv("MOCK_LLM_SEED", "0")),
+    )
@@ -0,0 +1,223 @@
+"""Cache of LLM responses for stateless agent calls.
+
+Only calls without a conversation (document summaries, code analysis, one-off
+questions) are cached, and only for agents that opt in with
+``cache_responses = True``: a chat turn depends on its thread's history.
+
+Two tiers share one LRU with a byte budget and a TTL:
+
+- exact: keyed by agent, model, a fingerprint of the context documents and the
+  prompt with whitespace normalized;
+- semantic (``RESPONSE_CACHE_SEMANTIC=on``): short, context-free prompts are also
+  embedded with the workspace search embeddings provider, and a new prompt whose
+  cosine similarity to a cached one (same agent and model) reaches
+  ``RESPONSE_CACHE_SIMILARITY`` reuses its answer.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+import orjson
+
+from utils.logger import logger
+
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "on").strip().lower() not in ("off", "false", "0")
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_ENABLED = os.getenv("RESPONSE_CACHE_SEMANTIC", "off").strip().lower() in ("on", "true", "1")
+SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Longer prompts (pasted documents, code) are only matched exactly.
+MAX_SEMANTIC_PROMPT_CHARS = 1000
+_ENTRY_OVERHEAD = 300
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def context_fingerprint(context: list[dict[str, Any]] | None) -> str:
+    if not context:
+        return ""
+    payload = orjson.dumps(context, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.sha256(payload).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("response", "scope", "vector", "nbytes", "expires_at")
+
+    def __init__(self, response: str, scope: str, vector: np.ndarray | None, ttl: float):
+        self.response = response
+        self.scope = scope
+        self.vector = vector
+        self.nbytes = _ENTRY_OVERHEAD + sys.getsizeof(response) + (vector.nbytes if vector is not None else 0)
+        self.expires_at = time.monotonic() + ttl
+
+
+class _SemanticScope:
+    """Cached prompt vectors of one (agent, model), stacked lazily into a matrix."""
+
+    __slots__ = ("vectors", "_keys", "_matrix")
+
+    def __init__(self) -> None:
+        self.vectors: dict[str, np.ndarray] = {}
+        self._keys: list[str] = []
+        self._matrix: np.ndarray | None = None
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        self.vectors[key] = vector
+        self._matrix = None
+
+    def remove(self, key: str) -> None:
+        if self.vectors.pop(key, None) is not None:
+            self._matrix = None
+
+    def best(self, vector: np.ndarray) -> tuple[str | None, float]:
+        if not self.vectors:
+            return None, 0.0
+        if self._matrix is None:
+            self._keys = list(self.vectors)
+            self._matrix = np.stack([self.vectors[k] for k in self._keys])
+        scores = self._matrix @ vector
+        i = int(np.argmax(scores))
+        return self._keys[i], float(scores[i])
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_bytes: int = MAX_BYTES,
+        ttl_seconds: float = TTL_SECONDS,
+        semantic: bool = SEMANTIC_ENABLED,
+        similarity: float = SIMILARITY,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.similarity = similarity
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._scopes: dict[str, _SemanticScope] = {}
+        self._bytes = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _scope(agent: str, model: str | None) -> str:
+        return f"{agent}\x00{model or ''}"
+
+    @staticmethod
+    def _key(scope: str, prompt: str, context_fp: str) -> str:
+        raw = f"{scope}\x00{context_fp}\x00{prompt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _semantic_eligible(self, prompt: str, context_fp: str) -> bool:
+        return self.semantic and not context_fp and len(prompt) <= MAX_SEMANTIC_PROMPT_CHARS
+
+    async def _embed(self, prompt: str) -> np.ndarray | None:
+        from utils.vector_index import vector_index
+
+        if not vector_index.enabled:
+            return None
+        return await vector_index.embed_query(prompt)
+
+    def _live(self, key: str) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.nbytes
+        if entry.vector is not None:
+            scope = self._scopes.get(entry.scope)
+            if scope is not None:
+                scope.remove(key)
+                if not scope.vectors:
+                    del self._scopes[entry.scope]
+
+    async def get(
+        self, agent: str, prompt: str, context: list[dict[str, Any]] | None, model: str | None
+    ) -> str | None:
+        scope = self._scope(agent, model)
+        normalized, context_fp = normalize_prompt(prompt), context_fingerprint(context)
+        entry = self._live(self._key(scope, normalized, context_fp))
+        if entry is not None:
+            self.exact_hits += 1
+            return entry.response
+        if self._semantic_eligible(normalized, context_fp) and scope in self._scopes:
+            vector = await self._embed(normalized)
+            if vector is not None:
+                key, score = self._scopes[scope].best(vector)
+                entry = self._live(key) if key is not None and score >= self.similarity else None
+                if entry is not None:
+                    self.semantic_hits += 1
+                    logger.info(f"Response cache semantic hit for {agent} (similarity {score:.3f})")
+                    return entry.response
+        self.misses += 1
+        return None
+
+    async def put(
+        self,
+        agent: str,
+        prompt: str,
+        context: list[dict[str, Any]] | None,
+        model: str | None,
+        response: str,
+    ) -> None:
+        scope = self._scope(agent, model)
+        normalized, context_fp = normalize_prompt(prompt), context_fingerprint(context)
+        key = self._key(scope, normalized, context_fp)
+        vector = await self._embed(normalized) if self._semantic_eligible(normalized, context_fp) else None
+        self._drop(key)
+        entry = _Entry(response, scope, vector, self.ttl_seconds)
+        if entry.nbytes > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        if vector is not None:
+            self._scopes.setdefault(scope, _SemanticScope()).add(key, vector)
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._scopes.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": CACHE_ENABLED,
+            "semantic": self.semantic,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+response_cache = ResponseCache()
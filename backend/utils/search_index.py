@@ -0,0 +1,643 @@
+"""Full-text index over conversation titles, chat messages, tasks and document pages.
+
+Rows live in ``search_entries`` (one per indexed item, unique on kind + ref_id).
+SQLite mirrors them into an external-content FTS5 table kept in sync by
+triggers and ranks with ``bm25()``; PostgreSQL uses a generated ``tsvector``
+column with a GIN index and ranks with ``ts_rank_cd()``.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from typing import Any, Callable, Iterable
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from utils.logger import logger
+
+KIND_CONVERSATION = "conversation"
+KIND_MESSAGE = "message"
+KIND_TASK = "task"
+KIND_DOCUMENT = "document"
+
+# Document pages are indexed with their text, so snippets come from the index
+# rather than from re-extracting the file.
+DOCUMENT_MAX_PAGES = 200
+
+_SQLITE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS search_entries (
+        id INTEGER PRIMARY KEY,
+        kind VARCHAR NOT NULL,
+        ref_id VARCHAR NOT NULL,
+        user_id VARCHAR NOT NULL,
+        parent_id VARCHAR,
+        title TEXT,
+        body TEXT,
+        ts VARCHAR,
+        UNIQUE (kind, ref_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_search_entries_user ON search_entries (user_id, kind)",
+    "CREATE INDEX IF NOT EXISTS ix_search_entries_parent ON search_entries (parent_id)",
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_entries_fts USING fts5(
+        title, body,
+        content='search_entries', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entries_ai AFTER INSERT ON search_entries BEGIN
+        INSERT INTO search_entries_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entries_ad AFTER DELETE ON search_entries BEGIN
+        INSERT INTO search_entries_fts(search_entries_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entries_au AFTER UPDATE ON search_entries BEGIN
+        INSERT INTO search_entries_fts(search_entries_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_entries_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+_POSTGRES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS search_entries (
+        id BIGSERIAL PRIMARY KEY,
+        kind VARCHAR NOT NULL,
+        ref_id VARCHAR NOT NULL,
+        user_id VARCHAR NOT NULL,
+        parent_id VARCHAR,
+        title TEXT,
+        body TEXT,
+        ts VARCHAR,
+        tsv tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(body, '')), 'B')
+        ) STORED,
+        UNIQUE (kind, ref_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_search_entries_tsv ON search_entries USING GIN (tsv)",
+    "CREATE INDEX IF NOT EXISTS ix_search_entries_user ON search_entries (user_id, kind)",
+    "CREATE INDEX IF NOT EXISTS ix_search_entries_parent ON search_entries (parent_id)",
+]
+
+_UPSERT_SQL = text(
+    """
+    INSERT INTO search_entries (kind, ref_id, user_id, parent_id, title, body, ts)
+    VALUES (:kind, :ref_id, :user_id, :parent_id, :title, :body, :ts)
+    ON CONFLICT (kind, ref_id) DO UPDATE SET
+        user_id = excluded.user_id,
+        parent_id = excluded.parent_id,
+        title = excluded.title,
+        body = excluded.body,
+        ts = excluded.ts
+    """
+)
+
+# Full rebuild straight from the source tables; timestamps are stored as text.
+_REBUILD_SQL = [
+    """
+    INSERT INTO search_entries (kind, ref_id, user_id, parent_id, title, body, ts)
+    SELECT 'conversation', c.id, c.user_id, NULL, c.title, NULL,
+           CAST(COALESCE(c.updated_at, c.created_at) AS VARCHAR)
+    FROM conversations c
+    """,
+    """
+    INSERT INTO search_entries (kind, ref_id, user_id, parent_id, title, body, ts)
+    SELECT 'message', m.id, c.user_id, m.conversation_id, NULL, m.content,
+           CAST(m.created_at AS VARCHAR)
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+    """,
+    """
+    INSERT INTO search_entries (kind, ref_id, user_id, parent_id, title, body, ts)
+    SELECT 'task', t.id, t.user_id, NULL, t.title, t.description,
+           CAST(COALESCE(t.updated_at, t.created_at) AS VARCHAR)
+    FROM tasks t
+    """,
+]
+
+
+def is_sqlite(bind: AsyncConnection | AsyncSession) -> bool:
+    dialect = bind.get_bind().dialect if isinstance(bind, AsyncSession) else bind.dialect
+    return dialect.name == "sqlite"
+
+
+def query_terms(query: str) -> list[str]:
+    return [t for t in re.findall(r"\w+", query.lower()) if t][:16]
+
+
+def _match_expression(terms: list[str], sqlite: bool) -> str:
+    # Terms are \w-only, so quoting them is enough to keep user input out of the query syntax.
+    if sqlite:
+        return " OR ".join(f'"{t}"*' for t in terms)
+    return " | ".join(f"{t}:*" for t in terms)
+
+
+def format_ts(value: Any) -> str | None:
+    if value is None:
+        return None
+    return str(value).replace(" ", "T", 1)
+
+
+def entry(
+    kind: str,
+    ref_id: str,
+    *,
+    user_id: str,
+    parent_id: str | None = None,
+    title: str | None = None,
+    body: str | None = None,
+    ts: Any = None,
+) -> dict[str, Any]:
+    # PostgreSQL text cannot hold NUL, which extracted PDF text sometimes contains.
+    return {
+        "kind": kind,
+        "ref_id": ref_id,
+        "user_id": str(user_id),
+        "parent_id": parent_id,
+        "title": title.replace("\x00", "") if title else title,
+        "body": body.replace("\x00", "") if body else body,
+        "ts": str(ts) if ts is not None else None,
+    }
+
+
+async def upsert_entries(conn: AsyncConnection | AsyncSession, entries: Iterable[dict[str, Any]]) -> None:
+    rows = list(entries)
+    if rows:
+        await conn.execute(_UPSERT_SQL, rows)
+
+
+async def delete_entries(conn: AsyncConnection | AsyncSession, kind: str, ref_ids: Iterable[str]) -> None:
+    for ref_id in ref_ids:
+        await conn.execute(
+            text("DELETE FROM search_entries WHERE kind = :kind AND ref_id = :ref_id"),
+            {"kind": kind, "ref_id": ref_id},
+        )
+
+
+async def delete_children(conn: AsyncConnection | AsyncSession, parent_ids: Iterable[str]) -> None:
+    for parent_id in parent_ids:
+        await conn.execute(
+            text("DELETE FROM search_entries WHERE parent_id = :parent_id"),
+            {"parent_id": parent_id},
+        )
+
+
+async def _create_schema(conn: AsyncConnection) -> None:
+    for statement in _SQLITE_DDL if is_sqlite(conn) else _POSTGRES_DDL:
+        await conn.execute(text(statement))
+
+
+async def ensure_search_index() -> None:
+    """Create index tables if needed and backfill them on first run."""
+    from db.database import engine
+
+    async with engine.begin() as conn:
+        await _create_schema(conn)
+        has_entries = (await conn.execute(text("SELECT 1 FROM search_entries LIMIT 1"))).first()
+        has_documents = (
+            await conn.execute(text("SELECT 1 FROM search_entries WHERE kind = 'document' LIMIT 1"))
+        ).first()
+    if not has_entries:
+        await rebuild_search_index()
+    elif not has_documents:
+        # Indexes created before document pages were indexed: backfill them in the background.
+        asyncio.create_task(_index_all_documents())
+
+
+async def rebuild_search_index() -> int:
+    """Drop every index entry and repopulate from the source tables."""
+    from db.database import engine
+
+    async with engine.begin() as conn:
+        await _create_schema(conn)
+        await conn.execute(text("DELETE FROM search_entries"))
+        for statement in _REBUILD_SQL:
+            await conn.execute(text(statement))
+    await _index_all_documents()
+    async with engine.connect() as conn:
+        total = (await conn.execute(text("SELECT COUNT(*) FROM search_entries"))).scalar() or 0
+    logger.info("Search index rebuilt (%s entries)", total)
+    return int(total)
+
+
+async def document_entries(record: dict[str, Any]) -> list[dict[str, Any]]:
+    """One entry per extracted page; files without readable text are indexed by filename only."""
+    from utils.document_store import extract_pages
+
+    try:
+        pages = await asyncio.to_thread(
+            extract_pages, record["file_path"], record["filename"], DOCUMENT_MAX_PAGES
+        )
+    except Exception as e:
+        logger.info("Indexing %s by filename only: %s", record.get("filename"), e)
+        pages = []
+    common = {
+        "user_id": record["user_id"],
+        "parent_id": record["id"],
+        "title": record["filename"],
+        "ts": record.get("created_at"),
+    }
+    if not pages:
+        return [entry(KIND_DOCUMENT, f"{record['id']}:0", **common)]
+    return [entry(KIND_DOCUMENT, f"{record['id']}:{number}", body=page_text, **common) for number, page_text in pages]
+
+
+async def index_document(record: dict[str, Any]) -> None:
+    """Extract an uploaded document's pages and queue them for indexing."""
+    for item in await document_entries(record):
+        index_queue.upsert(item)
+
+
+async def _index_all_documents() -> None:
+    from db.database import engine
+    from utils.document_store import list_documents
+
+    for record in list_documents():
+        items = await document_entries(record)
+        async with engine.begin() as conn:
+            await delete_children(conn, [record["id"]])
+            await upsert_entries(conn, items)
+
+
+def _normalize_rank(rank: float, sqlite: bool) -> float:
+    # SQLite ranks are -bm25() (0..inf); x / (1 + x) maps them into 0..1 like
+    # ts_rank_cd(..., 32) already does on PostgreSQL.
+    return rank / (1.0 + rank) if sqlite else rank
+
+
+async def ranked_hits(
+    db: AsyncSession,
+    user_id: str,
+    terms: list[str],
+    kind: str,
+    *,
+    after: tuple[float, str, str] | None = None,
+    limit: int = 20,
+) -> list[dict[str, Any]]:
+    """Lightweight (id, kind, ref_id, parent_id, rank, score) rows for one kind, best first.
+
+    ``after`` is a keyset cursor ``(rank, kind, ref_id)``: only rows ordered strictly
+    after it in (rank desc, kind, ref_id) order are returned. Documents are collapsed
+    to their best-matching page.
+    """
+    if not terms:
+        return []
+    sqlite = is_sqlite(db)
+    if sqlite:
+        inner = """
+            SELECT e.id, e.kind, e.ref_id, e.parent_id,
+                   -bm25(search_entries_fts, 2.0, 1.0) AS rank
+            FROM search_entries_fts
+            JOIN search_entries e ON e.id = search_entries_fts.rowid
+            WHERE search_entries_fts MATCH :match
+              AND e.user_id = :user_id AND e.kind = :kind
+        """
+    else:
+        inner = """
+            SELECT e.id, e.kind, e.ref_id, e.parent_id, ts_rank_cd(e.tsv, q, 32) AS rank
+            FROM search_entries e
+            CROSS JOIN to_tsquery('english', :match) AS q
+            WHERE e.user_id = :user_id AND e.kind = :kind AND e.tsv @@ q
+        """
+    if kind == KIND_DOCUMENT:
+        inner = f"""
+            SELECT id, kind, ref_id, parent_id, rank FROM (
+                SELECT hits.*, ROW_NUMBER() OVER (
+                    PARTITION BY parent_id ORDER BY rank DESC, ref_id
+                ) AS page_rank
+                FROM ({inner}) AS hits
+            ) AS pages
+            WHERE page_rank = 1
+        """
+
+    params: dict[str, Any] = {
+        "match": _match_expression(terms, sqlite),
+        "user_id": str(user_id),
+        "kind": kind,
+        "limit": limit,
+    }
+    keyset = ""
+    if after is not None:
+        after_rank, after_kind, after_ref = after
+        params.update({"after_rank": after_rank, "after_ref": after_ref})
+        if kind > after_kind:
+            keyset = "WHERE rank <= :after_rank"
+        elif kind < after_kind:
+            keyset = "WHERE rank < :after_rank"
+        else:
+            keyset = "WHERE rank < :after_rank OR (rank = :after_rank AND ref_id > :after_ref)"
+
+    result = await db.execute(
+        text(
+            f"""
+            SELECT id, kind, ref_id, parent_id, rank FROM ({inner}) AS ranked
+            {keyset}
+            ORDER BY rank DESC, ref_id
+            LIMIT :limit
+            """
+        ),
+        params,
+    )
+    return [
+        {**row, "score": _normalize_rank(float(row["rank"] or 0.0), sqlite)}
+        for row in result.mappings()
+    ]
+
+
+async def hydrate_hits(db: AsyncSession, terms: list[str], ids: list[int]) -> dict[int, dict[str, Any]]:
+    """Display fields (title, timestamp, snippet, parent title, task state) for selected entries."""
+    if not ids:
+        return {}
+    sqlite = is_sqlite(db)
+    id_params = {f"id_{i}": entry_id for i, entry_id in enumerate(ids)}
+    id_list = ", ".join(f":{name}" for name in id_params)
+    if sqlite:
+        sql = f"""
+            SELECT e.id, e.title, e.ts,
+                   snippet(search_entries_fts, 1, '', '', '...', 24) AS snippet,
+                   c.title AS conversation_title, t.completed, t.priority
+            FROM search_entries_fts
+            JOIN search_entries e ON e.id = search_entries_fts.rowid
+            LEFT JOIN conversations c ON e.kind = 'message' AND c.id = e.parent_id
+            LEFT JOIN tasks t ON e.kind = 'task' AND t.id = e.ref_id
+            WHERE search_entries_fts MATCH :match AND search_entries_fts.rowid IN ({id_list})
+        """
+    else:
+        sql = f"""
+            SELECT e.id, e.title, e.ts,
+                   ts_headline('english', coalesce(e.body, e.title, ''), q,
+                               'MaxWords=30, MinWords=10, StartSel="", StopSel=""') AS snippet,
+                   c.title AS conversation_title, t.completed, t.priority
+            FROM search_entries e
+            CROSS JOIN to_tsquery('english', :match) AS q
+            LEFT JOIN conversations c ON e.kind = 'message' AND c.id = e.parent_id
+            LEFT JOIN tasks t ON e.kind = 'task' AND t.id = e.ref_id
+            WHERE e.id IN ({id_list})
+        """
+    result = await db.execute(text(sql), {"match": _match_expression(terms, sqlite), **id_params})
+    display = {row["id"]: {**row, "ts": format_ts(row["ts"])} for row in result.mappings()}
+
+    # Semantic hits need not contain any query term, so FTS5 will not return them above.
+    missing = {f"id_{i}": entry_id for i, entry_id in enumerate(ids) if entry_id not in display}
+    if missing:
+        missing_list = ", ".join(f":{name}" for name in missing)
+        result = await db.execute(
+            text(
+                f"""
+                SELECT e.id, e.title, e.ts, substr(coalesce(e.body, ''), 1, 200) AS snippet,
+                       c.title AS conversation_title, t.completed, t.priority
+                FROM search_entries e
+                LEFT JOIN conversations c ON e.kind = 'message' AND c.id = e.parent_id
+                LEFT JOIN tasks t ON e.kind = 'task' AND t.id = e.ref_id
+                WHERE e.id IN ({missing_list})
+                """
+            ),
+            missing,
+        )
+        display.update({row["id"]: {**row, "ts": format_ts(row["ts"])} for row in result.mappings()})
+    return display
+
+
+async def entries_for_refs(
+    db: AsyncSession, user_id: str, refs: list[tuple[str, str]]
+) -> dict[tuple[str, str], dict[str, Any]]:
+    """Map (kind, ref_id) pairs to their index rows (id, kind, ref_id, parent_id) for one user."""
+    if not refs:
+        return {}
+    params: dict[str, Any] = {"user_id": str(user_id)}
+    clauses = []
+    for i, (kind, ref_id) in enumerate(refs):
+        params[f"k{i}"], params[f"r{i}"] = kind, ref_id
+        clauses.append(f"(kind = :k{i} AND ref_id = :r{i})")
+    result = await db.execute(
+        text(
+            f"SELECT id, kind, ref_id, parent_id FROM search_entries "
+            f"WHERE user_id = :user_id AND ({' OR '.join(clauses)})"
+        ),
+        params,
+    )
+    return {(row["kind"], row["ref_id"]): dict(row) for row in result.mappings()}
+
+
+class SearchIndexQueue:
+    """Write-behind queue that batches index updates off the request path.
+
+    Write paths enqueue operations and return immediately; a background worker
+    applies them in one transaction per batch, flushing when ``batch_size``
+    operations are pending or every ``flush_interval`` seconds.
+
+    A failed batch is re-applied one operation per transaction, in order. An
+    operation the database rejects on its own is logged and dropped (retrying it
+    after the later operations would reorder them, e.g. resurrect a deleted
+    entry); a rebuild restores anything dropped. Connection-level errors keep
+    every operation for the next flush.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._ops: list[tuple] = []
+        self._oldest_enqueued: float | None = None
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_tasks: set[asyncio.Task] = set()
+        self._stopping = False
+        self._listeners: list[Callable[[list[tuple]], None]] = []
+        self.flushed_ops = 0
+        self.flushed_batches = 0
+        self.failed_batches = 0
+        self.dropped_ops = 0
+        self.last_flush_ms = 0.0
+        self.last_flush_at: float | None = None
+
+    def _enqueue(self, op: tuple) -> None:
+        if not self._ops:
+            self._oldest_enqueued = time.monotonic()
+        self._ops.append(op)
+        if len(self._ops) >= self.batch_size:
+            self._wakeup.set()
+
+    def upsert(self, item: dict[str, Any]) -> None:
+        self._enqueue(("upsert", item))
+
+    def delete(self, kind: str, ref_id: str) -> None:
+        self._enqueue(("delete", kind, ref_id))
+
+    def delete_children(self, parent_id: str) -> None:
+        self._enqueue(("delete_children", parent_id))
+
+    def add_listener(self, listener: Callable[[list[tuple]], None]) -> None:
+        """Call ``listener(ops)`` with every batch of operations after it is applied."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._stopping = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            # Let the worker finish the flush it may be in, then exit; no cancelling mid-apply.
+            self._stopping = True
+            self._wakeup.set()
+            await self._worker
+            self._worker = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._stopping:
+                await self.flush()
+
+    async def _apply_singly(self, ops: list[tuple]) -> tuple[list[tuple], list[tuple]]:
+        """Apply a failed batch one operation per transaction; returns (applied, to retry)."""
+        from db.database import engine
+
+        applied = []
+        for i, op in enumerate(ops):
+            try:
+                async with engine.begin() as conn:
+                    await _apply_ops(conn, [op])
+            except Exception as e:
+                if _is_transient(e):
+                    return applied, ops[i:]
+                self.dropped_ops += 1
+                logger.error("Dropping search index op %s %s: %s", op[0], _op_ref(op), e)
+            else:
+                applied.append(op)
+        return applied, []
+
+    async def flush(self) -> None:
+        """Apply every queued operation.
+
+        Runs in its own task so a cancelled caller does not lose the batch it
+        took off the queue.
+        """
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+        await asyncio.shield(task)
+
+    async def _flush(self) -> None:
+        from db.database import engine
+
+        async with self._flush_lock:
+            if not self._ops:
+                return
+            ops, oldest = self._ops, self._oldest_enqueued
+            self._ops, self._oldest_enqueued = [], None
+            start = time.perf_counter()
+            try:
+                async with engine.begin() as conn:
+                    await _apply_ops(conn, ops)
+            except Exception as e:
+                logger.error("Search index flush failed (%s ops): %s", len(ops), e)
+                self.failed_batches += 1
+                ops, retry = await self._apply_singly(ops)
+                if retry:
+                    # Keep them (ahead of newer operations) for the next attempt.
+                    self._ops = retry + self._ops
+                    self._oldest_enqueued = oldest
+                if not ops:
+                    return
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.last_flush_at = time.time()
+            self.flushed_ops += len(ops)
+            self.flushed_batches += 1
+            for listener in self._listeners:
+                try:
+                    listener(ops)
+                except Exception as e:
+                    logger.error("Search index listener failed: %s", e)
+
+    def stats(self) -> dict[str, Any]:
+        lag = time.monotonic() - self._oldest_enqueued if self._oldest_enqueued else 0.0
+        return {
+            "pending_ops": len(self._ops),
+            "lag_seconds": round(lag, 3),
+            "flushed_ops": self.flushed_ops,
+            "flushed_batches": self.flushed_batches,
+            "failed_batches": self.failed_batches,
+            "dropped_ops": self.dropped_ops,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "last_flush_at": self.last_flush_at,
+            "running": self._worker is not None and not self._worker.done(),
+        }
+
+
+def _is_transient(error: Exception) -> bool:
+    """The database (not the operation) failed: keep everything for the next flush."""
+    return isinstance(error, (OperationalError, OSError, asyncio.TimeoutError)) or getattr(
+        error, "connection_invalidated", False
+    )
+
+
+def _op_ref(op: tuple) -> str:
+    return f"{op[1]['kind']}:{op[1]['ref_id']}" if op[0] == "upsert" else ":".join(op[1:])
+
+
+async def _apply_ops(conn: AsyncConnection, ops: list[tuple]) -> None:
+    """Apply queued operations in order, sending runs of upserts as one executemany."""
+    pending: dict[tuple[str, str], dict[str, Any]] = {}
+
+    async def drain_upserts() -> None:
+        if pending:
+            await upsert_entries(conn, pending.values())
+            pending.clear()
+
+    for op in ops:
+        if op[0] == "upsert":
+            item = op[1]
+            pending[(item["kind"], item["ref_id"])] = item
+            continue
+        await drain_upserts()
+        if op[0] == "delete":
+            await delete_entries(conn, op[1], [op[2]])
+        elif op[0] == "delete_children":
+            await delete_children(conn, [op[1]])
+    await drain_upserts()
+
+
+index_queue = SearchIndexQueue()
+
+
+if __name__ == "__main__":
+    # Run from backend/: python -m utils.search_index rebuild
+    import argparse
+
+    from utils.env_loader import load_backend_env
+
+    load_backend_env()
+
+    parser = argparse.ArgumentParser(description="Workspace search index maintenance")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: repopulate the index from the database")
+    args = parser.parse_args()
+
+    async def _rebuild() -> int:
+        from db.database import init_db
+
+        await init_db()
+        return await rebuild_search_index()
+
+    if args.command == "rebuild":
+        print(f"Indexed {asyncio.run(_rebuild())} entries")
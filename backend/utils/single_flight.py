@@ -0,0 +1,180 @@
+"""Coalesce identical in-flight LLM requests.
+
+When the same prompt is requested again while a call for it is still running
+(many users analyzing one popular document, a client retrying), the newcomer
+waits for that call instead of starting its own: ``SingleFlight.do`` shares one
+result among all waiters, ``SingleFlight.stream`` fans the chunks of one upstream
+stream out to every subscriber (a late subscriber first gets the chunks already
+produced). Nothing is kept once the call finishes; repeated requests over time
+are the response cache's job.
+
+The upstream call runs in its own task, so one waiter going away does not
+cancel it for the others; it is cancelled when the last waiter leaves.
+``SINGLE_FLIGHT=off`` disables coalescing.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
+
+ENABLED = os.getenv("SINGLE_FLIGHT", "on").strip().lower() not in ("off", "false", "0")
+
+
+def prompt_key(*parts: str | Iterable[str]) -> str:
+    """Digest of the strings (or iterables of strings) making up a request."""
+    digest = hashlib.sha256()
+    for part in parts:
+        for text in [part] if isinstance(part, str) else part:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """One upstream stream; every subscriber reads all of its chunks."""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: Exception | None = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        except asyncio.CancelledError:
+            # A truncated stream must not look complete to anyone still reading it.
+            self.error = RuntimeError("Upstream stream was cancelled")
+            raise
+        finally:
+            self.done = True
+            self._notify()
+
+    async def chunks_from_start(self) -> AsyncIterator[str]:
+        i = 0
+        while True:
+            if i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = ENABLED):
+        self.enabled = enabled
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _Broadcast] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.upstream_streams = 0
+        self.coalesced_streams = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of ``fn()``, shared with concurrent callers of the same ``key``."""
+        if not self.enabled:
+            return await fn()
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+            self.upstream_calls += 1
+        else:
+            self.coalesced_calls += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Chunks of ``factory()``, one upstream stream shared by concurrent callers of ``key``."""
+        if not self.enabled:
+            async for chunk in factory():
+                yield chunk
+            return
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast(factory())
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(
+                lambda _: self._streams.pop(key, None) if self._streams.get(key) is broadcast else None
+            )
+            self.upstream_streams += 1
+        else:
+            self.coalesced_streams += 1
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.chunks_from_start():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                # Unlist it first so a caller arriving now starts a fresh stream instead of joining this one.
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "upstream_streams": self.upstream_streams,
+            "coalesced_streams": self.coalesced_streams,
+        }
+
+
+llm_flight = SingleFlight()
+
+
+def coalesce(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Agent method decorator: concurrent calls with equal arguments share one run.
+
+    Callers get a shallow copy of a dict result, so they can add to it freely.
+    """
+
+    @functools.wraps(method)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        key = prompt_key(
+            method.__qualname__,
+            self.model_name,
+            (repr(arg) for arg in args),
+            (f"{name}={value!r}" for name, value in sorted(kwargs.items())),
+        )
+        result = await llm_flight.do(key, lambda: method(self, *args, **kwargs))
+        return dict(result) if isinstance(result, dict) else result
+
+    return wrapper
@@ -0,0 +1,143 @@
+"""Server-Sent Events framing for streamed chat responses.
+
+``SSEWriter.content_frames`` turns a stream of LLM token chunks into SSE frames,
+coalescing chunks that arrive within ``max_delay`` seconds (or until
+``max_chars`` are buffered) into one ``{"content": ...}`` frame. The first chunk
+is sent at once so time to first token is unchanged; after that a fast model
+produces a few frames per second instead of one per token, each serialized with
+orjson. The streamed text is kept as a list of parts (``text``), not grown by
+string concatenation.
+
+SSE responses must not pass through gzip, which buffers them;
+``StreamingGZipMiddleware`` skips the listed streaming paths. ``EventStreamResponse``
+closes the frame generator (and so the model stream) when the client disconnects.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, AsyncIterator, Sequence
+
+import orjson
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import StreamingResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_MS", "30")) / 1000
+COALESCE_CHARS = int(os.getenv("SSE_COALESCE_CHARS", "512"))
+
+DONE_FRAME = b"data: [DONE]\n\n"
+_END = object()
+
+
+def sse_frame(payload: Any) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+class SSEWriter:
+    def __init__(self, max_delay: float = COALESCE_SECONDS, max_chars: int = COALESCE_CHARS):
+        self.max_delay = max_delay
+        self.max_chars = max_chars
+        self.parts: list[str] = []
+        self.frames = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def start_frame(self, payload: dict[str, Any]) -> bytes:
+        return sse_frame(payload)
+
+    def _content_frame(self, buffer: list[str]) -> bytes:
+        self.frames += 1
+        return sse_frame({"content": "".join(buffer)})
+
+    async def content_frames(self, chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+        """Frames for ``chunks``; every chunk is also appended to ``parts``."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump() -> None:
+            try:
+                async for chunk in chunks:
+                    queue.put_nowait(chunk)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(_END)
+
+        reader = asyncio.create_task(pump())
+        buffer: list[str] = []
+        buffered_chars = 0
+        deadline = 0.0
+        try:
+            while True:
+                if buffer:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        yield self._content_frame(buffer)
+                        buffer, buffered_chars = [], 0
+                        continue
+                else:
+                    item = await queue.get()
+
+                if item is _END or isinstance(item, Exception):
+                    if buffer:
+                        yield self._content_frame(buffer)
+                    if item is _END:
+                        return
+                    raise item
+                if not item:
+                    continue
+                self.parts.append(item)
+                if self.frames == 0:
+                    yield self._content_frame([item])
+                    continue
+                if not buffer:
+                    deadline = loop.time() + self.max_delay
+                buffer.append(item)
+                buffered_chars += len(item)
+                if buffered_chars >= self.max_chars:
+                    yield self._content_frame(buffer)
+                    buffer, buffered_chars = [], 0
+        finally:
+            # Client went away or the stream failed: stop reading from the model.
+            reader.cancel()
+
+
+class EventStreamResponse(StreamingResponse):
+    """Event stream that closes its generator as soon as the response ends.
+
+    On client disconnect Starlette stops sending (cancelling the response or
+    failing the next send), but a generator suspended at ``yield`` would only be
+    finalized when garbage collected; closing it here cancels the model stream
+    behind it at once.
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], **kwargs: Any):
+        kwargs.setdefault("media_type", "text/event-stream")
+        kwargs.setdefault("headers", {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        super().__init__(content, **kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+class StreamingGZipMiddleware(GZipMiddleware):
+    """GZip, except for the given path prefixes (event streams must be flushed frame by frame)."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, exclude_paths: Sequence[str] = ()):
+        super().__init__(app, minimum_size=minimum_size)
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,88 @@
+"""Run a small dependency graph of async steps concurrently.
+
+Each ``Step`` starts as soon as the steps it depends on have finished, runs under
+its own timeout, and is timed. A step with a ``fallback`` is optional: if it
+fails or times out the graph continues with the fallback value; any other
+failure cancels the remaining steps and propagates.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Sequence
+
+from utils.logger import logger
+
+_REQUIRED = object()
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    # Called with the results of the steps finished so far (at least those in ``after``).
+    run: Callable[[dict[str, Any]], Awaitable[Any]]
+    after: tuple[str, ...] = ()
+    timeout: float | None = None
+    fallback: Any = _REQUIRED
+
+
+async def run_steps(steps: Sequence[Step]) -> tuple[dict[str, Any], dict[str, float]]:
+    """Run ``steps`` (listed after their dependencies); returns (results, milliseconds per step)."""
+    results: dict[str, Any] = {}
+    timings: dict[str, float] = {}
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run_one(step: Step) -> None:
+        for dependency in step.after:
+            await tasks[dependency]
+        start = time.perf_counter()
+        try:
+            results[step.name] = await asyncio.wait_for(step.run(results), step.timeout)
+        except Exception as e:
+            if step.fallback is _REQUIRED:
+                raise
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+            logger.warning(f"Step {step.name} {reason}; continuing without it")
+            results[step.name] = step.fallback
+        finally:
+            timings[step.name] = round((time.perf_counter() - start) * 1000, 2)
+
+    started = time.perf_counter()
+    for step in steps:
+        tasks[step.name] = asyncio.create_task(run_one(step))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        # Let cancelled steps unwind (e.g. roll back a session) before the caller moves on.
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    return results, timings
+
+
+class StepTimings:
+    """Recent per-step durations, summarized as percentiles for the metrics endpoint."""
+
+    def __init__(self, window: int = 500):
+        self._samples: dict[str, deque[float]] = {}
+        self.window = window
+
+    def record(self, timings: dict[str, float]) -> None:
+        for name, ms in timings.items():
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(ms)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        summary = {}
+        for name, samples in self._samples.items():
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2],
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_ms": ordered[-1],
+            }
+        return summary
@@ -0,0 +1,219 @@
+"""Per-user prefix index for search autocomplete.
+
+Each user gets a sorted term dictionary of ``(key, phrase)`` pairs, where keys
+are the whole phrase and each of its words, so a prefix lookup is a bisect plus
+a short scan. Phrases come from conversation titles, task titles, document
+filenames and the user's own search queries, and are ranked by frequency and
+recency. Indexes are built from the database on first use and kept in an LRU
+so cold users are evicted. A user's own queries are capped at the
+``MAX_QUERY_PHRASES`` most recent distinct ones.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import calendar
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import select
+
+from db.database import Conversation, Task, async_session_maker
+
+MAX_USERS = int(os.getenv("SUGGESTION_INDEX_MAX_USERS", "1000"))
+RECENCY_HALF_LIFE_SECONDS = 14 * 24 * 3600
+_SCAN_LIMIT = 256
+_MAX_TITLES = 2000
+MAX_QUERY_PHRASES = int(os.getenv("SUGGESTION_INDEX_MAX_QUERIES", "200"))
+_IGNORED_TITLES = {"new chat", "chat"}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def _epoch(value: Any) -> float:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return float(calendar.timegm(value.utctimetuple()))
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class _UserTerms:
+    __slots__ = ("keys", "phrases", "queries")
+
+    def __init__(self) -> None:
+        self.keys: list[tuple[str, str]] = []
+        # normalized phrase -> [display text, frequency, last seen epoch]
+        self.phrases: dict[str, list] = {}
+        # normalized query -> times searched, least recently searched first
+        self.queries: OrderedDict[str, int] = OrderedDict()
+
+    def add(self, text: str, ts: float | None = None, weight: int = 1) -> None:
+        norm = _normalize(text)
+        if not norm or norm in _IGNORED_TITLES:
+            return
+        seen = ts if ts is not None else time.time()
+        info = self.phrases.get(norm)
+        if info is None:
+            self.phrases[norm] = [" ".join(text.split()), weight, seen]
+            for key in {norm, *norm.split()}:
+                bisect.insort(self.keys, (key, norm))
+            return
+        info[1] += weight
+        info[2] = max(info[2], seen)
+
+    def add_query(self, text: str, max_queries: int = MAX_QUERY_PHRASES) -> None:
+        norm = _normalize(text)
+        if not norm or norm in _IGNORED_TITLES:
+            return
+        self.add(text)
+        self.queries[norm] = self.queries.get(norm, 0) + 1
+        self.queries.move_to_end(norm)
+        while len(self.queries) > max_queries:
+            oldest, count = self.queries.popitem(last=False)
+            self._drop(oldest, count)
+
+    def remove(self, text: str) -> None:
+        self._drop(_normalize(text), 1)
+
+    def _drop(self, norm: str, count: int) -> None:
+        info = self.phrases.get(norm)
+        if info is None:
+            return
+        info[1] -= count
+        if info[1] > 0:
+            return
+        del self.phrases[norm]
+        for key in {norm, *norm.split()}:
+            i = bisect.bisect_left(self.keys, (key, norm))
+            if i < len(self.keys) and self.keys[i] == (key, norm):
+                del self.keys[i]
+
+    def lookup(self, prefix: str, limit: int) -> list[str]:
+        p = _normalize(prefix)
+        if not p:
+            return []
+        now = time.time()
+        matches: dict[str, float] = {}
+        i = bisect.bisect_left(self.keys, (p, ""))
+        end = min(len(self.keys), i + _SCAN_LIMIT)
+        while i < end and self.keys[i][0].startswith(p):
+            norm = self.keys[i][1]
+            if norm not in matches:
+                _, freq, seen = self.phrases[norm]
+                recency = 0.5 ** (max(now - seen, 0.0) / RECENCY_HALF_LIFE_SECONDS)
+                matches[norm] = (1.0 + math.log(freq)) * (0.25 + recency)
+            i += 1
+        ranked = sorted(matches, key=matches.__getitem__, reverse=True)[:limit]
+        return [self.phrases[norm][0] for norm in ranked]
+
+
+class SuggestionIndex:
+    """LRU of per-user prefix indexes with incremental updates."""
+
+    def __init__(self, max_users: int = MAX_USERS):
+        self.max_users = max_users
+        self._users: OrderedDict[str, _UserTerms] = OrderedDict()
+        self._building: dict[str, asyncio.Task] = {}
+
+    async def suggest(self, user_id: str, prefix: str, limit: int = 8) -> list[str]:
+        terms = await self._get(str(user_id))
+        return terms.lookup(prefix, limit)
+
+    async def _get(self, uid: str) -> _UserTerms:
+        terms = self._users.get(uid)
+        if terms is not None:
+            self._users.move_to_end(uid)
+            return terms
+
+        task = self._building.get(uid)
+        if task is None:
+            task = asyncio.ensure_future(self._build(uid))
+            self._building[uid] = task
+            task.add_done_callback(lambda _t: self._building.pop(uid, None))
+        # Shielded: autocomplete requests are often cancelled mid-typing, and
+        # other requests may be waiting on the same build.
+        terms = await asyncio.shield(task)
+
+        self._users[uid] = terms
+        self._users.move_to_end(uid)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return terms
+
+    async def _build(self, uid: str) -> _UserTerms:
+        from utils.document_store import list_documents
+
+        terms = _UserTerms()
+        # Own session: the build outlives whichever request started it.
+        async with async_session_maker() as db:
+            conversations = (
+                await db.execute(
+                    select(Conversation.title, Conversation.updated_at)
+                    .where(Conversation.user_id == uid)
+                    .order_by(Conversation.updated_at.desc())
+                    .limit(_MAX_TITLES)
+                )
+            ).all()
+            tasks = (
+                await db.execute(
+                    select(Task.title, Task.updated_at, Task.created_at).where(Task.user_id == uid)
+                )
+            ).all()
+        for title, updated_at in conversations:
+            if title:
+                terms.add(title, _epoch(updated_at))
+        for title, updated_at, created_at in tasks:
+            if title:
+                terms.add(title, _epoch(updated_at or created_at))
+
+        for doc in list_documents(user_id=uid):
+            name = doc.get("filename") or doc.get("name")
+            if name:
+                terms.add(name, _epoch(doc.get("created_at")))
+        return terms
+
+    # Incremental updates only touch users that are currently loaded; cold users
+    # are rebuilt from the database on their next lookup.
+    def add(self, user_id: str, text: str | None) -> None:
+        terms = self._users.get(str(user_id))
+        if terms is not None and text:
+            terms.add(text)
+
+    def remove(self, user_id: str, text: str | None) -> None:
+        terms = self._users.get(str(user_id))
+        if terms is not None and text:
+            terms.remove(text)
+
+    def replace(self, user_id: str, old: str | None, new: str | None) -> None:
+        if old != new:
+            self.remove(user_id, old)
+            self.add(user_id, new)
+
+    def record_query(self, user_id: str, query: str) -> None:
+        terms = self._users.get(str(user_id))
+        if terms is not None and len(query.strip()) >= 3:
+            terms.add_query(query)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "users": len(self._users),
+            "max_users": self.max_users,
+            "phrases": sum(len(t.phrases) for t in self._users.values()),
+            "query_phrases": sum(len(t.queries) for t in self._users.values()),
+            "keys": sum(len(t.keys) for t in self._users.values()),
+        }
+
+
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,48 @@
+"""Token counts and per-model prompt budgets for conversation history.
+
+Counts are an estimate: the Groq/Ollama Llama and Gemma models have no local
+tokenizer among our dependencies, and the history window only needs to be
+roughly right. Each message is counted once when it is saved (the count is
+stored in ``messages.token_count``) and the count travels with the message in
+conversation memory, so building a prompt never re-scans old turns.
+"""
+from __future__ import annotations
+
+import os
+import re
+from functools import lru_cache
+
+# Role markers and separators the chat template adds around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Tokens of history (rolling summary + recent turns) sent with each prompt. Small
+# models and tight free-tier rate limits get less; long-context models get more.
+MODEL_HISTORY_BUDGETS = {
+    "llama-3.1-8b-instant": 2000,
+    "llama-3.3-70b-versatile": 3000,
+    "mixtral-8x7b-32768": 6000,
+    "gemma2-9b-it": 1500,
+    "gpt-4-turbo-preview": 6000,
+    "gpt-4o-mini": 6000,
+    # Ollama's default context window is 2048 tokens.
+    "llama3.1": 1000,
+}
+DEFAULT_HISTORY_BUDGET = 2000
+# Overrides the per-model table when set.
+_BUDGET_OVERRIDE = os.getenv("HISTORY_TOKEN_BUDGET")
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+# The chat path counts the same string twice (memory append and DB save);
+# a small memo makes the second call free without pinning many large texts.
+@lru_cache(maxsize=64)
+def count_tokens(text: str) -> int:
+    """Estimated tokens in ``text``: one per word or symbol, plus one per 6 extra chars of long words."""
+    return sum(1 + len(piece) // 6 for piece in _PIECE.findall(text))
+
+
+def history_budget(model: str | None) -> int:
+    if _BUDGET_OVERRIDE:
+        return int(_BUDGET_OVERRIDE)
+    return MODEL_HISTORY_BUDGETS.get(model or "", DEFAULT_HISTORY_BUDGET)
@@ -0,0 +1,231 @@
+"""Trending searches from streaming heavy-hitter sketches.
+
+Queries are counted with Space-Saving (fixed number of counters, so memory is
+constant regardless of query volume) using exponentially time-decayed counts at
+two horizons. The long horizon ranks queries; comparing the short- and
+long-horizon rates gives the trend direction. One sketch is kept globally and
+one per recently active user (LRU), and all of them are snapshotted to disk.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from utils.logger import logger
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+SNAPSHOT_FILE = Path(os.getenv("TRENDING_SNAPSHOT_PATH", str(BACKEND_ROOT / "search_trending.json")))
+SNAPSHOT_INTERVAL_SECONDS = 60.0
+
+SHORT_HALF_LIFE_SECONDS = 3600.0
+LONG_HALF_LIFE_SECONDS = 24 * 3600.0
+# A query must have been searched by roughly this many different users before it
+# shows up in the global list, so one person's searches are never broadcast.
+MIN_GLOBAL_COUNT = 3.0
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())[:100]
+
+
+class DecayingSpaceSaving:
+    """Space-Saving top-k sketch with exponentially decayed counts.
+
+    Counts are stored scaled by ``exp(lambda * (t - landmark))`` so that decaying
+    every counter is free; the landmark is moved forward before the scale factor
+    grows large.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        short_half_life: float = SHORT_HALF_LIFE_SECONDS,
+        long_half_life: float = LONG_HALF_LIFE_SECONDS,
+    ):
+        self.capacity = capacity
+        self._short_rate = math.log(2) / short_half_life
+        self._long_rate = math.log(2) / long_half_life
+        self._landmark = time.time()
+        # query -> [long count, short count, overestimation error (long)], all scaled
+        self._counters: dict[str, list[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._counters
+
+    def _rescale(self, now: float) -> None:
+        long_factor = math.exp(-self._long_rate * (now - self._landmark))
+        short_factor = math.exp(-self._short_rate * (now - self._landmark))
+        for counter in self._counters.values():
+            counter[0] *= long_factor
+            counter[1] *= short_factor
+            counter[2] *= long_factor
+        self._landmark = now
+
+    def add(self, key: str, now: float | None = None) -> None:
+        now = now if now is not None else time.time()
+        if self._short_rate * (now - self._landmark) > 20:
+            self._rescale(now)
+        long_weight = math.exp(self._long_rate * (now - self._landmark))
+        short_weight = math.exp(self._short_rate * (now - self._landmark))
+
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += long_weight
+            counter[1] += short_weight
+            return
+        if len(self._counters) < self.capacity:
+            self._counters[key] = [long_weight, short_weight, 0.0]
+            return
+        # Replace the smallest counter; the newcomer inherits its count as error.
+        victim = min(self._counters, key=lambda k: self._counters[k][0])
+        low = self._counters.pop(victim)
+        self._counters[key] = [low[0] + long_weight, low[1] + short_weight, low[0]]
+
+    def count(self, key: str, now: float | None = None) -> float:
+        counter = self._counters.get(key)
+        if counter is None:
+            return 0.0
+        now = now if now is not None else time.time()
+        return counter[0] * math.exp(-self._long_rate * (now - self._landmark))
+
+    def top(self, n: int, now: float | None = None, min_count: float = 0.0) -> list[dict[str, Any]]:
+        now = now if now is not None else time.time()
+        long_scale = math.exp(-self._long_rate * (now - self._landmark))
+        short_scale = math.exp(-self._short_rate * (now - self._landmark))
+        best = heapq.nlargest(n, self._counters.items(), key=lambda item: item[1][0])
+
+        trending = []
+        for query, (long_count, short_count, _) in best:
+            count = long_count * long_scale
+            if round(count, 1) < min_count:
+                continue
+            # Events/second over each horizon: decayed count * decay rate.
+            short_rate = short_count * short_scale * self._short_rate
+            long_rate = count * self._long_rate
+            if short_rate > long_rate * 1.25:
+                trend = "up"
+            elif short_rate < long_rate * 0.75:
+                trend = "down"
+            else:
+                trend = "stable"
+            trending.append({"query": query, "count": round(count, 1), "trend": trend})
+        return trending
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"landmark": self._landmark, "counters": {k: list(v) for k, v in self._counters.items()}}
+
+    def load_dict(self, data: dict[str, Any]) -> None:
+        self._landmark = float(data.get("landmark", time.time()))
+        counters = data.get("counters") or {}
+        largest = heapq.nlargest(self.capacity, counters.items(), key=lambda item: item[1][0])
+        self._counters = {k: [float(x) for x in v] for k, v in largest}
+
+
+class TrendingSearches:
+    """Global and per-user trending queries with periodic disk snapshots."""
+
+    def __init__(self, global_capacity: int = 512, user_capacity: int = 32, max_users: int = 5000):
+        self.user_capacity = user_capacity
+        self.max_users = max_users
+        self.global_sketch = DecayingSpaceSaving(global_capacity)
+        self._users: OrderedDict[str, DecayingSpaceSaving] = OrderedDict()
+        self._snapshot_task: asyncio.Task | None = None
+
+    def record(self, user_id: str, query: str) -> None:
+        key = normalize_query(query)
+        if len(key) < 2:
+            return
+        uid = str(user_id)
+        sketch = self._users.get(uid)
+        if sketch is None:
+            sketch = DecayingSpaceSaving(self.user_capacity)
+            self._users[uid] = sketch
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(uid)
+
+        # Count a query globally once per user while it is still in their sketch,
+        # so the global list approximates distinct searchers, not raw volume.
+        if key not in sketch:
+            self.global_sketch.add(key)
+        sketch.add(key)
+
+    def top(self, n: int = 10, user_id: str | None = None) -> list[dict[str, Any]]:
+        if user_id is None:
+            return self.global_sketch.top(n, min_count=MIN_GLOBAL_COUNT)
+        sketch = self._users.get(str(user_id))
+        return sketch.top(n) if sketch else []
+
+    def snapshot_data(self) -> dict[str, Any]:
+        """Copy of every sketch; call on the event loop, where ``record`` mutates them."""
+        return {
+            "global": self.global_sketch.to_dict(),
+            "users": {uid: sketch.to_dict() for uid, sketch in self._users.items()},
+        }
+
+    def snapshot(self, path: Path = SNAPSHOT_FILE) -> None:
+        _write_snapshot(self.snapshot_data(), path)
+
+    async def save(self, path: Path = SNAPSHOT_FILE) -> None:
+        """Snapshot to disk: copy on the event loop, encode and write in a thread."""
+        await asyncio.to_thread(_write_snapshot, self.snapshot_data(), path)
+
+    def load(self, path: Path = SNAPSHOT_FILE) -> None:
+        if not path.is_file():
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable trending snapshot: {e}")
+            return
+        self.global_sketch.load_dict(data.get("global") or {})
+        self._users.clear()
+        for uid, sketch_data in list((data.get("users") or {}).items())[-self.max_users:]:
+            sketch = DecayingSpaceSaving(self.user_capacity)
+            sketch.load_dict(sketch_data)
+            self._users[uid] = sketch
+
+    def start(self, interval: float = SNAPSHOT_INTERVAL_SECONDS) -> None:
+        self.load()
+        if self._snapshot_task is None or self._snapshot_task.done():
+            self._snapshot_task = asyncio.create_task(self._run_snapshots(interval))
+
+    async def stop(self) -> None:
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        try:
+            await self.save()
+        except Exception as e:
+            logger.warning(f"Trending snapshot failed: {e}")
+
+    async def _run_snapshots(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.warning(f"Trending snapshot failed: {e}")
+
+
+def _write_snapshot(data: dict[str, Any], path: Path) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+trending_searches = TrendingSearches()
@@ -0,0 +1,587 @@
+"""Embedding index for hybrid (lexical + vector) workspace search.
+
+Conversation titles, chat messages and tasks are embedded in batches by a
+background worker fed from the search index queue, and stored in
+``search_vectors`` partitioned by user. At query time a user's vectors are
+loaded into one normalized matrix (kept in a byte-bounded LRU), so scoring is a
+single matrix-vector product. Without an embeddings provider this module is a
+no-op and workspace search stays lexical.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from utils.logger import logger
+from utils.search_index import KIND_CONVERSATION, KIND_MESSAGE, KIND_TASK, is_sqlite
+
+EMBED_KINDS = (KIND_CONVERSATION, KIND_MESSAGE, KIND_TASK)
+EMBED_BATCH_SIZE = int(os.getenv("SEARCH_EMBED_BATCH_SIZE", "64"))
+# Items waiting to be embedded; past this (provider down) the oldest are dropped for backfill to recover.
+MAX_PENDING = int(os.getenv("SEARCH_EMBED_MAX_PENDING", "10000"))
+MAX_MATRIX_BYTES = int(os.getenv("SEARCH_VECTOR_CACHE_BYTES", str(256 * 1024 * 1024)))
+MIN_SIMILARITY = float(os.getenv("SEARCH_VECTOR_MIN_SIMILARITY", "0.3"))
+MAX_EMBED_CHARS = 2000
+QUERY_TIMEOUT_SECONDS = 3.0
+# After a provider failure, stay lexical-only for a while instead of failing every request.
+RETRY_AFTER_SECONDS = 300.0
+
+_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS search_vectors (
+        kind VARCHAR NOT NULL,
+        ref_id VARCHAR NOT NULL,
+        user_id VARCHAR NOT NULL,
+        parent_id VARCHAR,
+        model VARCHAR NOT NULL,
+        content_hash VARCHAR NOT NULL,
+        vector {blob} NOT NULL,
+        PRIMARY KEY (kind, ref_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_search_vectors_user ON search_vectors (user_id, model)",
+    "CREATE INDEX IF NOT EXISTS ix_search_vectors_parent ON search_vectors (parent_id)",
+    """
+    CREATE TABLE IF NOT EXISTS search_vector_checkpoints (
+        name VARCHAR PRIMARY KEY,
+        last_id BIGINT NOT NULL
+    )
+    """,
+]
+
+_UPSERT_SQL = text(
+    """
+    INSERT INTO search_vectors (kind, ref_id, user_id, parent_id, model, content_hash, vector)
+    VALUES (:kind, :ref_id, :user_id, :parent_id, :model, :content_hash, :vector)
+    ON CONFLICT (kind, ref_id) DO UPDATE SET
+        user_id = excluded.user_id,
+        parent_id = excluded.parent_id,
+        model = excluded.model,
+        content_hash = excluded.content_hash,
+        vector = excluded.vector
+    """
+)
+
+_CHECKPOINT_SQL = text(
+    """
+    INSERT INTO search_vector_checkpoints (name, last_id) VALUES (:name, :last_id)
+    ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+    """
+)
+
+
+def _create_embeddings() -> tuple[Any, str | None]:
+    """OpenAI when keyed, else Ollama when ``USE_OLLAMA=true`` (off by default, like the chat agents)."""
+    if os.getenv("SEARCH_EMBEDDINGS", "on").lower() in ("off", "false", "0"):
+        return None, None
+    try:
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if openai_api_key:
+            from langchain_openai import OpenAIEmbeddings
+
+            model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+            return OpenAIEmbeddings(openai_api_key=openai_api_key, model=model), f"openai:{model}"
+        if os.getenv("USE_OLLAMA", "false").lower() == "true":
+            from langchain_community.embeddings import OllamaEmbeddings
+
+            model = os.getenv("OLLAMA_MODEL", "llama3.1")
+            embeddings = OllamaEmbeddings(
+                base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+                model=model,
+            )
+            return embeddings, f"ollama:{model}"
+    except ImportError as e:
+        logger.warning(f"Semantic search disabled, embeddings package missing: {e}")
+    return None, None
+
+
+def embed_text(item: dict[str, Any]) -> str:
+    parts = [item.get("title") or "", item.get("body") or ""]
+    return "\n".join(p for p in parts if p).strip()[:MAX_EMBED_CHARS]
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _normalized(vectors: list[list[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class _UserVectors:
+    """A user's vectors; rows past ``count`` are spare capacity, doubled when full."""
+
+    __slots__ = ("keys", "positions", "count", "_kinds", "_rows")
+
+    def __init__(self, keys: list[tuple[str, str, str | None]], matrix: np.ndarray):
+        self.keys = keys
+        self.positions = {(kind, ref_id): i for i, (kind, ref_id, _) in enumerate(keys)}
+        self.count = len(keys)
+        self._kinds = np.array([EMBED_KINDS.index(k[0]) for k in keys], dtype=np.int8)
+        self._rows = matrix
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._rows[: self.count]
+
+    @property
+    def kinds(self) -> np.ndarray:
+        return self._kinds[: self.count]
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows.nbytes
+
+    def put(self, kind: str, ref_id: str, parent_id: str | None, vector: np.ndarray) -> None:
+        i = self.positions.get((kind, ref_id))
+        if i is not None:
+            self._rows[i] = vector
+            return
+        if self.count == len(self._rows):
+            self._grow(vector.shape[0])
+        i = self.count
+        self._rows[i] = vector
+        self._kinds[i] = EMBED_KINDS.index(kind)
+        self.positions[(kind, ref_id)] = i
+        self.keys.append((kind, ref_id, parent_id))
+        self.count += 1
+
+    def _grow(self, dim: int) -> None:
+        capacity = max(2 * len(self._rows), 16)
+        rows = np.empty((capacity, dim), dtype=np.float32)
+        kinds = np.empty(capacity, dtype=np.int8)
+        if self.count:
+            rows[: self.count] = self._rows[: self.count]
+            kinds[: self.count] = self._kinds[: self.count]
+        self._rows, self._kinds = rows, kinds
+
+
+class VectorIndex:
+    """Background embedding worker plus per-user in-memory vector search."""
+
+    def __init__(self, batch_size: int = EMBED_BATCH_SIZE, flush_interval: float = 2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._embeddings: Any = None
+        self.model: str | None = None
+        self._configured = False
+        self._unavailable_until = 0.0
+        # (kind, ref_id) -> index entry waiting to be embedded
+        self._pending: dict[tuple[str, str], dict[str, Any]] = {}
+        self.max_pending = MAX_PENDING
+        self._deletes: list[tuple[str, ...]] = []
+        self._users: OrderedDict[str, _UserVectors] = OrderedDict()
+        self._loading: dict[str, asyncio.Task] = {}
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.embedded = 0
+        self.skipped_unchanged = 0
+        self.dropped_pending = 0
+        self.failed_batches = 0
+        self.last_flush_ms = 0.0
+
+    def configure(self, embeddings: Any, model: str | None) -> None:
+        self._embeddings, self.model = embeddings, model
+        self._configured = True
+
+    def _provider(self) -> Any:
+        if not self._configured:
+            self.configure(*_create_embeddings())
+            if self.model:
+                logger.info(f"Semantic search embeddings: {self.model}")
+        return self._embeddings
+
+    @property
+    def enabled(self) -> bool:
+        return self._provider() is not None and time.monotonic() >= self._unavailable_until
+
+    def _mark_unavailable(self, error: Exception) -> None:
+        logger.warning(f"Embeddings unavailable, using lexical search only: {error}")
+        self._unavailable_until = time.monotonic() + RETRY_AFTER_SECONDS
+
+    # -- ingestion -----------------------------------------------------------------
+
+    def on_index_ops(self, ops: list[tuple]) -> None:
+        """Search index queue listener: mirror applied index updates into the embedding queue."""
+        for op in ops:
+            if op[0] == "upsert":
+                item = op[1]
+                if item["kind"] in EMBED_KINDS:
+                    self._pending[(item["kind"], item["ref_id"])] = item
+                    if len(self._pending) > self.max_pending:
+                        self._drop_oldest_pending()
+            elif op[0] == "delete":
+                self._pending.pop((op[1], op[2]), None)
+                self._deletes.append(op)
+            elif op[0] == "delete_children":
+                for key in [k for k, item in self._pending.items() if item.get("parent_id") == op[1]]:
+                    del self._pending[key]
+                self._deletes.append(op)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _drop_oldest_pending(self) -> None:
+        # Backfill embeds whatever has no vector, so dropped items are recoverable.
+        if not self.dropped_pending % 1000:
+            logger.warning(
+                f"Embedding backlog over {self.max_pending} items; dropping the oldest "
+                f"(run `python -m utils.vector_index backfill` once embeddings are back)"
+            )
+        del self._pending[next(iter(self._pending))]
+        self.dropped_pending += 1
+
+    def start(self) -> None:
+        from utils.search_index import index_queue
+
+        if self._provider() is None:
+            logger.info("Semantic search disabled (no embeddings provider configured)")
+            return
+        index_queue.add_listener(self.on_index_ops)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Unembedded items are not flushed here: embedding can be slow, and the
+        # backfill job picks up anything left without a vector.
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self) -> None:
+        from db.database import engine
+
+        async with engine.begin() as conn:
+            await _create_schema(conn)
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        from db.database import engine
+
+        async with self._flush_lock:
+            if self._deletes:
+                deletes, self._deletes = self._deletes, []
+                async with engine.begin() as conn:
+                    for op in deletes:
+                        await self._apply_delete(conn, op)
+            # Deletes above need only the database; embedding waits out a provider failure.
+            while self._pending and time.monotonic() >= self._unavailable_until:
+                keys = list(itertools.islice(self._pending, self.batch_size))
+                items = [self._pending.pop(key) for key in keys]
+                if not await self._embed_and_store(items):
+                    for item in items:
+                        self._pending.setdefault((item["kind"], item["ref_id"]), item)
+                    return
+
+    async def _apply_delete(self, conn: AsyncConnection, op: tuple) -> None:
+        if op[0] == "delete":
+            await conn.execute(
+                text("DELETE FROM search_vectors WHERE kind = :kind AND ref_id = :ref_id"),
+                {"kind": op[1], "ref_id": op[2]},
+            )
+            self._forget(lambda key: key[0] == op[1] and key[1] == op[2])
+        else:
+            await conn.execute(
+                text("DELETE FROM search_vectors WHERE parent_id = :parent_id"),
+                {"parent_id": op[1]},
+            )
+            self._forget(lambda key: key[2] == op[1])
+
+    def _forget(self, matches) -> None:
+        # Deletes are rare; drop affected users' matrices and reload them on demand.
+        for uid in [uid for uid, vectors in self._users.items() if any(matches(k) for k in vectors.keys)]:
+            del self._users[uid]
+
+    async def _embed_and_store(self, items: list[dict[str, Any]]) -> bool:
+        """Embed items whose text changed and write them; returns False if the provider failed."""
+        from db.database import engine
+
+        embeddings = self._provider()
+        texts = {(item["kind"], item["ref_id"]): embed_text(item) for item in items}
+        items = [item for item in items if texts[(item["kind"], item["ref_id"])]]
+        if embeddings is None or not items:
+            return True
+
+        async with engine.connect() as conn:
+            existing = await _existing_hashes(conn, [(i["kind"], i["ref_id"]) for i in items], self.model)
+        changed = [
+            item
+            for item in items
+            if existing.get((item["kind"], item["ref_id"])) != _content_hash(texts[(item["kind"], item["ref_id"])])
+        ]
+        self.skipped_unchanged += len(items) - len(changed)
+        if not changed:
+            return True
+
+        start = time.perf_counter()
+        try:
+            vectors = _normalized(
+                await embeddings.aembed_documents([texts[(i["kind"], i["ref_id"])] for i in changed])
+            )
+        except Exception as e:
+            self.failed_batches += 1
+            self._mark_unavailable(e)
+            return False
+
+        rows = [
+            {
+                "kind": item["kind"],
+                "ref_id": item["ref_id"],
+                "user_id": item["user_id"],
+                "parent_id": item.get("parent_id"),
+                "model": self.model,
+                "content_hash": _content_hash(texts[(item["kind"], item["ref_id"])]),
+                "vector": vector.tobytes(),
+            }
+            for item, vector in zip(changed, vectors)
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(_UPSERT_SQL, rows)
+
+        for item, vector in zip(changed, vectors):
+            loaded = self._users.get(item["user_id"])
+            if loaded is not None:
+                loaded.put(item["kind"], item["ref_id"], item.get("parent_id"), vector)
+        self.embedded += len(changed)
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return True
+
+    async def backfill(self, *, batch_size: int | None = None, restart: bool = False) -> int:
+        """Embed every indexed conversation, message and task that has no vector yet.
+
+        Progress is checkpointed by search entry id after each batch, so an
+        interrupted run resumes where it stopped.
+        """
+        from db.database import engine
+
+        if self._provider() is None:
+            raise RuntimeError("No embeddings provider configured (set OPENAI_API_KEY or USE_OLLAMA=true)")
+        size = batch_size or self.batch_size
+        name = f"backfill:{self.model}"
+        kinds = ", ".join(f"'{kind}'" for kind in EMBED_KINDS)
+        async with engine.begin() as conn:
+            await _create_schema(conn)
+            if restart:
+                await conn.execute(text("DELETE FROM search_vector_checkpoints WHERE name = :name"), {"name": name})
+            after = (
+                await conn.execute(
+                    text("SELECT last_id FROM search_vector_checkpoints WHERE name = :name"), {"name": name}
+                )
+            ).scalar() or 0
+
+        total = 0
+        while True:
+            async with engine.connect() as conn:
+                result = await conn.execute(
+                    text(
+                        f"""
+                        SELECT e.id, e.kind, e.ref_id, e.user_id, e.parent_id, e.title, e.body
+                        FROM search_entries e
+                        LEFT JOIN search_vectors v
+                          ON v.kind = e.kind AND v.ref_id = e.ref_id AND v.model = :model
+                        WHERE e.id > :after AND e.kind IN ({kinds}) AND v.ref_id IS NULL
+                        ORDER BY e.id
+                        LIMIT :limit
+                        """
+                    ),
+                    {"model": self.model, "after": after, "limit": size},
+                )
+                rows = [dict(row) for row in result.mappings()]
+            if not rows:
+                return total
+            if not await self._embed_and_store(rows):
+                raise RuntimeError("Embeddings provider failed; rerun to resume from the last checkpoint")
+            after = rows[-1]["id"]
+            async with engine.begin() as conn:
+                await conn.execute(_CHECKPOINT_SQL, {"name": name, "last_id": after})
+            total += len(rows)
+            logger.info(f"Embedded {total} search entries (checkpoint id {after})")
+
+    # -- querying ------------------------------------------------------------------
+
+    async def embed_query(self, query: str) -> np.ndarray | None:
+        key = " ".join(query.lower().split())
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+        try:
+            raw = await asyncio.wait_for(self._provider().aembed_query(key), timeout=QUERY_TIMEOUT_SECONDS)
+        except Exception as e:
+            self._mark_unavailable(e)
+            return None
+        vector = _normalized([raw])[0]
+        self._query_cache[key] = vector
+        while len(self._query_cache) > 512:
+            self._query_cache.popitem(last=False)
+        return vector
+
+    async def _user_vectors(self, uid: str) -> _UserVectors:
+        loaded = self._users.get(uid)
+        if loaded is not None:
+            self._users.move_to_end(uid)
+            return loaded
+
+        task = self._loading.get(uid)
+        if task is None:
+            task = asyncio.ensure_future(self._load(uid))
+            self._loading[uid] = task
+            task.add_done_callback(lambda _t: self._loading.pop(uid, None))
+        loaded = await task
+
+        self._users[uid] = loaded
+        self._users.move_to_end(uid)
+        total = sum(v.nbytes for v in self._users.values())
+        while len(self._users) > 1 and total > MAX_MATRIX_BYTES:
+            _, evicted = self._users.popitem(last=False)
+            total -= evicted.nbytes
+        return loaded
+
+    async def _load(self, uid: str) -> _UserVectors:
+        from db.database import engine
+
+        # Own connection, so a failure here never poisons the caller's transaction.
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT kind, ref_id, parent_id, vector FROM search_vectors "
+                    "WHERE user_id = :user_id AND model = :model"
+                ),
+                {"user_id": uid, "model": self.model},
+            )
+            rows = result.all()
+        keys, vectors = [], []
+        for kind, ref_id, parent_id, blob in rows:
+            keys.append((kind, ref_id, parent_id))
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return _UserVectors(keys, matrix)
+
+    async def search(
+        self,
+        user_id: str,
+        query: str,
+        kinds: list[str],
+        limit: int,
+    ) -> list[dict[str, Any]]:
+        """Top ``limit`` (kind, ref_id, parent_id, similarity) hits by cosine similarity."""
+        wanted = [EMBED_KINDS.index(k) for k in kinds if k in EMBED_KINDS]
+        if not wanted or not self.enabled:
+            return []
+        query_vector = await self.embed_query(query)
+        if query_vector is None:
+            return []
+        try:
+            vectors = await self._user_vectors(str(user_id))
+        except Exception as e:
+            logger.warning(f"Vector search skipped: {e}")
+            return []
+        if not vectors.keys or vectors.matrix.shape[1] != query_vector.shape[0]:
+            return []
+
+        similarity = vectors.matrix @ query_vector
+        similarity[~np.isin(vectors.kinds, wanted)] = -1.0
+        k = min(limit, len(similarity))
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top])]
+        return [
+            {
+                "kind": vectors.keys[i][0],
+                "ref_id": vectors.keys[i][1],
+                "parent_id": vectors.keys[i][2],
+                "similarity": float(similarity[i]),
+            }
+            for i in top
+            if similarity[i] >= MIN_SIMILARITY
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "pending": len(self._pending),
+            "pending_deletes": len(self._deletes),
+            "dropped_pending": self.dropped_pending,
+            "embedded": self.embedded,
+            "skipped_unchanged": self.skipped_unchanged,
+            "failed_batches": self.failed_batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "loaded_users": len(self._users),
+            "loaded_vectors": sum(len(v.keys) for v in self._users.values()),
+            "loaded_bytes": sum(v.nbytes for v in self._users.values()),
+            "running": self._worker is not None and not self._worker.done(),
+        }
+
+
+async def _create_schema(conn: AsyncConnection) -> None:
+    blob = "BLOB" if is_sqlite(conn) else "BYTEA"
+    for statement in _DDL:
+        await conn.execute(text(statement.format(blob=blob)))
+
+
+async def _existing_hashes(conn: AsyncConnection, keys: list[tuple[str, str]], model: str | None) -> dict[tuple[str, str], str]:
+    if not keys:
+        return {}
+    params: dict[str, Any] = {"model": model}
+    clauses = []
+    for i, (kind, ref_id) in enumerate(keys):
+        params[f"k{i}"], params[f"r{i}"] = kind, ref_id
+        clauses.append(f"(kind = :k{i} AND ref_id = :r{i})")
+    result = await conn.execute(
+        text(
+            f"SELECT kind, ref_id, content_hash FROM search_vectors "
+            f"WHERE model = :model AND ({' OR '.join(clauses)})"
+        ),
+        params,
+    )
+    return {(kind, ref_id): content_hash for kind, ref_id, content_hash in result.all()}
+
+
+vector_index = VectorIndex()
+
+
+if __name__ == "__main__":
+    # Run from backend/: python -m utils.vector_index backfill [--restart]
+    import argparse
+
+    from utils.env_loader import load_backend_env
+
+    load_backend_env()
+
+    parser = argparse.ArgumentParser(description="Semantic search embeddings maintenance")
+    parser.add_argument("command", choices=["backfill"], help="backfill: embed indexed items that have no vector yet")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    async def _backfill() -> int:
+        from db.database import init_db
+        from utils.search_index import ensure_search_index
+
+        await init_db()
+        await ensure_search_index()
+        return await vector_index.backfill(batch_size=args.batch_size, restart=args.restart)
+
+    print(f"Embedded {asyncio.run(_backfill())} entries")
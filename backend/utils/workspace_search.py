@@ -1,31 +1,41 @@
-"""Keyword search across real user data (chats, documents, tasks)."""
+"""Search across real user data (chats, documents, tasks)."""
 from __future__ import annotations
 
+import asyncio
+import base64
+import heapq
+import json
 import re
 from datetime import datetime
-from typing import Any
+from typing import Any, AsyncIterator
 
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import Conversation, Message, Task
+from db.database import async_session_maker
+from utils.search_index import (
+    KIND_CONVERSATION,
+    KIND_DOCUMENT,
+    KIND_MESSAGE,
+    KIND_TASK,
+    entries_for_refs,
+    hydrate_hits,
+    query_terms,
+    ranked_hits,
+)
+from utils.vector_index import vector_index
 
+# (index kind, result type used by the ``types`` filter)
+_SOURCES = [
+    (KIND_CONVERSATION, "chat"),
+    (KIND_MESSAGE, "chat"),
+    (KIND_DOCUMENT, "document"),
+    (KIND_TASK, "task"),
+]
 
-def _score(query: str, *texts: str) -> float:
-    q = query.lower().strip()
-    if not q:
-        return 0.0
-    score = 0.0
-    for text in texts:
-        if not text:
-            continue
-        t = text.lower()
-        if q in t:
-            score += 0.5 + (len(q) / max(len(t), 1))
-        for word in q.split():
-            if len(word) > 2 and word in t:
-                score += 0.15
-    return min(score, 1.0)
+# Hybrid search fuses the top HYBRID_DEPTH lexical and semantic hits with
+# reciprocal rank fusion; pages are offsets into that fixed-depth fused list.
+HYBRID_DEPTH = 100
+RRF_K = 60
 
 
 def _snippet(text: str, query: str, max_len: int = 160) -> str:
@@ -40,6 +50,176 @@ def _snippet(text: str, query: str, max_len: int = 160) -> str:
     return ("..." if start > 0 else "") + chunk + ("..." if start + max_len < len(t) else "")
 
 
+def _highlights(query: str, text: str) -> list[str]:
+    lowered = (text or "").lower()
+    return [w for w in query.split() if w.lower() in lowered][:3]
+
+
+def _format_hit(hit: dict[str, Any], display: dict[str, Any], q: str) -> dict[str, Any]:
+    timestamp = display["ts"] or datetime.utcnow().isoformat()
+    score = round(min(hit["score"], 1.0), 2)
+    snippet = display["snippet"] or ""
+    if hit["kind"] == KIND_CONVERSATION:
+        title = display["title"] or "Chat"
+        return {
+            "id": hit["ref_id"],
+            "type": "chat",
+            "title": title,
+            "content": _snippet(title, q),
+            "relevance_score": score,
+            "highlights": _highlights(q, title),
+            "metadata": {"conversation_id": hit["ref_id"]},
+            "timestamp": timestamp,
+        }
+    if hit["kind"] == KIND_MESSAGE:
+        return {
+            "id": hit["ref_id"],
+            "type": "chat",
+            "title": display["conversation_title"] or "Chat message",
+            "content": _snippet(snippet, q),
+            "relevance_score": score,
+            "highlights": _highlights(q, snippet),
+            "metadata": {"conversation_id": hit["parent_id"]},
+            "timestamp": timestamp,
+        }
+    if hit["kind"] == KIND_DOCUMENT:
+        name = display["title"] or "Document"
+        page = int(hit["ref_id"].rsplit(":", 1)[1]) or None
+        return {
+            "id": hit["parent_id"],
+            "type": "document",
+            "title": name,
+            "content": _snippet(snippet, q) if snippet else "Uploaded document",
+            "relevance_score": score,
+            "highlights": _highlights(q, snippet or name),
+            "metadata": {"document_id": hit["parent_id"], "filename": name, "page": page},
+            "timestamp": timestamp,
+        }
+    title = display["title"] or "Task"
+    return {
+        "id": hit["ref_id"],
+        "type": "task",
+        "title": title,
+        "content": _snippet(snippet or title, q),
+        "relevance_score": score,
+        "highlights": _highlights(q, title),
+        "metadata": {
+            "completed": bool(display["completed"]),
+            "priority": display["priority"],
+        },
+        "timestamp": timestamp,
+    }
+
+
+def _encode(payload: list[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def encode_cursor(hit: dict[str, Any]) -> str:
+    return _encode([hit["rank"], hit["kind"], hit["ref_id"]])
+
+
+def encode_hybrid_cursor(offset: int) -> str:
+    return _encode(["hybrid", offset])
+
+
+def decode_cursor(cursor: str) -> tuple[float, str, str] | int:
+    """Keyset position for lexical pages or an offset for hybrid pages. Raises ValueError for a malformed cursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if payload[0] == "hybrid":
+            return max(int(payload[1]), 0)
+        rank, kind, ref_id = payload
+        return float(rank), str(kind), str(ref_id)
+    except Exception as e:
+        raise ValueError("Invalid search cursor") from e
+
+
+async def _source_stream(
+    user_id: str,
+    terms: list[str],
+    kind: str,
+    after: tuple[float, str, str] | None,
+    page_size: int,
+) -> AsyncIterator[dict[str, Any]]:
+    """Lazily page through one source's hits, best first, on a dedicated session."""
+    async with async_session_maker() as session:
+        while True:
+            rows = await ranked_hits(session, user_id, terms, kind, after=after, limit=page_size)
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            last = rows[-1]
+            after = (last["rank"], last["kind"], last["ref_id"])
+
+
+async def _lexical_hits(
+    user_id: str,
+    terms: list[str],
+    kinds: list[str],
+    after: tuple[float, str, str] | None,
+    count: int,
+) -> list[dict[str, Any]]:
+    """The best ``count`` lexical hits across sources, merged from per-source ranked streams."""
+    streams = [_source_stream(user_id, terms, kind, after, count) for kind in kinds]
+    hits: list[dict[str, Any]] = []
+    try:
+        heads = await asyncio.gather(*(anext(stream, None) for stream in streams))
+        heap = [
+            (-head["rank"], head["kind"], head["ref_id"], i, head)
+            for i, head in enumerate(heads)
+            if head is not None
+        ]
+        heapq.heapify(heap)
+
+        while heap:
+            *_, i, hit = heapq.heappop(heap)
+            hits.append(hit)
+            if len(hits) >= count:
+                break
+            following = await anext(streams[i], None)
+            if following is not None:
+                heapq.heappush(
+                    heap,
+                    (-following["rank"], following["kind"], following["ref_id"], i, following),
+                )
+    finally:
+        for stream in streams:
+            await stream.aclose()
+    return hits
+
+
+async def _hybrid_hits(
+    db: AsyncSession,
+    user_id: str,
+    query: str,
+    terms: list[str],
+    kinds: list[str],
+) -> list[dict[str, Any]]:
+    """Lexical and semantic hits fused with reciprocal rank fusion, best first."""
+    lexical, semantic = await asyncio.gather(
+        _lexical_hits(user_id, terms, kinds, None, HYBRID_DEPTH),
+        vector_index.search(user_id, query, kinds, HYBRID_DEPTH),
+    )
+    fused: dict[tuple[str, str], dict[str, Any]] = {}
+    for position, hit in enumerate(lexical):
+        fused[(hit["kind"], hit["ref_id"])] = {**hit, "fused": 1.0 / (RRF_K + position + 1)}
+
+    unseen = [(hit["kind"], hit["ref_id"]) for hit in semantic if (hit["kind"], hit["ref_id"]) not in fused]
+    rows = await entries_for_refs(db, user_id, unseen)
+    for position, hit in enumerate(semantic):
+        key = (hit["kind"], hit["ref_id"])
+        boost = 1.0 / (RRF_K + position + 1)
+        if key in fused:
+            fused[key]["fused"] += boost
+            fused[key]["score"] = max(fused[key]["score"], hit["similarity"])
+        elif key in rows:
+            fused[key] = {**rows[key], "rank": 0.0, "score": hit["similarity"], "fused": boost}
+
+    return sorted(fused.values(), key=lambda h: (-h["fused"], h["kind"], h["ref_id"]))
+
+
 async def search_workspace(
     db: AsyncSession,
     user_id: str,
@@ -47,110 +227,40 @@ async def search_workspace(
     *,
     type_filter: list[str] | None = None,
     limit: int = 20,
-) -> list[dict[str, Any]]:
+    cursor: str | None = None,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Return (results, next_cursor) for one page of ranked workspace hits.
+
+    Lexically, each source (conversation titles, messages, document pages, tasks)
+    is queried concurrently on its own session as a lazy ranked stream; the streams
+    are merged with a heap bounded by the number of sources and stop after
+    ``limit`` hits. When an embeddings provider is configured, those hits are fused
+    with vector-similarity hits so paraphrased queries still find past chats.
+    Display fields are only loaded for the hits that are returned.
+    """
     uid = str(user_id)
     q = query.strip()
-    results: list[dict[str, Any]] = []
+    terms = query_terms(q)
     allowed = set(type_filter) if type_filter else None
+    position = decode_cursor(cursor) if cursor else None
+    if not terms or limit <= 0:
+        return [], None
 
-    # Conversations / chat messages
-    if allowed is None or "chat" in allowed:
-        conv_result = await db.execute(
-            select(Conversation).where(Conversation.user_id == uid).order_by(Conversation.updated_at.desc())
-        )
-        for conv in conv_result.scalars().all():
-            title = conv.title or "Chat"
-            s = _score(q, title)
-            if s > 0.1:
-                results.append(
-                    {
-                        "id": conv.id,
-                        "type": "chat",
-                        "title": title,
-                        "content": _snippet(title, q),
-                        "relevance_score": round(s, 2),
-                        "highlights": [w for w in q.split() if w.lower() in title.lower()],
-                        "metadata": {"conversation_id": conv.id},
-                        "timestamp": (conv.updated_at or conv.created_at or datetime.utcnow()).isoformat(),
-                    }
-                )
-
-        msg_result = await db.execute(
-            select(Message, Conversation)
-            .join(Conversation, Message.conversation_id == Conversation.id)
-            .where(Conversation.user_id == uid)
-            .order_by(Message.created_at.desc())
-            .limit(200)
-        )
-        for msg, conv in msg_result.all():
-            s = _score(q, msg.content, conv.title or "")
-            if s > 0.15:
-                results.append(
-                    {
-                        "id": msg.id,
-                        "type": "chat",
-                        "title": conv.title or "Chat message",
-                        "content": _snippet(msg.content, q),
-                        "relevance_score": round(s, 2),
-                        "highlights": [w for w in q.split() if w.lower() in msg.content.lower()][:3],
-                        "metadata": {
-                            "conversation_id": conv.id,
-                            "role": msg.role,
-                        },
-                        "timestamp": (msg.created_at or datetime.utcnow()).isoformat(),
-                    }
-                )
-
-    # Documents
-    if allowed is None or "document" in allowed:
-        from utils.document_store import list_documents
-
-        for doc in list_documents(user_id=uid):
-            name = doc.get("filename") or doc.get("name") or "Document"
-            s = _score(q, name)
-            if s > 0.1:
-                results.append(
-                    {
-                        "id": doc["id"],
-                        "type": "document",
-                        "title": name,
-                        "content": f"Uploaded document ({doc.get('size', 0)} bytes)",
-                        "relevance_score": round(s, 2),
-                        "highlights": [w for w in q.split() if w.lower() in name.lower()],
-                        "metadata": {"filename": name, "status": doc.get("status")},
-                        "timestamp": doc.get("created_at") or datetime.utcnow().isoformat(),
-                    }
-                )
-
-    # Tasks
-    if allowed is None or "task" in allowed:
-        task_result = await db.execute(select(Task).where(Task.user_id == uid))
-        for task in task_result.scalars().all():
-            s = _score(q, task.title, task.description or "")
-            if s > 0.1:
-                results.append(
-                    {
-                        "id": task.id,
-                        "type": "task",
-                        "title": task.title,
-                        "content": _snippet(task.description or task.title, q),
-                        "relevance_score": round(s, 2),
-                        "highlights": [w for w in q.split() if w.lower() in task.title.lower()],
-                        "metadata": {
-                            "completed": task.completed,
-                            "priority": task.priority,
-                        },
-                        "timestamp": (task.updated_at or task.created_at or datetime.utcnow()).isoformat(),
-                    }
-                )
+    kinds = [
+        kind
+        for kind, result_type in _SOURCES
+        if allowed is None or result_type in allowed
+    ]
+    if isinstance(position, int) or (position is None and vector_index.enabled):
+        offset = position or 0
+        ranked = await _hybrid_hits(db, uid, q, terms, kinds)
+        hits = ranked[offset : offset + limit]
+        next_cursor = encode_hybrid_cursor(offset + limit) if len(ranked) > offset + limit else None
+    else:
+        hits = await _lexical_hits(uid, terms, kinds, position, limit + 1)
+        next_cursor = encode_cursor(hits[limit - 1]) if len(hits) > limit else None
+        hits = hits[:limit]
 
-    results.sort(key=lambda r: r["relevance_score"], reverse=True)
-    seen: set[str] = set()
-    unique: list[dict[str, Any]] = []
-    for r in results:
-        key = f"{r['type']}:{r['id']}"
-        if key in seen:
-            continue
-        seen.add(key)
-        unique.append(r)
-    return unique[:limit]
+    display = await hydrate_hits(db, terms, [hit["id"] for hit in hits])
+    results = [_format_hit(hit, display[hit["id"]], q) for hit in hits if hit["id"] in display]
+    return results, next_cursor
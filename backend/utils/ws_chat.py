@@ -0,0 +1,191 @@
+"""Framed chat protocol for ``/ws/chat``.
+
+Every frame is a JSON text message. The client sends
+
+    {"type": "chat", "id": "r1", "message": "...", "conversation_id": null,
+     "document_ids": null, "model": null}
+    {"type": "cancel", "id": "r1"}      (stop generating; the answer so far is kept)
+    {"type": "ping"}
+
+and gets, per request id (several requests may stream at once on one socket),
+
+    {"type": "start", "id": "r1", "conversation_id": "...", "agent_used": "general"}
+    {"type": "token", "id": "r1", "content": "..."}      (coalesced like SSE)
+    {"type": "done", "id": "r1"}                        ("truncated": true after a cancel)
+    {"type": "error", "id": "r1", "error": "..."}
+
+plus ``{"type": "pong"}``. Binary frames get an error frame. Turns never wait on the network: their frames go to a
+bounded per-socket queue drained by one sender task. A client that lets the
+queue fill up, or does not take a frame within ``send_timeout``, is
+disconnected (close code 1013) instead of holding model streams and memory. When
+the socket closes, running turns are cancelled along with their model streams.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable
+
+import orjson
+from starlette.websockets import WebSocket
+
+from utils.logger import logger
+from utils.sse import SSEWriter
+
+SEND_QUEUE_FRAMES = int(os.getenv("WS_SEND_QUEUE_FRAMES", "256"))
+SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+MAX_CONCURRENT_TURNS = int(os.getenv("WS_MAX_CONCURRENT_TURNS", "4"))
+
+CLOSE_TRY_AGAIN_LATER = 1013
+
+TurnHandler = Callable[[str, dict[str, Any]], AsyncIterator[str]]
+
+
+def ws_frame(frame_type: str, request_id: str | None = None, **fields: Any) -> str:
+    payload = {"type": frame_type, **({"id": request_id} if request_id is not None else {}), **fields}
+    return orjson.dumps(payload).decode()
+
+
+class WSChatWriter(SSEWriter):
+    """``SSEWriter`` coalescing, framed as ``start``/``token`` messages of one request."""
+
+    def __init__(self, request_id: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.request_id = request_id
+
+    def start_frame(self, payload: dict[str, Any]) -> str:
+        return ws_frame("start", self.request_id, **payload)
+
+    def _content_frame(self, buffer: list[str]) -> str:
+        self.frames += 1
+        return ws_frame("token", self.request_id, content="".join(buffer))
+
+
+class ChatSocket:
+    """One accepted ``/ws/chat`` connection: request dispatch, turn tasks and the send queue."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        handle_turn: TurnHandler,
+        *,
+        max_queue: int = SEND_QUEUE_FRAMES,
+        send_timeout: float = SEND_TIMEOUT_SECONDS,
+        max_turns: int = MAX_CONCURRENT_TURNS,
+    ):
+        self.websocket = websocket
+        self.handle_turn = handle_turn
+        self.send_timeout = send_timeout
+        self.max_turns = max_turns
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue)
+        self._turns: dict[str, asyncio.Task] = {}
+        self._dropped = asyncio.Event()
+        self.drop_reason: str | None = None
+
+    def send(self, frame: str) -> bool:
+        """Queue a frame; False (and the client is dropped) if it is not keeping up."""
+        if self._dropped.is_set():
+            return False
+        try:
+            self._queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._drop(f"send queue full ({self._queue.maxsize} frames)")
+            return False
+        return True
+
+    def _drop(self, reason: str) -> None:
+        if not self._dropped.is_set():
+            self.drop_reason = reason
+            self._dropped.set()
+
+    async def run(self) -> None:
+        receiver = asyncio.create_task(self._receive_loop())
+        sender = asyncio.create_task(self._send_loop())
+        dropped = asyncio.create_task(self._dropped.wait())
+        try:
+            done, _ = await asyncio.wait({receiver, sender, dropped}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error(f"/ws/chat connection failed: {task.exception()!r}")
+        finally:
+            tasks = {receiver, sender, dropped, *self._turns.values()}
+            for task in tasks:
+                task.cancel()
+            # asyncio.wait, not gather: if we are cancelled meanwhile, the error raised is our own.
+            await asyncio.wait(tasks)
+        if self.drop_reason is not None:
+            logger.warning(f"Dropping slow /ws/chat client: {self.drop_reason}")
+            try:
+                await self.websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            except Exception:
+                pass
+
+    async def _send_loop(self) -> None:
+        while True:
+            frame = await self._queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(frame), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._drop(f"send blocked for {self.send_timeout:g}s")
+                return
+
+    async def _receive_loop(self) -> None:
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            raw = message.get("text")
+            if raw is None:
+                self.send(ws_frame("error", error="Binary frames are not supported; send JSON text frames"))
+                continue
+            try:
+                frame = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                self.send(ws_frame("error", error="Frames must be JSON"))
+                continue
+            if not isinstance(frame, dict):
+                self.send(ws_frame("error", error="Frames must be JSON objects"))
+                continue
+
+            frame_type = frame.get("type", "chat")
+            if frame_type == "ping":
+                self.send(ws_frame("pong"))
+            elif frame_type == "chat":
+                self._start_turn(frame)
+            elif frame_type == "cancel":
+                self._cancel_turn(str(frame.get("id")))
+            else:
+                self.send(ws_frame("error", frame.get("id"), error=f"Unknown frame type: {frame_type}"))
+
+    def _start_turn(self, frame: dict[str, Any]) -> None:
+        request_id = str(frame.get("id") or uuid.uuid4())
+        if request_id in self._turns:
+            self.send(ws_frame("error", request_id, error="A request with this id is already running"))
+        elif len(self._turns) >= self.max_turns:
+            self.send(ws_frame("error", request_id, error=f"At most {self.max_turns} concurrent requests per connection"))
+        else:
+            self._turns[request_id] = asyncio.create_task(self._run_turn(request_id, frame))
+
+    def _cancel_turn(self, request_id: str) -> None:
+        """Stop a running request; the answer so far is kept (saved as truncated)."""
+        turn = self._turns.get(request_id)
+        if turn is None:
+            self.send(ws_frame("error", request_id, error="No running request with this id"))
+            return
+        turn.cancel()
+        self.send(ws_frame("done", request_id, truncated=True))
+
+    async def _run_turn(self, request_id: str, frame: dict[str, Any]) -> None:
+        try:
+            async with aclosing(self.handle_turn(request_id, frame)) as frames:
+                async for out in frames:
+                    if not self.send(out):
+                        return
+            self.send(ws_frame("done", request_id))
+        except Exception as e:
+            logger.error(f"/ws/chat request {request_id} failed: {e}")
+            self.send(ws_frame("error", request_id, error=getattr(e, "detail", None) or str(e)))
+        finally:
+            self._turns.pop(request_id, None)